@@ -0,0 +1,129 @@
+from array import array
+from bisect import bisect_left
+from itertools import chain, compress, repeat
+from operator import add, eq, mod, ne
+
+
+# An undirected graph stored compactly as two flat arrays (compressed sparse rows)
+# The neighbors of vertex v are targets[offsets[v]:offsets[v + 1]], sorted and without repeats,
+#   so a graph with millions of edges takes a few bytes per edge instead of a Python list per vertex
+class AdjacencyArrays:
+    def __init__(self, offsets, targets, names=None):
+        self.offsets = offsets
+        self.targets = targets
+        # The name of each vertex, or None when vertices are just numbered (like DIMACS files, from 1)
+        self.names = names
+        self.target_view = memoryview(targets)
+
+    # A memoryview cannot be pickled (like when a problem is sent to a spawned worker process), so it is left
+    #   out and made again from the arrays
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["target_view"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.target_view = memoryview(self.targets)
+
+    # Builds the arrays from two parallel sequences of vertex numbers, one (u, v) edge per position
+    # Edges can be given in either direction or both; repeats and self loops are dropped
+    # Each edge is packed into one integer per direction, u * num_vertices + v, so a single sort puts every
+    #   vertex's neighbors together and in order. The repeats are then next to each other, each target is
+    #   the key modulo num_vertices, and each vertex's slice starts where its first key would go
+    @classmethod
+    def from_edge_arrays(cls, num_vertices, sources, targets, names=None):
+        scale = num_vertices
+        # Self loops are rare, so the edges are only copied without them if there are any
+        if any(map(eq, sources, targets)):
+            different = list(map(ne, sources, targets))
+            sources = array("q", compress(sources, different))
+            targets = array("q", compress(targets, different))
+
+        keys = list(map(add, map(scale.__mul__, sources), targets))
+        keys.extend(map(add, map(scale.__mul__, targets), sources))
+        keys.sort()
+        # A key is kept if it differs from the one before it
+        keys = list(compress(keys, chain((True,), map(ne, keys[1:], keys))))
+
+        all_targets = array("q", map(mod, keys, repeat(scale)))
+        offsets = array("q", [bisect_left(keys, vertex * scale) for vertex in range(num_vertices)])
+        offsets.append(len(keys))
+        return cls(offsets, all_targets, names)
+
+    # Builds the arrays from (u, v) pairs of vertex numbers, in either direction
+    @classmethod
+    def from_edges(cls, num_vertices, edges, names=None):
+        sources, targets = array("q"), array("q")
+        for u, v in edges:
+            sources.append(u)
+            targets.append(v)
+        return cls.from_edge_arrays(num_vertices, sources, targets, names)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Returns the number of undirected edges
+    def num_edges(self):
+        return len(self.targets) // 2
+
+    # Returns the neighbors of the vertex as a read-only view into the arrays (nothing is copied)
+    def neighbors(self, vertex):
+        return self.target_view[self.offsets[vertex]:self.offsets[vertex + 1]]
+
+    def degree(self, vertex):
+        return self.offsets[vertex + 1] - self.offsets[vertex]
+
+    # Returns True if the two vertices share an edge, by binary search of the sorted neighbors
+    def has_edge(self, u, v):
+        start, end = self.offsets[u], self.offsets[u + 1]
+        i = bisect_left(self.targets, v, start, end)
+        return i < end and self.targets[i] == v
+
+    def name_of(self, vertex):
+        return str(vertex + 1) if self.names is None else self.names[vertex]
+
+    # Returns a sequence of every vertex's neighbors, like a list of neighbor lists but built on demand
+    def neighbor_lists(self):
+        return NeighborLists(self)
+
+
+# A list-like view of the neighbors of every vertex of an AdjacencyArrays
+# A vertex's neighbors can be replaced (and vertices added or dropped at the end), for problems that change
+#   after they are built. Those are kept on the side, and the arrays themselves are never changed
+class NeighborLists:
+    def __init__(self, graph):
+        self.graph = graph
+        self.num_vertices = len(graph)
+        # Vertex --> its replaced neighbors
+        self.edited = dict()
+
+    def __len__(self):
+        return self.num_vertices
+
+    def __getitem__(self, vertex):
+        if not 0 <= vertex < self.num_vertices:
+            raise IndexError("vertex out of range")
+        edited = self.edited.get(vertex)
+        if edited is not None:
+            return edited
+        return self.graph.neighbors(vertex)
+
+    def __setitem__(self, vertex, neighbors):
+        if not 0 <= vertex < self.num_vertices:
+            raise IndexError("vertex out of range")
+        self.edited[vertex] = neighbors
+
+    def __iter__(self):
+        return (self[vertex] for vertex in range(self.num_vertices))
+
+    def append(self, neighbors):
+        self.edited[self.num_vertices] = neighbors
+        self.num_vertices += 1
+
+    def pop(self):
+        self.num_vertices -= 1
+        edited = self.edited.pop(self.num_vertices, None)
+        if edited is not None:
+            return edited
+        return self.graph.neighbors(self.num_vertices)
@@ -0,0 +1,211 @@
+from collections import deque
+from csp_helper_functions import mask_indices
+
+
+# A global constraint that a group of variables all take different values
+# If a key function is given, it is key(value) that has to differ (like the row or diagonal of a queen)
+# Propagation follows Regin's algorithm: find a maximum matching of variables to keys, then remove every
+#   value whose key cannot be in any maximum matching. This catches pigeonhole failures that pairwise
+#   "not equal" arc consistency never sees, like three neighboring regions and only two colors
+class AllDifferentConstraint:
+    def __init__(self, variables, key=None):
+        self.variables = list(variables)
+        self.key = key
+        # The matching found last time, used as a warm start since it usually only needs small repairs
+        self.last_matching = dict()
+
+    # Returns True if no two assigned variables in the constraint share a key
+    def is_satisfied(self, assignment):
+        seen = set()
+        for variable in self.variables:
+            if assignment[variable] is None:
+                continue
+            value_key = self.value_key(assignment[variable])
+            if value_key in seen:
+                return False
+            seen.add(value_key)
+        return True
+
+    # Returns the same constraint over the variables numbered as in number (old variable --> new variable),
+    #   keeping only the ones that are there. Leaving variables out only relaxes the constraint, so a
+    #   subproblem that does not hold all of them still loses no solutions
+    def renumbered(self, number):
+        return AllDifferentConstraint([number[variable] for variable in self.variables if variable in number],
+                                      self.key)
+
+    def value_key(self, value):
+        return value if self.key is None else self.key(value)
+
+    # Prunes the bitmask domains (through their trail) so every remaining value can be part of a solution
+    #   of this constraint. Assigned variables count as having only their assigned value
+    # Returns False if the constraint cannot be satisfied at all
+    def propagate(self, assignment, domains):
+        compiled = domains.compiled
+
+        # For each variable, its remaining keys and the mask of the values with that key
+        edges = []
+        for variable in self.variables:
+            if assignment[variable] is not None:
+                mask = 1 << compiled.value_index[variable][assignment[variable]]
+            else:
+                mask = domains.masks[variable]
+
+            keys = dict()
+            values = compiled.values[variable]
+            for i in mask_indices(mask):
+                value_key = self.value_key(values[i])
+                keys[value_key] = keys.get(value_key, 0) | (1 << i)
+            edges.append(keys)
+
+        matching = self.maximum_matching(edges)
+        if matching is None:
+            return False
+
+        # Every edge that is not in some maximum matching can be removed
+        for position, variable_key in self.removable_edges(edges, matching):
+            domains.remove_mask(self.variables[position], edges[position][variable_key])
+
+        return True
+
+    # Finds a key for every variable so that no two variables share one, using augmenting paths
+    # Returns a list of the matched key of each variable, or None if there is no such matching
+    def maximum_matching(self, edges):
+        matched_key = [None for i in range(len(edges))]
+        matched_position = dict()
+
+        # Start from the previous matching wherever it is still possible
+        for position, keys in enumerate(edges):
+            previous_key = self.last_matching.get(self.variables[position])
+            if previous_key in keys and previous_key not in matched_position:
+                matched_key[position] = previous_key
+                matched_position[previous_key] = position
+
+        for position in range(len(edges)):
+            if matched_key[position] is None and not self.augment(position, edges, matched_key, matched_position):
+                return None
+
+        self.last_matching = {self.variables[position]: matched_key[position] for position in range(len(edges))}
+        return matched_key
+
+    # Breadth-first search for an alternating path from the unmatched variable to a free key, and flips it
+    # Returns True if the variable could be matched
+    @staticmethod
+    def augment(start, edges, matched_key, matched_position):
+        # The (previous position, key) step that reached each position
+        reached_from = {start: None}
+        queue = deque([start])
+        while len(queue) > 0:
+            position = queue.popleft()
+            for variable_key in edges[position]:
+                owner = matched_position.get(variable_key)
+                if owner is None:
+                    # Flip the path back to the start
+                    while position is not None:
+                        previous_key = matched_key[position]
+                        matched_key[position] = variable_key
+                        matched_position[variable_key] = position
+                        variable_key = previous_key
+                        position = reached_from[position][0] if reached_from[position] else None
+                    return True
+                if owner not in reached_from:
+                    reached_from[owner] = (position, variable_key)
+                    queue.append(owner)
+        return False
+
+    # Returns the (position, key) edges that are in no maximum matching
+    # With matched edges pointing variable --> key and the other edges key --> variable, an unmatched edge
+    #   can be kept if its key can be reached from a free key, or if both ends are in the same strongly
+    #   connected component (an even alternating cycle)
+    @staticmethod
+    def removable_edges(edges, matching):
+        # Number the nodes: variables are 0..n-1, keys come after them
+        key_node = dict()
+        for keys in edges:
+            for variable_key in keys:
+                if variable_key not in key_node:
+                    key_node[variable_key] = len(edges) + len(key_node)
+
+        successors = [[] for i in range(len(edges) + len(key_node))]
+        for position, keys in enumerate(edges):
+            successors[position].append(key_node[matching[position]])
+            for variable_key in keys:
+                if variable_key != matching[position]:
+                    successors[key_node[variable_key]].append(position)
+
+        # Everything reachable from a key no variable is matched to
+        matched_keys = set(matching)
+        reachable = set(node for variable_key, node in key_node.items() if variable_key not in matched_keys)
+        queue = deque(reachable)
+        while len(queue) > 0:
+            node = queue.popleft()
+            for successor in successors[node]:
+                if successor not in reachable:
+                    reachable.add(successor)
+                    queue.append(successor)
+
+        component = strongly_connected_components(successors)
+
+        removable = []
+        for position, keys in enumerate(edges):
+            for variable_key in keys:
+                node = key_node[variable_key]
+                if variable_key == matching[position] or node in reachable or component[node] == component[position]:
+                    continue
+                removable.append((position, variable_key))
+        return removable
+
+
+# Tarjan's algorithm without recursion, so large constraints do not hit the recursion limit
+# Returns the component number of every node of the graph given as lists of successors
+def strongly_connected_components(successors):
+    num_nodes = len(successors)
+    index = [None for i in range(num_nodes)]
+    lowlink = [0 for i in range(num_nodes)]
+    on_stack = [False for i in range(num_nodes)]
+    component = [None for i in range(num_nodes)]
+    stack = []
+    next_index = 0
+    num_components = 0
+
+    for root in range(num_nodes):
+        if index[root] is not None:
+            continue
+
+        # Each frame is [node, position of the next successor to look at]
+        frames = [[root, 0]]
+        index[root] = lowlink[root] = next_index
+        next_index += 1
+        stack.append(root)
+        on_stack[root] = True
+
+        while frames:
+            frame = frames[-1]
+            node = frame[0]
+            if frame[1] < len(successors[node]):
+                successor = successors[node][frame[1]]
+                frame[1] += 1
+                if index[successor] is None:
+                    index[successor] = lowlink[successor] = next_index
+                    next_index += 1
+                    stack.append(successor)
+                    on_stack[successor] = True
+                    frames.append([successor, 0])
+                elif on_stack[successor]:
+                    lowlink[node] = min(lowlink[node], index[successor])
+                continue
+
+            # Every successor is done, so close the node
+            frames.pop()
+            if frames:
+                parent = frames[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+
+    return component
@@ -0,0 +1,108 @@
+# The domains of every variable stored as integer bitmasks over the compiled value indices
+# It behaves like the old list of lists: domains[variable] gives a view with len(), iteration,
+#   membership, remove() and append(), so the existing heuristics and helper functions still work
+# Every removal is recorded on a chronological trail of (variable, removed mask) records, so the
+#   solvers undo a search step by popping the trail back to a saved level instead of copying domains
+class BitsetDomains:
+    def __init__(self, compiled, masks):
+        self.compiled = compiled
+        self.masks = masks
+        self.trail = []
+        # Only kept once track_removals() is called: last_removal[variable] is the trail index of the
+        #   variable's latest removal (-1 if it has none), and previous_removal holds, for every trail
+        #   record, the index it replaced, so undo() can put it back
+        self.last_removal = None
+        self.previous_removal = None
+
+    def __len__(self):
+        return len(self.masks)
+
+    def __getitem__(self, variable):
+        return DomainView(self, variable)
+
+    def __iter__(self):
+        return (DomainView(self, variable) for variable in range(len(self.masks)))
+
+    # Returns the values left in the variable's domain, in their original order
+    def values(self, variable):
+        return self.compiled.mask_to_values(variable, self.masks[variable])
+
+    # Removes every value in the mask from the variable's domain, recording what was removed on the trail
+    def remove_mask(self, variable, mask):
+        removed_mask = self.masks[variable] & mask
+        if removed_mask:
+            self.masks[variable] ^= removed_mask
+            if self.last_removal is not None:
+                self.previous_removal.append(self.last_removal[variable])
+                self.last_removal[variable] = len(self.trail)
+            self.trail.append((variable, removed_mask))
+
+    # Starts keeping the trail index of each variable's latest removal, so finding it does not mean
+    #   scanning the trail (used by conflict-directed backjumping)
+    def track_removals(self):
+        self.last_removal = [-1 for i in range(len(self.masks))]
+        self.previous_removal = []
+        for i, (variable, removed_mask) in enumerate(self.trail):
+            self.previous_removal.append(self.last_removal[variable])
+            self.last_removal[variable] = i
+
+    # Adds every value in the mask back into the variable's domain (not recorded on the trail)
+    def add_mask(self, variable, mask):
+        self.masks[variable] |= mask
+
+    # Returns the current trail level, which can be given to undo() later
+    def trail_level(self):
+        return len(self.trail)
+
+    # Restores every value removed since the given trail level
+    # Costs time proportional to the number of removals being undone, not the size of the domains
+    def undo(self, level):
+        trail = self.trail
+        masks = self.masks
+        last_removal = self.last_removal
+        while len(trail) > level:
+            variable, removed_mask = trail.pop()
+            masks[variable] |= removed_mask
+            if last_removal is not None:
+                last_removal[variable] = self.previous_removal.pop()
+
+    def __repr__(self):
+        return repr([self.values(variable) for variable in range(len(self.masks))])
+
+
+# A list-like view of a single variable's bitmask domain
+class DomainView:
+    def __init__(self, domains, variable):
+        self.domains = domains
+        self.variable = variable
+
+    def __len__(self):
+        return self.domains.masks[self.variable].bit_count()
+
+    # Iterates over a snapshot, so pruning the domain during the loop is safe
+    def __iter__(self):
+        return iter(self.domains.values(self.variable))
+
+    def __getitem__(self, i):
+        return self.domains.values(self.variable)[i]
+
+    def __contains__(self, value):
+        i = self.domains.compiled.value_index[self.variable].get(value)
+        return i is not None and (self.domains.masks[self.variable] >> i) & 1 == 1
+
+    # Removing is a single bit clear instead of a list.remove() scan, and is recorded on the trail
+    def remove(self, value):
+        if value not in self:
+            raise ValueError(f"{value} is not in the domain of variable {self.variable}")
+        self.domains.remove_mask(self.variable, 1 << self.domains.compiled.value_index[self.variable][value])
+
+    # Adding a value back sets its bit, which also keeps the domain in its original order
+    # Values removed during search should be restored with undo() rather than appended
+    def append(self, value):
+        self.domains.masks[self.variable] |= 1 << self.domains.compiled.value_index[self.variable][value]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(self.domains.values(self.variable))
@@ -1,4 +1,6 @@
 from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
+from ConstraintRelation import ConstraintRelation
+from csp_helper_functions import mask_indices
 
 # Author: Ben Williams '25
 # Date: October 9th, 2023
@@ -7,10 +9,18 @@ from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
 # An implementation of the Circuit Board Problem, where we try to place k components
 #   with arbitrary widths and heights on a circuit board so that they can all fit
 class CircuitBoardProblem(ConstraintSatisfactionProblem):
+    # Least-constraining-value counts the placements each placement overlaps on the empty board, which puts
+    #   it along the edges and in the corners first and packs the board. Counted among the placements still
+    #   left to the other components, after MAC2001 has pruned them, it loses that order: together with the
+    #   tie break in minimum_remaining_values, this takes MAC2001 on the big board from hundreds of thousands
+    #   of nodes down to 60
+    lcv_full_domains = True
+
     def __init__(self, board_width, board_height, components):
         self.board_width = board_width
         self.board_height = board_height
-        self.components = components
+        # Copied, since components can be added and removed later
+        self.components = list(components)
 
         # One dimensional array where each index represents a component
         self.variables = []
@@ -22,16 +32,54 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
         # Get all component domains
         self.domains = [self.get_component_domain(component) for component in components]
 
+        # For each component, the bitmask of board cells it covers at each location
+        # Cell (row, col) is bit row * board_width + col, so two placements overlap iff their masks share a bit
+        self.placements = [self.get_component_placements(var) for var in range(len(self.variables))]
+
         # Get all variable pair constraints
+        # Each pair of components gets one relation, and the reverse arc is its transpose over the same
+        #   placements, so nothing about a pair is built or stored twice
         self.constraints = dict()
         for var_1 in range(len(self.variables)):
-            for var_2 in range(len(self.variables)):
-                if var_1 != var_2:
-                    self.constraints[(var_1, var_2)] = self.get_component_pair_constraints(var_1, var_2)
+            for var_2 in range(var_1 + 1, len(self.variables)):
+                relation = self.get_component_pair_constraints(var_1, var_2)
+                self.constraints[(var_1, var_2)] = relation
+                self.constraints[(var_2, var_1)] = relation.transposed()
 
         # Initialize the parent class with already defined variables, domains, and constraints
         super().__init__(self.variables, self.domains, self.constraints)
 
+    # Adds a (width, height) component to the board and returns its variable
+    # Only the relations between the new component and the others are built
+    def add_component(self, component):
+        variable = self.add_variable(self.get_component_domain(component))
+        self.components.append(component)
+        self.variable_component_map[variable] = component
+        self.placements.append(self.get_component_placements(variable))
+
+        for other in range(variable):
+            relation = self.get_component_pair_constraints(variable, other)
+            self.add_constraint(variable, other, relation, relation.transposed())
+        return variable
+
+    # Takes the component off the board. The last component takes its variable (see remove_variable), and
+    #   the old variable of that component is returned, or None if the removed one was the last
+    def remove_component(self, variable):
+        moved = self.remove_variable(variable)
+        if moved is not None:
+            self.components[variable] = self.components[moved]
+            self.variable_component_map[variable] = self.variable_component_map[moved]
+            self.placements[variable] = self.placements[moved]
+        last = len(self.components) - 1
+        self.components.pop()
+        del self.variable_component_map[last]
+        self.placements.pop()
+        return moved
+
+    # The compiled problem only depends on the board and the components, in order
+    def cache_key(self):
+        return "CircuitBoardProblem", self.board_width, self.board_height, tuple(map(tuple, self.components))
+
     # Find all the places where we can fit the component on the board at all
     # Returns a list of locations (variables) where we can place the top-left corner of the component
     def get_component_domain(self, component):
@@ -50,36 +98,39 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
 
         return domain
 
-    # Given two components, find all pairs of locations where they can be placed
-    # Returns a set of tuples of locations
+    # Returns the placements of the component: for each location, the bitmask of the board cells it covers
+    def get_component_placements(self, var):
+        width, height = self.variable_component_map[var]
+
+        # The cells covered when the component is placed at location 0
+        corner_mask = 0
+        for vertical in range(height):
+            corner_mask |= ((1 << width) - 1) << (vertical * self.board_width)
+
+        # Moving the top-left corner to a location is just a shift, since locations are cell indices
+        return ComponentPlacements({location: corner_mask << location for location in self.domains[var]})
+
+    # Given two components, returns the constraint that they do not overlap
+    # Nothing is enumerated: checking a pair of locations is a single AND of their occupancy masks
     def get_component_pair_constraints(self, var_1, var_2):
-        allowed_pairs = set()
-
-        # Loop through all places we can place the first component
-        for curr_location in self.domains[var_1]:
-            # A set of locations occupied if the first component is placed at curr_location
-            locations_occupied = set()
-            for horizontal in range(self.variable_component_map[var_1][0]):
-                for vertical in range(self.variable_component_map[var_1][1]):
-                    locations_occupied.add(curr_location + horizontal + (vertical * self.board_width))
-
-            # Compare to the places we can place the second component
-            #   (Assuming the first component is placed at curr_location)
-            for other_location in self.domains[var_2]:
-                conflict = False
-                for horizontal in range(self.variable_component_map[var_2][0]):
-                    for vertical in range(self.variable_component_map[var_2][1]):
-                        # If the other component overlaps with the first one, there is a conflict
-                        if (other_location + horizontal + (vertical * self.board_width)) in locations_occupied:
-                            conflict = True
-                            break
-                    if conflict:
-                        break
-                # If there is no conflicts, this is an allowed place for both components
-                if not conflict:
-                    allowed_pairs.add((curr_location, other_location))
-
-        return allowed_pairs
+        return NonOverlapRelation(self.placements[var_1], self.placements[var_2])
+
+    # Minimum-remaining-values that breaks ties by placing the component with the larger area first
+    # The solver configurations that name minimum_remaining_values use this one (see portfolio_solver)
+    # Without pruning, the larger components are also the ones with fewer placements, but once arc consistency
+    #   prunes the domains, ties between a large component and a small one are common. Placing the small one
+    #   first leaves gaps that only show up as dead ends much deeper in the search
+    def minimum_remaining_values(self, assignment, domains):
+        min_key = None
+        min_variable = None
+        for variable in range(len(assignment)):
+            if assignment[variable] is None:
+                width, height = self.variable_component_map[variable]
+                key = (len(domains[variable]), -width * height)
+                if min_key is None or key < min_key:
+                    min_key = key
+                    min_variable = variable
+        return min_variable
 
     # Given a valid assignment, illustrate it in the form of the circuit board problem
     def illustrate_solution(self, assignment):
@@ -116,6 +167,55 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
         print(illustration)
 
 
+# The constraint that two components placed on the board do not overlap
+# Each component's placements are precomputed as occupancy bitmasks over the board cells
+class NonOverlapRelation(ConstraintRelation):
+    def __init__(self, placements_1, placements_2):
+        self.placements_1 = placements_1
+        self.placements_2 = placements_2
+
+    def allows(self, location_1, location_2):
+        return self.placements_1.occupancy[location_1] & self.placements_2.occupancy[location_2] == 0
+
+    def transposed(self):
+        return NonOverlapRelation(self.placements_2, self.placements_1)
+
+    # Instead of testing every pair of locations, find for every cell the placements of the second component
+    #   that cover it. A placement of the first component then rules out the union of those for its cells
+    def support_rows(self, values_1, index_2):
+        covering = self.placements_2.covering_masks(index_2)
+        occupancy_1 = self.placements_1.occupancy
+
+        full_mask = (1 << len(index_2)) - 1
+        rows = []
+        for location_1 in values_1:
+            blocked_mask = 0
+            for cell in mask_indices(occupancy_1[location_1]):
+                blocked_mask |= covering.get(cell, 0)
+            rows.append(full_mask & ~blocked_mask)
+        return rows
+
+    def __repr__(self):
+        return f"NonOverlapRelation({len(self.placements_1.occupancy)} x {len(self.placements_2.occupancy)} locations)"
+
+
+# Every placement of one component: location --> bitmask of the board cells it covers
+class ComponentPlacements:
+    def __init__(self, occupancy):
+        self.occupancy = occupancy
+        # The last (value index, covering masks) pair, since compiling asks for the same one per other component
+        self.covering_cache = None
+
+    # Returns a dictionary of cell --> bitmask (over the value indices in index) of the placements covering that cell
+    def covering_masks(self, index):
+        if self.covering_cache is None or self.covering_cache[0] is not index:
+            covering = dict()
+            for location, j in index.items():
+                for cell in mask_indices(self.occupancy[location]):
+                    covering[cell] = covering.get(cell, 0) | (1 << j)
+            self.covering_cache = (index, covering)
+        return self.covering_cache[1]
+
 if __name__ == "__main__":
     # Testing domain accuracy
     cbp = CircuitBoardProblem(4, 4, [(2, 2), (2, 2), (2, 3)])
@@ -0,0 +1,333 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from CompiledProblem import CompiledProblem
+
+
+# Identifies a cache file, and the version of its layout
+MAGIC = b"CSPCACHE"
+VERSION = 1
+# The header after the magic: version, length of the key, and the number of variables, distinct domains,
+#   arcs and distinct lists of support masks
+HEADER = struct.Struct("<IIQQQQ")
+
+
+# A directory of compiled problems saved to disk, so a problem that was compiled once (in any process) is
+#   loaded instead of compiled again. Problems are stored under their cache_key(), like the board size
+# Files are memory mapped when loaded: nothing is read until it is used, each arc's support masks are only
+#   decoded the first time a solver asks for them, and processes that load the same file share its pages
+# When the files add up to more than max_bytes, the ones used least recently are deleted
+class CompiledCache:
+    def __init__(self, directory, max_bytes=1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path_of(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest()[:32] + ".csp")
+
+    # Returns the compiled problem stored under the key for the given problem, or None if there is none
+    def load(self, key, csp):
+        path = self.path_of(key)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        compiled = load_compiled(mapped, repr(key).encode(), csp, path)
+        if compiled is None:
+            mapped.close()
+            return None
+
+        # Loading counts as a use, for eviction
+        os.utime(path)
+        return compiled
+
+    # Saves the compiled problem under the key, unless its values are not all integers (which is all the
+    #   format can hold) or it is too big for the cache on its own
+    def store(self, key, compiled):
+        data = dump_compiled(compiled, repr(key).encode())
+        if data is None or len(data) > self.max_bytes:
+            return False
+
+        # Written to a temporary file first, so another process never maps a half written file
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "wb") as f:
+            f.write(data)
+        os.replace(temporary_path, self.path_of(key))
+
+        self.evict()
+        return True
+
+    # Deletes the least recently used files until the rest fit in max_bytes
+    def evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".csp"):
+                status = os.stat(os.path.join(self.directory, name))
+                files.append((status.st_mtime, status.st_size, name))
+        files.sort()
+
+        total = sum(size for modified, size, name in files)
+        for modified, size, name in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    # Deletes every file in the cache
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(".csp"):
+                os.remove(os.path.join(self.directory, name))
+
+
+# Lays the compiled problem out as bytes:
+#   magic, header, key (padded to 8 bytes),
+#   domain_of[n], domain_starts[domains + 1], values[...],
+#   arc_starts[n + 1], arc_targets[arcs], arc_matrices[arcs], matrix_starts[matrices + 1], rows
+# Like in the compiled problem, every distinct domain and every distinct list of support masks is stored once
+# Arcs are sorted by variable and then by target, so an arc is found by binary search. Support masks are
+#   stored as little endian integers, as many bytes each as the target's domain needs
+# Returns None if some value is not an integer that fits in 64 bits
+def dump_compiled(compiled, key):
+    if any(type(value) is not int for variable_values in compiled.values for value in variable_values):
+        return None
+
+    num_variables = compiled.num_variables
+    domain_number = dict()
+    domain_of = array("q")
+    domain_starts = array("q", [0])
+    values = array("q")
+    for variable_values in compiled.values:
+        number = domain_number.get(id(variable_values))
+        if number is None:
+            number = domain_number[id(variable_values)] = len(domain_number)
+            try:
+                values.extend(variable_values)
+            except OverflowError:
+                return None
+            domain_starts.append(len(values))
+        domain_of.append(number)
+
+    arcs = sorted(compiled.supports)
+    arc_starts = array("q", [0 for i in range(num_variables + 1)])
+    for var_1, var_2 in arcs:
+        arc_starts[var_1 + 1] += 1
+    for variable in range(num_variables):
+        arc_starts[variable + 1] += arc_starts[variable]
+    arc_targets = array("q", [var_2 for var_1, var_2 in arcs])
+
+    # (shared list of masks, row width) --> its number
+    matrix_number = dict()
+    arc_matrices = array("q")
+    matrix_starts = array("q", [0])
+    rows = bytearray()
+    for arc in arcs:
+        arc_rows = compiled.supports[arc]
+        width = row_width(len(compiled.values[arc[1]]))
+        number = matrix_number.get((id(arc_rows), width))
+        if number is None:
+            number = matrix_number[(id(arc_rows), width)] = len(matrix_number)
+            for row in arc_rows:
+                rows += row.to_bytes(width, "little")
+            matrix_starts.append(len(rows))
+        arc_matrices.append(number)
+
+    padded_key = key + bytes(-len(key) % 8)
+    header = HEADER.pack(VERSION, len(key), num_variables, len(domain_number), len(arcs), len(matrix_number))
+    return b"".join([MAGIC, header, padded_key, domain_of.tobytes(), domain_starts.tobytes(), values.tobytes(),
+                     arc_starts.tobytes(), arc_targets.tobytes(), arc_matrices.tobytes(), matrix_starts.tobytes(),
+                     rows])
+
+
+# Builds a compiled problem over the memory mapped bytes of dump_compiled, for the given problem
+# The path of the file is kept, so the compiled problem can be pickled and mapped again (see MappedSupports)
+# Returns None if the bytes are not a cache file of this version for this key and number of variables
+def load_compiled(mapped, key, csp, path):
+    tables = map_tables(mapped, key)
+    if tables is None or tables[0] != len(csp.variables):
+        return None
+    num_variables, domain_of, domain_starts, values = tables[:4]
+    num_domains = len(domain_starts) - 1
+
+    domains = [values[domain_starts[number]:domain_starts[number + 1]].tolist() for number in range(num_domains)]
+    indexes = [{value: i for i, value in enumerate(domain)} for domain in domains]
+
+    compiled = CompiledProblem.__new__(CompiledProblem)
+    compiled.num_variables = num_variables
+    compiled.values = [domains[number] for number in domain_of]
+    compiled.value_index = [indexes[number] for number in domain_of]
+    compiled.full_masks = [(1 << len(variable_values)) - 1 for variable_values in compiled.values]
+    compiled.neighbors = csp.constraint_graph.neighbors
+    compiled.supports = MappedSupports(path, key, mapped, tables, compiled.values)
+    compiled.count_cache = dict()
+    compiled.conflict_lists = dict()
+    return compiled
+
+
+# Finds the tables of dump_compiled in the memory mapped bytes, each one a zero copy view of the file
+# Returns (number of variables, domain_of, domain_starts, values, arc_starts, arc_targets, arc_matrices,
+#   matrix_starts, rows), or None if the bytes are not a cache file of this version for this key
+def map_tables(mapped, key):
+    view = memoryview(mapped)
+    position = len(MAGIC) + HEADER.size
+    if len(view) < position or view[:len(MAGIC)] != MAGIC:
+        return None
+    version, key_length, num_variables, num_domains, num_arcs, num_matrices = HEADER.unpack_from(view, len(MAGIC))
+    if version != VERSION or view[position:position + key_length] != key:
+        return None
+    position += key_length + (-key_length % 8)
+
+    def integers(count):
+        nonlocal position
+        table = view[position:position + count * 8].cast("q")
+        position += count * 8
+        return table
+
+    domain_of = integers(num_variables)
+    domain_starts = integers(num_domains + 1)
+    values = integers(domain_starts[num_domains])
+    arc_starts = integers(num_variables + 1)
+    arc_targets = integers(num_arcs)
+    arc_matrices = integers(num_arcs)
+    matrix_starts = integers(num_matrices + 1)
+    rows = view[position:]
+    return num_variables, domain_of, domain_starts, values, arc_starts, arc_targets, arc_matrices, matrix_starts, rows
+
+
+# The number of bytes of a support mask over a domain of the given size: 1, 2, 4 or 8 bytes so that a whole
+#   arc can be read as one array of machine integers, and a multiple of 8 beyond that
+def row_width(domain_size):
+    width = max(1, (domain_size + 7) // 8)
+    for size in (1, 2, 4, 8):
+        if width <= size:
+            return size
+    return (width + 7) // 8 * 8
+
+
+# The array type code of each row width that fits in a machine integer
+ROW_TYPE_CODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+# The support masks of a compiled problem, read from a memory mapped cache file
+# Works like the SupportStore that CompiledProblem builds, but each distinct list of masks is only decoded the
+#   first time an arc that uses it is asked for
+# Arcs set or discarded after loading (see CompiledProblem.update_arcs) are kept on top of the file, which is
+#   never written to
+class MappedSupports:
+    def __init__(self, path, key, mapped, tables, values):
+        self.path = path
+        self.key = key
+        self.values = values
+        self.map(mapped, tables)
+        # Arc --> its masks, and matrix number --> its masks, for everything decoded (or set) so far
+        self.decoded = dict()
+        self.decoded_matrices = dict()
+        # Arcs of the file that were discarded, and arcs set that the file does not have
+        self.removed = set()
+        self.added = set()
+
+    # Uses the tables of the mapped file (see map_tables)
+    def map(self, mapped, tables):
+        # Kept so the mapping stays open as long as the views into it are used
+        self.mapped = mapped
+        self.arc_starts, self.arc_targets, self.arc_matrices, self.matrix_starts, self.rows = tables[4:]
+        self.num_file_variables = len(self.arc_starts) - 1
+
+    # A mapping cannot be pickled (like when a problem is sent to a spawned worker process), so only the path
+    #   is, along with everything decoded or changed so far, and the file is mapped again when unpickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("mapped", "arc_starts", "arc_targets", "arc_matrices", "matrix_starts", "rows"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            raise ValueError(f"cannot map the compiled problem cache file {self.path} again") from error
+        tables = map_tables(mapped, self.key)
+        if tables is None or tables[0] != self.num_file_variables:
+            raise ValueError(f"the compiled problem cache file {self.path} changed since it was loaded")
+        self.map(mapped, tables)
+
+    # Returns the position of the arc in the tables, or None if the file has no such arc
+    def arc_position(self, arc):
+        var_1, var_2 = arc
+        if not 0 <= var_1 < self.num_file_variables:
+            return None
+        start, end = self.arc_starts[var_1], self.arc_starts[var_1 + 1]
+        position = bisect_left(self.arc_targets, var_2, start, end)
+        if position < end and self.arc_targets[position] == var_2:
+            return position
+        return None
+
+    def __getitem__(self, arc):
+        arc_rows = self.decoded.get(arc)
+        if arc_rows is not None:
+            return arc_rows
+
+        position = None if arc in self.removed else self.arc_position(arc)
+        if position is None:
+            raise KeyError(arc)
+        number = self.arc_matrices[position]
+        arc_rows = self.decoded_matrices.get(number)
+        if arc_rows is None:
+            data = self.rows[self.matrix_starts[number]:self.matrix_starts[number + 1]]
+            width = row_width(len(self.values[arc[1]]))
+            if width in ROW_TYPE_CODES and sys.byteorder == "little":
+                arc_rows = data.cast(ROW_TYPE_CODES[width]).tolist()
+            else:
+                arc_rows = [int.from_bytes(data[i:i + width], "little") for i in range(0, len(data), width)]
+            self.decoded_matrices[number] = arc_rows
+
+        self.decoded[arc] = arc_rows
+        return arc_rows
+
+    def __contains__(self, arc):
+        return arc in self.decoded or (arc not in self.removed and self.arc_position(arc) is not None)
+
+    def __len__(self):
+        return len(self.arc_targets) - len(self.removed) + len(self.added)
+
+    def __iter__(self):
+        for var_1 in range(self.num_file_variables):
+            for position in range(self.arc_starts[var_1], self.arc_starts[var_1 + 1]):
+                arc = (var_1, self.arc_targets[position])
+                if arc not in self.removed:
+                    yield arc
+        yield from self.added
+
+    def set(self, var_1, var_2, rows):
+        arc = (var_1, var_2)
+        self.decoded[arc] = rows
+        self.removed.discard(arc)
+        if self.arc_position(arc) is None:
+            self.added.add(arc)
+
+    def discard(self, var_1, var_2):
+        arc = (var_1, var_2)
+        self.decoded.pop(arc, None)
+        self.added.discard(arc)
+        if self.arc_position(arc) is not None:
+            self.removed.add(arc)
+
+    # Variables are only numbered by the problem, so there is nothing to add or drop here
+    def add_variable(self):
+        pass
+
+    def remove_last_variable(self):
+        pass
@@ -0,0 +1,305 @@
+from BitsetDomains import BitsetDomains
+from ConstraintRelation import ConstraintRelation
+from csp_helper_functions import mask_indices
+
+
+# A compiled form of a CSP used by the solvers: every variable's values are interned to dense indices,
+#   domains become integer bitmasks, and every arc becomes a per-value support bitmask
+# supports[(var_1, var_2)][i] is the mask of var_2's value indices that are allowed alongside
+#   the i-th value of var_1, taking the constraints in both directions into account
+# Nothing is stored twice: variables with the same domain share one values list and index, and arcs with
+#   the same support masks (like every border of a map, or queens the same number of columns apart) share
+#   one list of them (see SupportStore)
+class CompiledProblem:
+    def __init__(self, csp):
+        self.num_variables = len(csp.variables)
+        self.values = []
+        self.value_index = []
+        # Which distinct domain each variable has, numbered in the order they are first seen
+        domain_ids = []
+        # Domain values --> (its number, the shared values list, the shared index)
+        interned_domains = dict()
+        for domain in csp.domains:
+            values = tuple(domain)
+            interned = interned_domains.get(values)
+            if interned is None:
+                shared_values = list(values)
+                interned = (len(interned_domains), shared_values,
+                            {value: i for i, value in enumerate(shared_values)})
+                interned_domains[values] = interned
+            domain_ids.append(interned[0])
+            self.values.append(interned[1])
+            self.value_index.append(interned[2])
+        self.full_masks = [(1 << len(values)) - 1 for values in self.values]
+        self.neighbors = csp.constraint_graph.neighbors
+
+        # The support masks already built, by the constraints and domains they were built from, and by content
+        computed = dict()
+        interned = dict()
+        constraints = csp.constraints
+        self.supports = SupportStore(self.neighbors)
+        for var_1 in range(self.num_variables):
+            for var_2 in self.neighbors[var_1]:
+                relation = constraints[(var_1, var_2)] if (var_1, var_2) in constraints else None
+                reverse = constraints[(var_2, var_1)] if (var_2, var_1) in constraints else None
+                key = (id(relation), id(reverse), domain_ids[var_1], domain_ids[var_2])
+
+                rows = computed.get(key)
+                if rows is None:
+                    rows = self.compile_arc(constraints, var_1, var_2)
+                    rows = interned.setdefault(tuple(rows), rows)
+                    computed[key] = rows
+                self.supports.add(var_1, var_2, rows)
+
+        # (var_1, var_2) --> [the mask of var_2 the counts are up to date with, the counts], see conflict_counts
+        self.count_cache = dict()
+        # id of a list of support masks --> (the list, its conflict lists, their average length)
+        self.conflict_lists = dict()
+
+    # Builds the support masks of var_1's values against var_2 from the allowed pairs in both directions
+    def compile_arc(self, constraints, var_1, var_2):
+        rows = [self.full_masks[var_2] for i in range(len(self.values[var_1]))]
+
+        if (var_1, var_2) in constraints:
+            rows = self.and_rows(rows, self.pair_rows(constraints[(var_1, var_2)], var_1, var_2, False))
+        if (var_2, var_1) in constraints:
+            rows = self.and_rows(rows, self.pair_rows(constraints[(var_2, var_1)], var_1, var_2, True))
+
+        return rows
+
+    # Turns a set of allowed pairs into one support mask per value of var_1
+    # If flipped, the pairs are (var_2 value, var_1 value) rather than (var_1 value, var_2 value)
+    def pair_rows(self, allowed_pairs, var_1, var_2, flipped):
+        # Relations build their own support masks, through their transpose for the arc in the other direction
+        if isinstance(allowed_pairs, ConstraintRelation):
+            if flipped:
+                allowed_pairs = allowed_pairs.transposed()
+            return allowed_pairs.support_rows(self.values[var_1], self.value_index[var_2])
+
+        # Anything else that is not a set of pairs can only be asked about one pair at a time
+        if not isinstance(allowed_pairs, (set, frozenset)):
+            return self.tested_rows(allowed_pairs, var_1, var_2, flipped)
+
+        rows = [0 for i in range(len(self.values[var_1]))]
+        index_1 = self.value_index[var_1]
+        index_2 = self.value_index[var_2]
+        for pair in allowed_pairs:
+            if flipped:
+                value_2, value_1 = pair
+            else:
+                value_1, value_2 = pair
+
+            # Pairs that mention values outside of the domains can never be used
+            i = index_1.get(value_1)
+            j = index_2.get(value_2)
+            if i is not None and j is not None:
+                rows[i] |= 1 << j
+
+        return rows
+
+    # Builds the support masks by testing every pair of values against the relation
+    def tested_rows(self, relation, var_1, var_2, flipped):
+        rows = []
+        for value_1 in self.values[var_1]:
+            row = 0
+            for j, value_2 in enumerate(self.values[var_2]):
+                pair = (value_2, value_1) if flipped else (value_1, value_2)
+                if pair in relation:
+                    row |= 1 << j
+            rows.append(row)
+        return rows
+
+    # Returns, for every value of var_1, how many of var_2's values in mask_2 are not allowed alongside it
+    # The counts of an arc are kept from one call to the next and brought up to date with the values var_2 has
+    #   lost or got back since (the difference of the two masks), which are usually few during a search: each
+    #   of those values only changes the counts of the values of var_1 it conflicts with (see conflicts_of)
+    # When so much has changed that this would cost more than counting again, the counts are counted again
+    # The list returned is updated in place by later calls, so it should not be kept
+    def conflict_counts(self, var_1, var_2, mask_2):
+        cached = self.count_cache.get((var_1, var_2))
+        if cached is not None:
+            changed = cached[0] ^ mask_2
+            if not changed:
+                return cached[1]
+            conflicts, average = self.conflicts_of(var_2, var_1)
+            if changed.bit_count() * average < len(cached[1]):
+                counts = cached[1]
+                for j in mask_indices(changed):
+                    step = 1 if (mask_2 >> j) & 1 else -1
+                    for i in conflicts[j]:
+                        counts[i] += step
+                cached[0] = mask_2
+                return counts
+
+        counts = [(mask_2 & ~row).bit_count() for row in self.supports[(var_1, var_2)]]
+        self.count_cache[(var_1, var_2)] = [mask_2, counts]
+        return counts
+
+    # Returns, for every value of var_1, the indices of var_2's values it conflicts with, and the average
+    #   number of them. Arcs that share their support masks share these too
+    def conflicts_of(self, var_1, var_2):
+        rows = self.supports[(var_1, var_2)]
+        shared = self.conflict_lists.get(id(rows))
+        if shared is None:
+            full_mask = self.full_masks[var_2]
+            conflicts = [list(mask_indices(full_mask & ~row)) for row in rows]
+            average = sum(map(len, conflicts)) / len(conflicts) if conflicts else 0
+            # The masks are kept with their conflicts so that their id is not reused while this entry exists
+            shared = self.conflict_lists[id(rows)] = (rows, conflicts, average)
+        return shared[1], shared[2]
+
+    # The problem gained a variable with the given domain, and no constraints yet
+    def add_variable(self, domain):
+        values = list(domain)
+        self.values.append(values)
+        self.value_index.append({value: i for i, value in enumerate(values)})
+        self.full_masks.append((1 << len(values)) - 1)
+        self.num_variables += 1
+        self.supports.add_variable()
+
+    # Rebuilds the masks of the arcs between the two variables in both directions, after the constraints
+    #   between them changed. Nothing else is recompiled
+    def update_arcs(self, constraints, var_1, var_2):
+        for arc in ((var_1, var_2), (var_2, var_1)):
+            self.count_cache.pop(arc, None)
+            if arc[1] in self.neighbors[arc[0]]:
+                self.supports.set(arc[0], arc[1], self.compile_arc(constraints, arc[0], arc[1]))
+            else:
+                self.supports.discard(arc[0], arc[1])
+
+    # Gives the last variable the number of the target, which has no arcs left, and drops the last number
+    # Has to be called before the constraint graph renumbers its neighbor lists the same way
+    def move_last_variable(self, target):
+        source = self.num_variables - 1
+        if target != source:
+            for other in list(self.neighbors[source]):
+                for old_arc, new_arc in (((source, other), (target, other)), ((other, source), (other, target))):
+                    self.count_cache.pop(old_arc, None)
+                    if old_arc in self.supports:
+                        rows = self.supports[old_arc]
+                        self.supports.discard(*old_arc)
+                        self.supports.set(new_arc[0], new_arc[1], rows)
+            self.values[target] = self.values[source]
+            self.value_index[target] = self.value_index[source]
+            self.full_masks[target] = self.full_masks[source]
+
+        self.values.pop()
+        self.value_index.pop()
+        self.full_masks.pop()
+        self.num_variables -= 1
+        self.supports.remove_last_variable()
+
+    # Intersects two lists of support masks value by value
+    @staticmethod
+    def and_rows(rows_1, rows_2):
+        return [row_1 & row_2 for row_1, row_2 in zip(rows_1, rows_2)]
+
+    # Returns a new set of bitmask domains, either full or built from lists of values
+    def create_domains(self, domains=None):
+        if domains is None:
+            return BitsetDomains(self, list(self.full_masks))
+        return BitsetDomains(self, [self.values_to_mask(variable, domains[variable])
+                                    for variable in range(self.num_variables)])
+
+    # Converts a collection of values of the given variable into a bitmask
+    def values_to_mask(self, variable, values):
+        mask = 0
+        index = self.value_index[variable]
+        for value in values:
+            mask |= 1 << index[value]
+        return mask
+
+    # Converts a bitmask of the given variable into a list of its values, in domain order
+    def mask_to_values(self, variable, mask):
+        values = self.values[variable]
+        return [values[i] for i in mask_indices(mask)]
+
+
+# The support masks of every arc, as a read-only mapping of (var_1, var_2) --> list of masks
+# Arcs share their lists: while every arc has the same masks, as with a map where every border is the same
+#   "colors differ" check over the same colors, only that one list is kept and nothing per arc. Otherwise each
+#   variable keeps a dict of neighbor --> masks, whose lists are still shared between arcs
+# Arcs have to be added in the order of the neighbor lists
+# Once built, arcs can be set and discarded in any order (see CompiledProblem.update_arcs), as long as the
+#   neighbor lists already show the change
+class SupportStore:
+    def __init__(self, neighbors):
+        self.neighbors = neighbors
+        # The masks of every arc added so far, while they are all the same list
+        self.uniform = None
+        # arc_rows[var_1][var_2], once the arcs are not all the same
+        self.arc_rows = None
+
+    def add(self, var_1, var_2, rows):
+        if self.arc_rows is None:
+            if self.uniform is None or rows is self.uniform:
+                self.uniform = rows
+                return
+            self.split(var_1, var_2)
+        self.arc_rows[var_1][var_2] = rows
+
+    # Gives every arc added before (var_1, var_2) its own entry, now that they are no longer all the same
+    def split(self, var_1, var_2):
+        self.arc_rows = [dict() for i in range(len(self.neighbors))]
+        for variable in range(var_1 + 1):
+            for other in self.neighbors[variable]:
+                if variable == var_1 and other == var_2:
+                    break
+                self.arc_rows[variable][other] = self.uniform
+        self.uniform = None
+
+    # Sets the masks of an arc that the neighbor lists have, keeping the single shared list if they are the same
+    def set(self, var_1, var_2, rows):
+        if self.arc_rows is None:
+            if self.uniform is None or rows == self.uniform:
+                if self.uniform is None:
+                    self.uniform = rows
+                return
+            self.arc_rows = [{other: self.uniform for other in variable_neighbors}
+                             for variable_neighbors in self.neighbors]
+            self.uniform = None
+        self.arc_rows[var_1][var_2] = rows
+
+    # Forgets the masks of an arc that the neighbor lists no longer have
+    def discard(self, var_1, var_2):
+        if self.arc_rows is not None:
+            self.arc_rows[var_1].pop(var_2, None)
+
+    def add_variable(self):
+        if self.arc_rows is not None:
+            self.arc_rows.append(dict())
+
+    # Drops the last variable, whose arcs have all been discarded or moved to another variable
+    def remove_last_variable(self):
+        if self.arc_rows is not None:
+            self.arc_rows.pop()
+
+    def __getitem__(self, arc):
+        if self.arc_rows is not None:
+            return self.arc_rows[arc[0]][arc[1]]
+        if self.uniform is None or arc not in self:
+            raise KeyError(arc)
+        return self.uniform
+
+    def __contains__(self, arc):
+        if not 0 <= arc[0] < len(self.neighbors):
+            return False
+        if self.arc_rows is not None:
+            return arc[1] in self.arc_rows[arc[0]]
+        return self.uniform is not None and arc[1] in self.neighbors[arc[0]]
+
+    def __len__(self):
+        if self.arc_rows is not None:
+            return sum(len(variable_rows) for variable_rows in self.arc_rows)
+        return 0 if self.uniform is None else sum(len(variable_neighbors) for variable_neighbors in self.neighbors)
+
+    def __iter__(self):
+        for var_1 in range(len(self.neighbors)):
+            for var_2 in self.neighbors[var_1]:
+                yield var_1, var_2
+
+    # Returns the number of different lists of masks, which is what the store actually holds
+    def num_distinct(self):
+        if self.arc_rows is None:
+            return 0 if self.uniform is None else 1
+        return len(set(id(rows) for arc_rows in self.arc_rows for rows in arc_rows.values()))
@@ -0,0 +1,79 @@
+# Keeps track of which variables are in conflict for a complete assignment used by local search
+# Changing one variable's value only re-checks the arcs around that variable, so a min-conflicts step
+#   costs O(degree) here instead of the O(n^2) pair scan of get_conflicted_variables
+class ConflictTable:
+    def __init__(self, csp, assignment):
+        self.graph = csp.constraint_graph
+        self.random = csp.random
+        self.assignment = assignment
+
+        # The number of violated arcs each variable is part of, and the total number of violated arcs
+        self.conflict_counts = [0 for i in range(len(assignment))]
+        self.total_conflicts = 0
+
+        # The conflicted variables are kept in a list (for choosing one at random) alongside their positions in it
+        self.conflicted_variables = []
+        self.conflicted_positions = dict()
+
+        for var_1 in range(len(assignment)):
+            for var_2, allowed_pairs in self.graph.outgoing_arcs[var_1]:
+                if (assignment[var_1], assignment[var_2]) not in allowed_pairs:
+                    self.conflict_counts[var_1] += 1
+                    self.conflict_counts[var_2] += 1
+                    self.total_conflicts += 1
+
+        for variable in range(len(assignment)):
+            self.update_membership(variable)
+
+    # Returns True if no constraint is violated by the assignment
+    def is_solved(self):
+        return len(self.conflicted_variables) == 0
+
+    # Returns a randomly chosen variable that is part of at least one violated constraint
+    def random_conflicted_variable(self):
+        return self.random.choice(self.conflicted_variables)
+
+    # Gives the variable a new value, updating the counts of the variable and its neighbors
+    def assign(self, variable, value):
+        assignment = self.assignment
+        old_value = assignment[variable]
+        if old_value == value:
+            return
+
+        # Arcs (variable, other)
+        for other, allowed_pairs in self.graph.outgoing_arcs[variable]:
+            was_violated = (old_value, assignment[other]) not in allowed_pairs
+            is_violated = (value, assignment[other]) not in allowed_pairs
+            if was_violated != is_violated:
+                self.change_count(variable, other, 1 if is_violated else -1)
+
+        # Arcs (other, variable)
+        for other, allowed_pairs in self.graph.incoming_arcs[variable]:
+            was_violated = (assignment[other], old_value) not in allowed_pairs
+            is_violated = (assignment[other], value) not in allowed_pairs
+            if was_violated != is_violated:
+                self.change_count(variable, other, 1 if is_violated else -1)
+
+        assignment[variable] = value
+        self.update_membership(variable)
+
+    # Adds the change in the number of violated arcs to both ends of one arc
+    def change_count(self, variable, other, change):
+        self.conflict_counts[variable] += change
+        self.conflict_counts[other] += change
+        self.total_conflicts += change
+        self.update_membership(other)
+
+    # Adds the variable to (or removes it from) the conflicted list based on its count
+    def update_membership(self, variable):
+        in_list = variable in self.conflicted_positions
+        if self.conflict_counts[variable] > 0 and not in_list:
+            self.conflicted_positions[variable] = len(self.conflicted_variables)
+            self.conflicted_variables.append(variable)
+        elif self.conflict_counts[variable] == 0 and in_list:
+            # Swap the last variable into its place so removal is O(1)
+            position = self.conflicted_positions.pop(variable)
+            last_variable = self.conflicted_variables.pop()
+            if last_variable != variable:
+                self.conflicted_variables[position] = last_variable
+                self.conflicted_positions[last_variable] = position
@@ -0,0 +1,336 @@
+from bisect import bisect_left, insort
+from heapq import heapify, heappop, heappush
+from itertools import chain
+
+
+# An adjacency index over the constraints of a CSP, built once when the problem is constructed
+#   so the solvers only ever look at the real neighbors of a variable instead of probing every pair
+class ConstraintGraph:
+    def __init__(self, num_variables, constraints):
+        # outgoing_arcs[var] holds (other, allowed_pairs) for every constraint (var, other)
+        # incoming_arcs[var] holds (other, allowed_pairs) for every constraint (other, var)
+        # The allowed pairs are direct references to the sets in the constraints, not copies
+        self.outgoing_arcs = [[] for i in range(num_variables)]
+        self.incoming_arcs = [[] for i in range(num_variables)]
+
+        for (var_1, var_2), allowed_pairs in constraints.items():
+            self.outgoing_arcs[var_1].append((var_2, allowed_pairs))
+            self.incoming_arcs[var_2].append((var_1, allowed_pairs))
+
+        # Keep the arcs in variable order, which is the order the old full scans visited them in
+        for variable in range(num_variables):
+            self.outgoing_arcs[variable].sort(key=arc_neighbor)
+            self.incoming_arcs[variable].sort(key=arc_neighbor)
+
+        # Every variable that shares a constraint with the variable, in either direction
+        self.neighbors = []
+        for variable in range(num_variables):
+            connected = set(other for other, allowed_pairs in self.outgoing_arcs[variable])
+            connected.update(other for other, allowed_pairs in self.incoming_arcs[variable])
+            self.neighbors.append(sorted(connected))
+
+        # The relation every arc shares, for graphs built by shared_relation
+        self.relation = None
+
+    # Builds the index for problems where every arc uses the same symmetric relation, without a constraints dict
+    # neighbors[var] can be any sequence of the variable's neighbors, so implicit graphs stay implicit
+    @classmethod
+    def shared_relation(cls, neighbors, relation):
+        graph = cls.__new__(cls)
+        graph.neighbors = neighbors
+        graph.outgoing_arcs = [SharedRelationArcs(variable_neighbors, relation) for variable_neighbors in neighbors]
+        # The relation is symmetric, so the arcs into a variable are the same as the arcs out of it
+        graph.incoming_arcs = graph.outgoing_arcs
+        graph.relation = relation
+        return graph
+
+    # The arcs of a shared relation graph are only the neighbors again, which can be views that cannot be
+    #   pickled (see AdjacencyArrays), so they are left out and made again from the neighbors
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.relation is not None:
+            del state["outgoing_arcs"], state["incoming_arcs"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.relation is not None:
+            self.outgoing_arcs = [SharedRelationArcs(variable_neighbors, self.relation)
+                                  for variable_neighbors in self.neighbors]
+            self.incoming_arcs = self.outgoing_arcs
+
+    # Adds a variable with no constraints yet, numbered after every other
+    def add_variable(self):
+        variable_neighbors = []
+        self.neighbors.append(variable_neighbors)
+        if self.relation is not None:
+            self.outgoing_arcs.append(SharedRelationArcs(variable_neighbors, self.relation))
+        else:
+            self.outgoing_arcs.append([])
+            self.incoming_arcs.append([])
+
+    # Adds the arc (var_1, var_2), replacing the one already there, and keeps every list in variable order
+    # A graph built by shared_relation can only hold its one relation, and gets the arc in both directions
+    def add_arc(self, var_1, var_2, allowed_pairs):
+        if self.relation is not None:
+            if allowed_pairs is not self.relation:
+                raise ValueError("every constraint of this problem has to be its shared relation")
+            self.link(var_1, var_2)
+            self.link(var_2, var_1)
+            return
+
+        self.remove_arc(var_1, var_2)
+        insert_arc(self.outgoing_arcs[var_1], var_2, allowed_pairs)
+        insert_arc(self.incoming_arcs[var_2], var_1, allowed_pairs)
+        self.link(var_1, var_2)
+        self.link(var_2, var_1)
+
+    # Removes the arc (var_1, var_2) if it is there. The two variables stay neighbors while the arc in the
+    #   other direction is left. In a graph built by shared_relation, both directions are removed
+    def remove_arc(self, var_1, var_2):
+        if self.relation is None:
+            remove_arc_to(self.outgoing_arcs[var_1], var_2)
+            remove_arc_to(self.incoming_arcs[var_2], var_1)
+            if any(other == var_2 for other, allowed_pairs in chain(self.outgoing_arcs[var_2],
+                                                                     self.incoming_arcs[var_2])):
+                return
+        self.unlink(var_1, var_2)
+        self.unlink(var_2, var_1)
+
+    # Gives the last variable the number of the target variable, which must have no constraints left, and
+    #   drops the last number. With the target being the last variable, it is just dropped
+    def move_last_variable(self, target):
+        source = len(self.neighbors) - 1
+        if target != source:
+            for other in list(self.neighbors[source]):
+                self.unlink(other, source)
+                self.link(other, target)
+            if self.relation is None:
+                for other, allowed_pairs in self.outgoing_arcs[source]:
+                    remove_arc_to(self.incoming_arcs[other], source)
+                    insert_arc(self.incoming_arcs[other], target, allowed_pairs)
+                for other, allowed_pairs in self.incoming_arcs[source]:
+                    remove_arc_to(self.outgoing_arcs[other], source)
+                    insert_arc(self.outgoing_arcs[other], target, allowed_pairs)
+                self.outgoing_arcs[target] = self.outgoing_arcs[source]
+                self.incoming_arcs[target] = self.incoming_arcs[source]
+            self.neighbors[target] = self.neighbors[source]
+            if self.relation is not None:
+                self.outgoing_arcs[target] = SharedRelationArcs(self.neighbors[target], self.relation)
+
+        self.neighbors.pop()
+        self.outgoing_arcs.pop()
+        if self.relation is None:
+            self.incoming_arcs.pop()
+
+    # Returns the neighbors of the variable as a list that can be changed, turning an implicit or read-only
+    #   sequence (like a view into AdjacencyArrays) into one the first time
+    def editable_neighbors(self, variable):
+        variable_neighbors = self.neighbors[variable]
+        if type(variable_neighbors) is not list:
+            variable_neighbors = list(variable_neighbors)
+            self.neighbors[variable] = variable_neighbors
+            if self.relation is not None:
+                self.outgoing_arcs[variable] = SharedRelationArcs(variable_neighbors, self.relation)
+        return variable_neighbors
+
+    # Makes other a neighbor of the variable, if it is not already
+    def link(self, variable, other):
+        variable_neighbors = self.editable_neighbors(variable)
+        i = bisect_left(variable_neighbors, other)
+        if i == len(variable_neighbors) or variable_neighbors[i] != other:
+            variable_neighbors.insert(i, other)
+
+    # Makes other no longer a neighbor of the variable, if it was
+    def unlink(self, variable, other):
+        variable_neighbors = self.editable_neighbors(variable)
+        i = bisect_left(variable_neighbors, other)
+        if i < len(variable_neighbors) and variable_neighbors[i] == other:
+            del variable_neighbors[i]
+
+    # Returns the number of variables that share a constraint with the given variable
+    def degree(self, variable):
+        return len(self.neighbors[variable])
+
+    # Splits the variables into groups that share no constraints, as lists of variables in increasing order
+    # Each of groups is a collection of variables that should also count as connected, like the variables
+    #   of a global constraint
+    def connected_components(self, groups=()):
+        linked = dict()
+        for group in groups:
+            group = list(group)
+            for variable in group:
+                linked.setdefault(variable, []).extend(group)
+
+        component_of = [None for i in range(len(self.neighbors))]
+        components = []
+        for root in range(len(self.neighbors)):
+            if component_of[root] is not None:
+                continue
+
+            component_of[root] = len(components)
+            component = [root]
+            stack = [root]
+            while stack:
+                variable = stack.pop()
+                for other in chain(self.neighbors[variable], linked.get(variable, ())):
+                    if component_of[other] is None:
+                        component_of[other] = len(components)
+                        component.append(other)
+                        stack.append(other)
+
+            component.sort()
+            components.append(component)
+        return components
+
+    # Returns the variables other than the excluded ones in breadth-first order from the lowest variable of
+    #   each tree, as (variable, parent) pairs where the parent is None for the roots
+    # Raises a ValueError if the constraints between them have a cycle, since then they are not a forest
+    def forest_order(self, excluded=()):
+        excluded = set(excluded)
+        parent = dict()
+        order = []
+        for root in range(len(self.neighbors)):
+            if root in excluded or root in parent:
+                continue
+
+            parent[root] = None
+            start = len(order)
+            order.append((root, None))
+            while start < len(order):
+                variable = order[start][0]
+                start += 1
+                for other in self.neighbors[variable]:
+                    if other in excluded or other == parent[variable]:
+                        continue
+                    if other in parent:
+                        raise ValueError(f"the constraints have a cycle through variables {variable} and {other}")
+                    parent[other] = variable
+                    order.append((other, variable))
+        return order
+
+    # Returns a set of variables whose removal leaves the constraint graph without cycles
+    # Greedy: variables with at most one neighbor left are peeled off, since they cannot be on a cycle, and
+    #   when none are left the variable with the most neighbors left goes into the cutset
+    def cycle_cutset(self):
+        degrees = [len(variable_neighbors) for variable_neighbors in self.neighbors]
+        removed = [False for i in range(len(degrees))]
+        cutset = set()
+
+        # Most neighbors first; entries are left behind when a degree changes and skipped once stale
+        largest = [(-degree, variable) for variable, degree in enumerate(degrees)]
+        heapify(largest)
+        peel = [variable for variable, degree in enumerate(degrees) if degree <= 1]
+
+        remaining = len(degrees)
+        while remaining > 0:
+            if peel:
+                variable = peel.pop()
+                if removed[variable]:
+                    continue
+            else:
+                negative_degree, variable = heappop(largest)
+                if removed[variable] or -negative_degree != degrees[variable]:
+                    continue
+                cutset.add(variable)
+
+            removed[variable] = True
+            remaining -= 1
+            for other in self.neighbors[variable]:
+                if removed[other]:
+                    continue
+                degrees[other] -= 1
+                if degrees[other] <= 1:
+                    peel.append(other)
+                else:
+                    heappush(largest, (-degrees[other], other))
+
+        return cutset
+
+
+# The (neighbor, relation) arcs of one variable when every arc shares the same relation
+# Arcs are produced on the fly rather than stored
+class SharedRelationArcs:
+    def __init__(self, neighbors, relation):
+        self.neighbors = neighbors
+        self.relation = relation
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    def __iter__(self):
+        relation = self.relation
+        return ((other, relation) for other in self.neighbors)
+
+
+# The constraints of a problem where every arc uses the same relation, as a read-only mapping of
+#   (variable, neighbor) --> relation over the same neighbor lists the graph is built from
+# It answers the same questions as a dict of per-arc constraints, but stores nothing per arc
+class SharedRelationConstraints:
+    def __init__(self, neighbors, relation):
+        self.neighbors = neighbors
+        self.relation = relation
+
+    def __contains__(self, arc):
+        return 0 <= arc[0] < len(self.neighbors) and arc[1] in self.neighbors[arc[0]]
+
+    def __getitem__(self, arc):
+        if arc not in self:
+            raise KeyError(arc)
+        return self.relation
+
+    def __len__(self):
+        return sum(len(variable_neighbors) for variable_neighbors in self.neighbors)
+
+    def __iter__(self):
+        for variable, variable_neighbors in enumerate(self.neighbors):
+            for neighbor in variable_neighbors:
+                yield variable, neighbor
+
+    def keys(self):
+        return self
+
+    def items(self):
+        return ((arc, self.relation) for arc in self)
+
+
+# Every variable in range(num_variables) except one, as a sequence that takes constant space
+# The neighbors of a variable in a complete constraint graph
+class OtherVariables:
+    def __init__(self, num_variables, variable):
+        self.num_variables = num_variables
+        self.variable = variable
+
+    def __len__(self):
+        return self.num_variables - 1
+
+    def __iter__(self):
+        yield from range(self.variable)
+        yield from range(self.variable + 1, self.num_variables)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.num_variables - 1
+        if not 0 <= i < self.num_variables - 1:
+            raise IndexError("neighbor index out of range")
+        return i if i < self.variable else i + 1
+
+    def __contains__(self, other):
+        return other != self.variable and 0 <= other < self.num_variables
+
+
+# Sorting key for (neighbor, allowed_pairs) arcs
+def arc_neighbor(arc):
+    return arc[0]
+
+
+# Adds the (neighbor, allowed_pairs) arc to a list of arcs in neighbor order
+def insert_arc(arcs, other, allowed_pairs):
+    insort(arcs, (other, allowed_pairs), key=arc_neighbor)
+
+
+# Removes the arc to the neighbor from a list of arcs in neighbor order, if it is there
+def remove_arc_to(arcs, other):
+    i = bisect_left(arcs, other, key=arc_neighbor)
+    if i < len(arcs) and arcs[i][0] == other:
+        del arcs[i]
@@ -0,0 +1,91 @@
+# A constraint between two variables given by a rule instead of a set of allowed value pairs
+# It can be used anywhere a set of allowed pairs can: the solvers only ever ask (value_1, value_2) in relation
+# Subclasses implement allows(), and may override support_rows() with something faster than testing every pair
+class ConstraintRelation:
+    # Whether allows(a, b) == allows(b, a), so the same relation can be used for both arcs of a pair
+    symmetric = False
+
+    def allows(self, value_1, value_2):
+        raise NotImplementedError
+
+    def __contains__(self, pair):
+        return self.allows(pair[0], pair[1])
+
+    # Returns one bitmask per value in values_1 over the value indices in index_2 (value --> index)
+    #   of the values that are allowed alongside it. Used when compiling the problem to bitsets
+    def support_rows(self, values_1, index_2):
+        rows = []
+        for value_1 in values_1:
+            row = 0
+            for value_2, j in index_2.items():
+                if self.allows(value_1, value_2):
+                    row |= 1 << j
+            rows.append(row)
+        return rows
+
+    # Returns the same relation with the order of the two values swapped, for the arc in the other direction
+    def transposed(self):
+        if self.symmetric:
+            return self
+        return TransposedRelation(self)
+
+    # Returns the extensional form of the relation over the given domains: a set of allowed pairs
+    def materialize(self, values_1, values_2):
+        return set((value_1, value_2) for value_1 in values_1 for value_2 in values_2
+                   if self.allows(value_1, value_2))
+
+
+# A relation with its two values swapped: allows(a, b) is the inner relation's allows(b, a)
+class TransposedRelation(ConstraintRelation):
+    def __init__(self, relation):
+        self.relation = relation
+
+    def allows(self, value_1, value_2):
+        return self.relation.allows(value_2, value_1)
+
+    def transposed(self):
+        return self.relation
+
+    def __repr__(self):
+        return f"TransposedRelation({self.relation!r})"
+
+
+# A relation defined by any function predicate(value_1, value_2) --> bool
+# With cache=True every answer is remembered, which helps when the predicate is expensive
+class PredicateRelation(ConstraintRelation):
+    def __init__(self, predicate, symmetric=False, cache=False):
+        self.predicate = predicate
+        self.symmetric = symmetric
+        self.cache = dict() if cache else None
+
+    def allows(self, value_1, value_2):
+        if self.cache is None:
+            return self.predicate(value_1, value_2)
+
+        pair = (value_1, value_2)
+        if pair not in self.cache:
+            self.cache[pair] = self.predicate(value_1, value_2)
+        return self.cache[pair]
+
+    def __repr__(self):
+        return f"PredicateRelation({getattr(self.predicate, '__name__', self.predicate)})"
+
+
+# The two variables must take different values, like neighboring regions in map coloring
+class NotEqualRelation(ConstraintRelation):
+    symmetric = True
+
+    def allows(self, value_1, value_2):
+        return value_1 != value_2
+
+    # Every value of the other variable except the equal one, so each mask is built in O(1) operations
+    def support_rows(self, values_1, index_2):
+        full_mask = (1 << len(index_2)) - 1
+        rows = []
+        for value_1 in values_1:
+            j = index_2.get(value_1)
+            rows.append(full_mask if j is None else full_mask & ~(1 << j))
+        return rows
+
+    def __repr__(self):
+        return "NotEqualRelation()"
@@ -1,19 +1,126 @@
+from bisect import bisect_right
 from collections import deque
+from math import inf
+from operator import add
 import random
-import copy
+import time
 from csp_helper_functions import *
+from ConstraintGraph import ConstraintGraph, SharedRelationConstraints
+from CompiledProblem import CompiledProblem
+from BitsetDomains import BitsetDomains
+from ConflictTable import ConflictTable
+from ConstraintRelation import ConstraintRelation, PredicateRelation
+from AllDifferentConstraint import AllDifferentConstraint
+from ValuePrecedenceConstraint import ValuePrecedenceConstraint
+from LexLeaderConstraint import LexLeaderConstraint
+from SearchStatistics import SearchStatistics
+from NogoodCache import NogoodCache
+from TabuMemory import TabuMemory
 
 # Author: Ben Williams '25
 # Date: October 8th, 2023
 
 
+# Raised inside a search that has used up its node limit (see restarting_solver)
+class SearchLimitReached(Exception):
+    pass
+
+
 class ConstraintSatisfactionProblem:
-    def __init__(self, variables, domains, constraints):
+    # Whether least_constraining_value counts what each value rules out of the neighbors' full domains, instead
+    #   of what is left of them. Problems whose pruned domains mislead it can set this (see CircuitBoardProblem)
+    lcv_full_domains = False
+
+    # Each constraint can be a set of allowed (value_1, value_2) pairs, a ConstraintRelation,
+    #   or a function predicate(value_1, value_2) --> bool, which is wrapped in a PredicateRelation
+    # Subclasses with implicit constraints can pass their own constraint graph instead of having it built
+    #   from the constraints dict (see ConstraintGraph.shared_relation)
+    def __init__(self, variables, domains, constraints, constraint_graph=None):
         self.variables = variables
         self.domains = domains
         self.constraints = constraints
+        if isinstance(constraints, dict):
+            for arc, allowed_pairs in constraints.items():
+                if callable(allowed_pairs) and not isinstance(allowed_pairs, ConstraintRelation):
+                    constraints[arc] = PredicateRelation(allowed_pairs)
         self.total_search_calls = 0
 
+        # What the last solve did, replaced at the start of every solve
+        self.statistics = SearchStatistics()
+        # Set to True to also time the heuristics and the propagation (heuristic_time and propagation_time in the
+        #   statistics). That takes a few clock reads per search node, so it is off unless asked for
+        self.time_phases = False
+        # Optional callbacks for watching a search: on_assign(variable, value) when a value is tried,
+        #   on_backtrack(variable, value) when it is taken back, and on_prune(variable, values) when
+        #   propagation removes values from another variable. Left as None they cost nothing
+        self.on_assign = None
+        self.on_backtrack = None
+        self.on_prune = None
+        # An optional SearchBudget that limits the time and nodes of the solvers, lets another thread cancel
+        #   them, and keeps the best assignment they have seen. Left as None it costs nothing
+        self.budget = None
+        # Where the randomized solvers and heuristics draw their random numbers from. Each problem has its
+        #   own, so solves running side by side (like in async_solver's threads) do not disturb each other's
+        #   streams or the random module's. Replace it with random.Random(seed) to make a solve repeatable
+        self.random = random.Random()
+
+        # Neighbor lists and direct references to each arc's allowed pairs, so that every check
+        #   costs O(degree) instead of O(number of variables)
+        if constraint_graph is None:
+            constraint_graph = ConstraintGraph(len(variables), constraints)
+        self.constraint_graph = constraint_graph
+
+        # Constraints over more than two variables, like AllDifferentConstraint
+        self.global_constraints = []
+
+        # Bitset form of the domains and constraints, only built once a solver asks for it
+        self.compiled = None
+        # An optional CompiledCache the compiled form is loaded from (and saved to), under cache_key()
+        self.compiled_cache = None
+        # The last support found for each (arc, value), used by MAC2001 to skip most support searches
+        self.residues = dict()
+        # Set once variables or constraints are added or removed after the problem was built (see add_variable
+        #   and add_constraint), so it no longer matches its cache_key()
+        self.modified = False
+        # The variables whose constraints were added to or changed, and every variable added or removed, in
+        #   order, since the last warm start (see incremental_solver)
+        self.changed_variables = set()
+        self.change_log = []
+        # constraint_weights[var][other] is how many times the constraint between the two variables wiped
+        #   out a domain during inference. Used by the weighted degree heuristics, and kept between solves
+        self.constraint_weights = [dict() for i in range(len(variables))]
+
+    # Returns the compiled (bitset) representation of the problem, building it on first use
+    # With a compiled_cache, a problem with a cache_key() is loaded from the cache if it was compiled before
+    def compile(self):
+        if self.compiled is None:
+            key = None if self.compiled_cache is None or self.modified else self.cache_key()
+            if key is not None:
+                self.compiled = self.compiled_cache.load(key, self)
+            if self.compiled is None:
+                self.compiled = CompiledProblem(self)
+                if key is not None:
+                    self.compiled_cache.store(key, self.compiled)
+            self.residues = dict()
+        return self.compiled
+
+    # Returns what identifies the problem's domains and binary constraints for the compiled cache, like its
+    #   type and the parameters it was built from, or None if it cannot be cached
+    # Problems built straight from domains and constraints are not cached, since there is nothing cheaper
+    #   to identify them by than the constraints themselves
+    def cache_key(self):
+        return None
+
+    # Replaces every relation in the constraints dict with its set of allowed pairs over the domains
+    # Worth it when a predicate is expensive and the domains are small enough to enumerate
+    def materialize_constraints(self):
+        for (var_1, var_2), allowed_pairs in self.constraints.items():
+            if isinstance(allowed_pairs, ConstraintRelation):
+                self.constraints[(var_1, var_2)] = allowed_pairs.materialize(self.domains[var_1], self.domains[var_2])
+
+        self.constraint_graph = ConstraintGraph(len(self.variables), self.constraints)
+        self.compiled = None
+
     # Recursive solver that tries every possibility until we find one that works
     # Returns a list of assignments if there is a valid solution, and None if there is no solution
     def brute_force_solver(self, variable_index=0, curr_assignment=None):
@@ -43,26 +150,58 @@ class ConstraintSatisfactionProblem:
     # Given an assignment, check if it is valid or not
     # Returns True if valid, False otherwise
     def is_valid_assignment(self, assignment):
-        for (variable, possible_conflict) in self.constraints.keys():
+        for (variable, possible_conflict), allowed_pairs in self.constraints.items():
             # Check if the assignment is in the set of allowed constraints
             assigned_pair = assignment[variable], assignment[possible_conflict]
-            if assigned_pair not in self.constraints[(variable, possible_conflict)]:
+            if assigned_pair not in allowed_pairs:
+                return False
+
+        for constraint in self.global_constraints:
+            # A solution that symmetry breaking would have skipped is still a solution
+            if getattr(constraint, "breaks_symmetry", False):
+                continue
+            if not constraint.is_satisfied(assignment):
                 return False
 
         return True
 
     # Recursive solver that uses backtracking to find a valid assignment
     # It can also use heuristics alongside inference to speed up the search
-    def backtracking_solver(self, assignment=None, domains=None, inference=None, select_variable=None, order_domain=None):
-        self.total_search_calls += 1
-
+    # depth is the number of variables the search has assigned so far, and is only passed by the recursion
+    def backtracking_solver(self, assignment=None, domains=None, inference=None, select_variable=None, order_domain=None,
+                            depth=0):
         # Instantiate the assignment and domains if they don't exist
         if not assignment:
             assignment = [None for i in range(len(self.variables))]
-        if not domains:
-            # Copy the self.domains into domains so that the self.domains is unaltered
-            # We need the copy.deepcopy() because we are copying a list of objects (lists), which takes more effort
-            domains = copy.deepcopy(self.domains)
+        if not isinstance(domains, BitsetDomains):
+            # This is the start of a new solve
+            self.statistics = SearchStatistics()
+            start = time.perf_counter()
+
+            # Bitmask domains built from the compiled problem, so that self.domains is unaltered
+            #   and removing or restoring a value is a single bit operation instead of a list scan
+            if domains is None:
+                domains = self.compile().create_domains()
+            else:
+                domains = self.compile().create_domains(domains)
+
+            # The global constraints can rule the problem out before anything is assigned
+            result = None
+            try:
+                if self.propagate_global_constraints(assignment, domains):
+                    result = self.backtracking_solver(assignment, domains, inference, select_variable, order_domain)
+            finally:
+                self.statistics.solve_time = time.perf_counter() - start
+            return result
+
+        self.total_search_calls += 1
+        statistics = self.statistics
+        statistics.nodes += 1
+        if self.budget is not None:
+            self.count_budget_node(assignment, depth)
+        timing = self.time_phases
+        if timing:
+            heuristic_start = time.perf_counter()
 
         # Select the unassigned variable via the heuristic if it is available
         if select_variable:
@@ -73,6 +212,8 @@ class ConstraintSatisfactionProblem:
 
         # Base case - We could not find an unassigned variable
         if variable is None:
+            if timing:
+                statistics.heuristic_time += time.perf_counter() - heuristic_start
             return assignment
 
         # Use an ordered domain heuristic if it is available
@@ -81,57 +222,643 @@ class ConstraintSatisfactionProblem:
         # Otherwise, just get the domain for the variable (stored in our curr_assignment)
         else:
             variable_domain = domains[variable]
+        if timing:
+            statistics.heuristic_time += time.perf_counter() - heuristic_start
 
         # Loop through all possible values we could assign this variable
+        checks = 0
         for value in variable_domain:
             # Ignore inconsistent values
+            checks += 1
             if not self.is_consistent_value(variable, value, assignment):
                 continue
 
             # Partial assignment of this value
             assignment[variable] = value
-
-            if inference:
-                inference_success, removed_values = inference(variable, value, assignment, domains)
-            # We do not perform any inference, and therefore always continue
-            else:
-                inference_success, removed_values = True, []
+            if self.on_assign is not None:
+                self.on_assign(variable, value)
+            if depth >= statistics.max_depth:
+                statistics.max_depth = depth + 1
+            # Everything pruned from here on is recorded on the trail after this point
+            trail_level = domains.trail_level()
 
             # Either the inference succeeded, or we were not performing it
-            if inference_success:
-                # Prune the domains (will not do anything if there is no inference)
-                remove_from_domains(removed_values, domains)
-
-                result = self.backtracking_solver(assignment, domains, inference, select_variable, order_domain)
+            if self.propagate_assignment(variable, value, assignment, domains, inference):
+                result = self.backtracking_solver(assignment, domains, inference, select_variable, order_domain,
+                                                  depth + 1)
 
                 # If the search was a success
                 if result:
+                    statistics.consistency_checks += checks
                     return result
 
             # Reset the assignment to None, value does not work for this assignment
             assignment[variable] = None
-            # Restore the domains to their original state
-            if removed_values:
-                add_to_domains(removed_values, domains)
-
+            # Restore the domains to their original state by popping the trail back
+            domains.undo(trail_level)
+            if self.on_backtrack is not None:
+                self.on_backtrack(variable, value)
+
+        # Every value failed, so this is a dead end
+        statistics.consistency_checks += checks
+        statistics.backtracks += 1
+        if self.budget is not None:
+            self.budget.offer_partial(assignment, depth)
         return None
 
+    # Counts a search node against the budget. If that stops the search, the assignment (with depth variables
+    #   assigned) is offered as the best so far first, since it is often the deepest the search got
+    def count_budget_node(self, assignment, depth):
+        try:
+            self.budget.count_node(self.statistics)
+        except SearchLimitReached:
+            self.budget.offer_partial(assignment, depth)
+            raise
+
+    # Returns the partial assignment completed by giving each unassigned variable, in order, the value that
+    #   conflicts with the fewest of its assigned neighbors, along with the number of arcs the result violates
+    def complete_assignment(self, partial):
+        assignment = list(partial)
+        graph = self.constraint_graph
+        for variable in range(len(assignment)):
+            if assignment[variable] is not None:
+                continue
+            best_value = None
+            best_conflicts = None
+            for value in self.domains[variable]:
+                num_conflicts = 0
+                for other, allowed_pairs in graph.outgoing_arcs[variable]:
+                    if assignment[other] is not None and (value, assignment[other]) not in allowed_pairs:
+                        num_conflicts += 1
+                for other, allowed_pairs in graph.incoming_arcs[variable]:
+                    if assignment[other] is not None and (assignment[other], value) not in allowed_pairs:
+                        num_conflicts += 1
+                if best_conflicts is None or num_conflicts < best_conflicts:
+                    best_value = value
+                    best_conflicts = num_conflicts
+            assignment[variable] = best_value
+        return assignment, ConflictTable(self, assignment).total_conflicts
+
+    # Runs the inference and the global constraints once the variable has been assigned the value,
+    #   pruning the domains through the trail
+    # Returns False if they found that the assignment cannot be part of a solution
+    def propagate_assignment(self, variable, value, assignment, domains, inference):
+        timing = self.time_phases
+        if timing:
+            start = time.perf_counter()
+        trail_level = domains.trail_level()
+
+        if inference:
+            inference_success, removed_values = inference(variable, value, assignment, domains)
+        # We do not perform any inference, and therefore always continue
+        else:
+            inference_success, removed_values = True, None
+
+        # Prune the domains (inference that already pruned in place returns no values)
+        if inference_success and removed_values:
+            remove_from_domains(removed_values, domains)
+
+        # The global constraints propagate after the binary inference (or on their own without it)
+        if inference_success:
+            inference_success = self.propagate_global_constraints(assignment, domains)
+
+        # Count everything removed from the other variables, including what a failure is about to undo
+        trail = domains.trail
+        if len(trail) > trail_level:
+            values_pruned = 0
+            for i in range(trail_level, len(trail)):
+                pruned_variable, removed_mask = trail[i]
+                if pruned_variable != variable:
+                    values_pruned += removed_mask.bit_count()
+                    if self.on_prune is not None:
+                        self.on_prune(pruned_variable, domains.compiled.mask_to_values(pruned_variable, removed_mask))
+            self.statistics.values_pruned += values_pruned
+
+        if timing:
+            self.statistics.propagation_time += time.perf_counter() - start
+        return inference_success
+
+    # Non-recursive version of the backtracking solver, driven by an explicit stack instead of the call stack
+    # It supports the same hooks and explores values in the same order, so it returns the same assignment
+    #   (and counts the same number of search calls), but is not limited by Python's recursion limit
+    def iterative_backtracking_solver(self, inference=None, select_variable=None, order_domain=None):
+        return next(self.backtracking_search(inference, select_variable, order_domain), None)
+
+    # Lazily yields every solution of the problem (as its own list), stopping after limit solutions if given
+    # Uses the explicit-stack engine, so only the current search path is ever held in memory
+    # The search stops as soon as the limit-th solution is found, instead of looking for one more
+    def iterate_solutions(self, inference=None, select_variable=None, order_domain=None, limit=None):
+        if limit is not None and limit <= 0:
+            return
+        found = 0
+        for assignment in self.backtracking_search(inference, select_variable, order_domain):
+            found += 1
+            yield list(assignment)
+            if limit is not None and found >= limit:
+                return
+
+    # Returns the number of solutions of the problem (up to limit if given) without building any of them
+    def count_solutions(self, inference=None, select_variable=None, order_domain=None, limit=None):
+        if limit is not None and limit <= 0:
+            return 0
+        found = 0
+        for assignment in self.backtracking_search(inference, select_variable, order_domain):
+            found += 1
+            if limit is not None and found >= limit:
+                break
+        return found
+
+    # The explicit-stack search engine behind iterative_backtracking_solver and the solution enumeration
+    # A generator that yields the (live) assignment every time it is complete, and then keeps searching
+    # Each stack frame is [variable, values to try, position of the next value, trail level of the current value]
+    # With node_limit, SearchLimitReached is raised once the search has visited more nodes than that
+    def backtracking_search(self, inference=None, select_variable=None, order_domain=None, node_limit=None):
+        statistics = self.statistics = SearchStatistics()
+        start = time.perf_counter()
+
+        assignment = [None for i in range(len(self.variables))]
+        domains = self.compile().create_domains()
+
+        # The global constraints can rule the problem out before anything is assigned
+        if not self.propagate_global_constraints(assignment, domains):
+            statistics.solve_time = time.perf_counter() - start
+            return
+
+        timing = self.time_phases
+        # The counts are kept in local variables, which cost much less to update than the statistics, and
+        #   written out whenever someone can look at them: at every solution, before every budget check (which
+        #   can report progress), and when the search stops
+        calls_before = self.total_search_calls
+        nodes = backtracks = checks = max_depth = 0
+        stack = []
+        descending = True
+        try:
+            while True:
+                # Same as a call of the recursive solver: pick a variable and push its values
+                if descending:
+                    nodes += 1
+                    if node_limit is not None and nodes > node_limit:
+                        statistics.solve_time = time.perf_counter() - start
+                        raise SearchLimitReached(f"more than {node_limit} search nodes")
+                    if self.budget is not None:
+                        statistics.set_search_counts(nodes, backtracks, checks, max_depth)
+                        self.count_budget_node(assignment, len(stack))
+                    if timing:
+                        heuristic_start = time.perf_counter()
+
+                    if select_variable:
+                        variable = select_variable(assignment, domains)
+                    # Without a heuristic, variables are assigned in order, so start looking after the last one
+                    elif stack:
+                        variable = first_unassigned_variable(assignment, stack[-1][0] + 1)
+                    else:
+                        variable = first_unassigned_variable(assignment)
+
+                    # Every variable is assigned
+                    if variable is None:
+                        if timing:
+                            statistics.heuristic_time += time.perf_counter() - heuristic_start
+                        statistics.set_search_counts(nodes, backtracks, checks, max_depth)
+                        self.total_search_calls = calls_before + nodes
+                        statistics.solve_time = time.perf_counter() - start
+                        yield assignment
+                        # The time the caller spent between solutions does not count
+                        start = time.perf_counter() - statistics.solve_time
+                        descending = False
+                    else:
+                        if order_domain:
+                            variable_domain = order_domain(variable, assignment, domains)
+                        else:
+                            variable_domain = domains.values(variable)
+                        if timing:
+                            statistics.heuristic_time += time.perf_counter() - heuristic_start
+                        stack.append([variable, variable_domain, 0, None])
+
+                # Nothing left to try anywhere
+                if not stack:
+                    statistics.solve_time = time.perf_counter() - start
+                    return
+
+                frame = stack[-1]
+                variable, variable_domain, position, trail_level = frame
+
+                # Undo the value this frame tried last
+                if trail_level is not None:
+                    value = assignment[variable]
+                    assignment[variable] = None
+                    domains.undo(trail_level)
+                    frame[3] = None
+                    if self.on_backtrack is not None:
+                        self.on_backtrack(variable, value)
+
+                # Look for the next value that is consistent and survives inference
+                descending = False
+                while position < len(variable_domain):
+                    value = variable_domain[position]
+                    position += 1
+
+                    checks += 1
+                    if not self.is_consistent_value(variable, value, assignment):
+                        continue
+
+                    assignment[variable] = value
+                    if self.on_assign is not None:
+                        self.on_assign(variable, value)
+                    if len(stack) > max_depth:
+                        max_depth = len(stack)
+                    trail_level = domains.trail_level()
+
+                    if self.propagate_assignment(variable, value, assignment, domains, inference):
+                        frame[3] = trail_level
+                        descending = True
+                        break
+
+                    assignment[variable] = None
+                    domains.undo(trail_level)
+                    if self.on_backtrack is not None:
+                        self.on_backtrack(variable, value)
+
+                frame[2] = position
+
+                # Every value failed, so backtrack to the previous variable
+                if not descending:
+                    stack.pop()
+                    backtracks += 1
+                    if self.budget is not None:
+                        self.budget.offer_partial(assignment, len(stack))
+        finally:
+            statistics.set_search_counts(nodes, backtracks, checks, max_depth)
+            self.total_search_calls = calls_before + nodes
+
+    # Runs the search again and again with a growing limit on the number of nodes, until one run finishes
+    # Each run that hits its limit is abandoned, but what it learned (the constraint weights) is kept, so with a
+    #   randomized or weighted heuristic the next run starts somewhere better instead of in the same bad subtree
+    # The limits are restart_base times the Luby sequence, or restart_base * growth^i for the "geometric" policy
+    # Either way they grow without bound, so the search stays complete. Returns the assignment or None
+    def restarting_solver(self, inference=None, select_variable=None, order_domain=None, restart_policy="luby",
+                          restart_base=100, growth=1.5, max_restarts=None):
+        total_statistics = SearchStatistics()
+        restart = 0
+        result = None
+        while True:
+            # The last allowed run has no limit
+            if max_restarts is not None and restart >= max_restarts:
+                node_limit = None
+            elif restart_policy == "luby":
+                node_limit = restart_base * luby(restart + 1)
+            elif restart_policy == "geometric":
+                node_limit = int(restart_base * growth ** restart)
+            else:
+                raise ValueError(f"unknown restart policy {restart_policy!r}")
+
+            try:
+                result = next(self.backtracking_search(inference, select_variable, order_domain, node_limit), None)
+                total_statistics.add(self.statistics)
+                break
+            except SearchLimitReached:
+                total_statistics.add(self.statistics)
+                # Only the limit of this run is ours to handle; a used up budget stops the whole solve
+                if self.budget is not None and self.budget.stop_reason is not None:
+                    self.statistics = total_statistics
+                    raise
+                total_statistics.restarts += 1
+                restart += 1
+
+        self.statistics = total_statistics
+        return None if result is None else list(result)
+
+    # Backtracking with conflict-directed backjumping: every failure records the earlier assignments it was
+    #   caused by, and once a variable runs out of values the search jumps straight back to the most recent
+    #   of them, instead of re-exploring the unrelated variables assigned in between
+    # Takes the same hooks as the other backtracking solvers. With nogood_cache_size, each conflict is also
+    #   learned as a nogood (kept in a NogoodCache of that many) and values that would complete one are skipped
+    # A value pruned by the inference is explained by every assignment up to the one whose propagation pruned it,
+    #   which is right for any inference, but only a plain consistency failure points at a single culprit
+    # Conflict sets are bitmasks over the depths of the assignments (the first assigned variable is depth 1)
+    def backjumping_solver(self, inference=None, select_variable=None, order_domain=None, nogood_cache_size=0):
+        statistics = self.statistics = SearchStatistics()
+        start = time.perf_counter()
+
+        assignment = [None for i in range(len(self.variables))]
+        domains = self.compile().create_domains()
+        domains.track_removals()
+        if not self.propagate_global_constraints(assignment, domains):
+            statistics.solve_time = time.perf_counter() - start
+            return None
+
+        nogoods = NogoodCache(nogood_cache_size) if nogood_cache_size else None
+        depth_of = [0 for i in range(len(self.variables))]
+
+        # Each stack frame is [variable, values to try, position of the next value,
+        #   trail level of the current value, conflict set]
+        stack = []
+        # The trail levels of the frames that have a current value, which are always the bottom ones, in order
+        # They only ever grow with the depth, so the depth that made a removal can be found by bisecting them
+        levels = []
+        result = None
+        timing = self.time_phases
+        # Counted in local variables like in backtracking_search
+        calls_before = self.total_search_calls
+        nodes = backtracks = checks = max_depth = 0
+        descending = True
+        try:
+            while True:
+                if descending:
+                    nodes += 1
+                    if self.budget is not None:
+                        statistics.set_search_counts(nodes, backtracks, checks, max_depth)
+                        self.count_budget_node(assignment, len(stack))
+                    if timing:
+                        heuristic_start = time.perf_counter()
+
+                    if select_variable:
+                        variable = select_variable(assignment, domains)
+                    elif stack:
+                        variable = first_unassigned_variable(assignment, stack[-1][0] + 1)
+                    else:
+                        variable = first_unassigned_variable(assignment)
+
+                    if variable is None:
+                        if timing:
+                            statistics.heuristic_time += time.perf_counter() - heuristic_start
+                        result = assignment
+                        break
+
+                    if order_domain:
+                        variable_domain = order_domain(variable, assignment, domains)
+                    else:
+                        variable_domain = domains.values(variable)
+                    if timing:
+                        statistics.heuristic_time += time.perf_counter() - heuristic_start
+
+                    # The values pruned before we got here count against the assignments that pruned them
+                    stack.append([variable, variable_domain, 0, None, self.pruning_conflict(variable, domains, levels)])
+
+                frame = stack[-1]
+                variable, variable_domain, position, trail_level, conflict = frame
+                depth = len(stack)
+
+                if trail_level is not None:
+                    value = assignment[variable]
+                    assignment[variable] = None
+                    domains.undo(trail_level)
+                    frame[3] = None
+                    levels.pop()
+                    if self.on_backtrack is not None:
+                        self.on_backtrack(variable, value)
+
+                descending = False
+                while position < len(variable_domain):
+                    value = variable_domain[position]
+                    position += 1
+
+                    checks += 1
+                    culprit = self.conflicting_variable(variable, value, assignment)
+                    if culprit is not None:
+                        conflict |= 1 << depth_of[culprit]
+                        continue
+
+                    if nogoods is not None:
+                        nogood = nogoods.violated(variable, value, assignment)
+                        if nogood is not None:
+                            statistics.nogood_hits += 1
+                            for other, other_value in nogood:
+                                if other != variable:
+                                    conflict |= 1 << depth_of[other]
+                            continue
+
+                    assignment[variable] = value
+                    depth_of[variable] = depth
+                    if self.on_assign is not None:
+                        self.on_assign(variable, value)
+                    if depth > max_depth:
+                        max_depth = depth
+                    trail_level = domains.trail_level()
+
+                    if self.propagate_assignment(variable, value, assignment, domains, inference):
+                        frame[3] = trail_level
+                        levels.append(trail_level)
+                        descending = True
+                        break
+
+                    # Propagation can depend on every earlier assignment
+                    conflict |= (1 << depth) - 2
+                    assignment[variable] = None
+                    domains.undo(trail_level)
+                    if self.on_backtrack is not None:
+                        self.on_backtrack(variable, value)
+
+                frame[2] = position
+                frame[4] = conflict
+                if descending:
+                    continue
+
+                # Every value failed. If nothing assigned is to blame, there is no solution at all
+                backtracks += 1
+                if self.budget is not None:
+                    self.budget.offer_partial(assignment, depth - 1)
+                if conflict == 0:
+                    break
+
+                # Jump back to the most recent assignment in the conflict set, dropping everything after it
+                target = conflict.bit_length() - 1
+
+                # The assignments in the conflict set cannot all be part of a solution
+                if nogoods is not None:
+                    literals = [(stack[i - 1][0], assignment[stack[i - 1][0]]) for i in mask_indices(conflict)]
+                    nogoods.add(frozenset(literals), literals[-1])
+                    statistics.nogoods_learned += 1
+
+                if target < depth - 1:
+                    statistics.backjumps += 1
+                stack.pop()
+                while len(stack) > target:
+                    skipped_variable = stack.pop()[0]
+                    levels.pop()
+                    skipped_value = assignment[skipped_variable]
+                    assignment[skipped_variable] = None
+                    if self.on_backtrack is not None:
+                        self.on_backtrack(skipped_variable, skipped_value)
+
+                # The target's current value failed for the rest of the conflict set
+                stack[-1][4] |= conflict & ~(1 << target)
+        finally:
+            statistics.set_search_counts(nodes, backtracks, checks, max_depth)
+            self.total_search_calls = calls_before + nodes
+
+        statistics.solve_time = time.perf_counter() - start
+        return result
+
+    # Returns the conflict set explaining the values pruned from the variable's domain so far
+    # Pruning happens in chronological order on the trail, so only the variable's latest removal matters:
+    #   it was made at some depth, and its explanation is every assignment up to that depth
+    # levels are the trail levels of the assigned depths, in order, and the domains have to track removals
+    def pruning_conflict(self, variable, domains, levels):
+        if domains.masks[variable] == domains.compiled.full_masks[variable]:
+            return 0
+
+        i = domains.last_removal[variable]
+        if i < 0:
+            return 0
+        # The depth whose propagation made the removal (0 means it was pruned before the search)
+        depth = bisect_right(levels, i)
+        return (1 << (depth + 1)) - 2
+
+    # Solves a problem whose constraint graph is a forest in time linear in the number of variables
+    # Raises a ValueError if the constraints have a cycle (see cycle_cutset_solver for those)
+    def tree_solver(self):
+        return self.cycle_cutset_solver(cutset=())
+
+    # Cycle cutset conditioning: every consistent assignment of the cutset variables is tried in turn, and
+    #   the rest of the problem, which is a forest once the cutset is assigned, is solved by tree_solve
+    # Costs d^c tree solves for c cutset variables, so it is meant for near-trees. Without a cutset, a
+    #   small one is found greedily (see ConstraintGraph.cycle_cutset)
+    # Only binary constraints are used; symmetry breaking constraints are left out, which is still correct
+    def cycle_cutset_solver(self, cutset=None):
+        for constraint in self.global_constraints:
+            if not getattr(constraint, "breaks_symmetry", False):
+                raise ValueError("the tree and cycle cutset solvers only handle binary constraints")
+
+        statistics = self.statistics = SearchStatistics()
+        start = time.perf_counter()
+        compiled = self.compile()
+
+        if cutset is None:
+            cutset = self.constraint_graph.cycle_cutset()
+        cutset = sorted(cutset)
+        order = self.constraint_graph.forest_order(cutset)
+        statistics.max_depth = len(cutset)
+
+        assignment = [None for i in range(len(self.variables))]
+        result = None
+        for unused in self.cutset_assignments(cutset, assignment):
+            self.total_search_calls += 1
+            statistics.nodes += 1
+            if self.budget is not None:
+                self.budget.count_node(statistics)
+
+            # Every forest variable starts with only the values its assigned cutset neighbors allow
+            masks = list(compiled.full_masks)
+            for variable in cutset:
+                i = compiled.value_index[variable][assignment[variable]]
+                for other in compiled.neighbors[variable]:
+                    masks[other] &= compiled.supports[(variable, other)][i]
+
+            if self.tree_solve(order, masks, assignment):
+                result = assignment
+                break
+            statistics.backtracks += 1
+
+        statistics.solve_time = time.perf_counter() - start
+        return result
+
+    # Yields every time the cutset variables hold a new assignment that is consistent among themselves
+    # The values are left in the assignment; they are cleared again once every assignment has been yielded
+    def cutset_assignments(self, cutset, assignment):
+        if not cutset:
+            yield
+            return
+
+        # The values of each cutset variable still to be tried
+        stack = [iter(self.domains[cutset[0]])]
+        while stack:
+            variable = cutset[len(stack) - 1]
+            assignment[variable] = None
+            for value in stack[-1]:
+                self.statistics.consistency_checks += 1
+                if self.is_consistent_value(variable, value, assignment):
+                    assignment[variable] = value
+                    break
+
+            if assignment[variable] is None:
+                stack.pop()
+            elif len(stack) == len(cutset):
+                yield
+            else:
+                stack.append(iter(self.domains[cutset[len(stack)]]))
+
+    # Solves the forest given as (variable, parent) pairs in breadth-first order, with each variable's
+    #   remaining value indices in masks (which are pruned in place)
+    # Directional arc consistency from the leaves up leaves every parent value with a support in each child,
+    #   so the values can then be picked from the roots down without ever backtracking
+    # Returns True with the forest variables set in the assignment, or False if there is no solution
+    def tree_solve(self, order, masks, assignment):
+        compiled = self.compiled
+        statistics = self.statistics
+
+        for i in range(len(order) - 1, -1, -1):
+            variable, parent = order[i]
+            if masks[variable] == 0:
+                return False
+            if parent is None:
+                continue
+
+            statistics.revisions += 1
+            variable_mask = masks[variable]
+            supports = compiled.supports[(parent, variable)]
+            for j in mask_indices(masks[parent]):
+                if supports[j] & variable_mask == 0:
+                    masks[parent] ^= 1 << j
+                    statistics.values_pruned += 1
+
+        for variable, parent in order:
+            mask = masks[variable]
+            if parent is not None:
+                mask &= compiled.supports[(parent, variable)][compiled.value_index[parent][assignment[parent]]]
+            assignment[variable] = compiled.values[variable][(mask & -mask).bit_length() - 1]
+        return True
+
+    # Returns a new problem over only the given variables, renumbered from 0 in the order given, with the
+    #   constraints among them and the global constraints that can be carried over (see renumbered)
+    # The variables should be closed under constraints, like one of the constraint graph's connected components,
+    #   unless the constraints to the rest are already accounted for, like by giving domains (the domains of
+    #   the given variables, in order) that only hold values that fit the rest of an assignment
+    def subproblem(self, variables, domains=None):
+        if domains is None:
+            domains = [self.domains[variable] for variable in variables]
+        number = {variable: i for i, variable in enumerate(variables)}
+        constraints = dict()
+        for variable in variables:
+            for other, allowed_pairs in self.constraint_graph.outgoing_arcs[variable]:
+                if other in number:
+                    constraints[(number[variable], number[other])] = allowed_pairs
+
+        problem = ConstraintSatisfactionProblem([i for i in range(len(variables))], domains, constraints)
+        for constraint in self.global_constraints:
+            renumbered = constraint.renumbered(number)
+            if renumbered is not None:
+                problem.global_constraints.append(renumbered)
+        return problem
+
     # Checks if this value that we are assigning this variable is consistent with our current assignment
     # Returns True if consistent, False otherwise
     def is_consistent_value(self, variable, value, assignment):
-        for assigned_var in range(len(assignment)):
+        # Only variables with a constraint (assigned_var, variable) can make this value illegal
+        for assigned_var, allowed_pairs in self.constraint_graph.incoming_arcs[variable]:
             # Ignore currently unassigned values
-            if assignment[assigned_var] is None:
+            assigned_value = assignment[assigned_var]
+            if assigned_value is None:
                 continue
 
             # Check for an illegal assignment
-            if (assigned_var, variable) in self.constraints.keys():
-                if (assignment[assigned_var], value) not in self.constraints[(assigned_var, variable)]:
-                    return False
+            if (assigned_value, value) not in allowed_pairs:
+                return False
 
-        # None of the assignments are illegal
         return True
 
+    # Same check as is_consistent_value, but returns the first assigned variable the value conflicts with,
+    #   or None if it is consistent
+    def conflicting_variable(self, variable, value, assignment):
+        for assigned_var, allowed_pairs in self.constraint_graph.incoming_arcs[variable]:
+            assigned_value = assignment[assigned_var]
+            if assigned_value is None:
+                continue
+
+            if (assigned_value, value) not in allowed_pairs:
+                return assigned_var
+
+        return None
+
     # Returns the stored number of search calls and resets it to zero
     def get_and_reset_search_calls(self):
         search_calls = self.total_search_calls
@@ -142,8 +869,7 @@ class ConstraintSatisfactionProblem:
     def MAC3(self, variable, value, assignment, domains):
         queue = deque()
         # Add all (neighbor, variable) pairs to the queue for unassigned neighbors
-        variable_neighbors = self.get_neighbors(variable)
-        for neighbor in variable_neighbors:
+        for neighbor in self.get_neighbors(variable):
             if assignment[neighbor] is not None:
                 queue.append((neighbor, variable))
 
@@ -155,6 +881,7 @@ class ConstraintSatisfactionProblem:
             # If we are removing every single value from the neighbor's domain
             if len(total_remove_list[arc[0]]) == len(domains[arc[0]]):
                 # If there are no possible values for the variable arc[0] that satisfy the arc
+                self.increase_constraint_weight(arc[0], arc[1])
                 return False, None
 
         # There are still valid assignments for all the neighbors
@@ -163,6 +890,14 @@ class ConstraintSatisfactionProblem:
     # Used in inference to modify the domains of var_1 given var_2, where var_2 already has an assignment
     # Returns a list of values to be removed
     def MAC3_revise_domains(self, var_1, var_2, domains, value):
+        self.statistics.revisions += 1
+
+        # With bitmask domains the revision is a single AND against the supports of var_2's value
+        if isinstance(domains, BitsetDomains):
+            compiled = domains.compiled
+            supported = compiled.supports[(var_2, var_1)][compiled.value_index[var_2][value]]
+            return compiled.mask_to_values(var_1, domains.masks[var_1] & ~supported)
+
         remove_list = []
         # We may delete values in domains[var_1]
         for i in range(len(domains[var_1]) - 1, -1, -1):
@@ -171,115 +906,505 @@ class ConstraintSatisfactionProblem:
                 remove_list.append(domains[var_1][i])
         return remove_list
 
+    # Adds a global constraint that the given variables all take different values
+    # With a key function, it is key(value) that has to be different for each of them
+    # Global constraints are propagated by the backtracking solvers; they should be redundant with the
+    #   binary constraints if local search is used, since it only counts binary conflicts
+    def add_all_different(self, variables, key=None):
+        constraint = AllDifferentConstraint(variables, key)
+        self.global_constraints.append(constraint)
+        return constraint
+
+    # Adds a symmetry breaking constraint that the values are interchangeable: the variables, in order,
+    #   have to use each of them for the first time in the order they are listed (see ValuePrecedenceConstraint)
+    def add_value_precedence(self, variables, values):
+        constraint = ValuePrecedenceConstraint(variables, values)
+        self.global_constraints.append(constraint)
+        return constraint
+
+    # Adds a symmetry breaking constraint that the assignment is lexicographically no greater than its copy
+    #   under the symmetry, a function (variable, value) --> (variable, value) (see LexLeaderConstraint)
+    def add_lex_leader(self, variables, symmetry):
+        constraint = LexLeaderConstraint(variables, symmetry)
+        self.global_constraints.append(constraint)
+        return constraint
+
+    # Adds a variable with the given domain and no constraints, numbered after every other, and returns it
+    # Everything built from the problem (the constraint graph and the compiled problem) is updated in place
+    def add_variable(self, domain):
+        variable = len(self.variables)
+        self.variables.append(variable)
+        self.domains.append(domain)
+        self.constraint_graph.add_variable()
+        self.constraint_weights.append(dict())
+        if self.compiled is not None:
+            self.compiled.add_variable(domain)
+
+        self.modified = True
+        self.changed_variables.add(variable)
+        self.change_log.append(("add", variable))
+        return variable
+
+    # Removes the variable along with its constraints. To keep the variables numbered 0 to n - 1, the last
+    #   variable takes its number, like removing from a list by swapping in the last element
+    # Global constraints only keep their other variables, and symmetry breaking ones that relied on the
+    #   variable are dropped
+    # Returns the old number of the variable that took the removed one's number, or None if it was the last
+    def remove_variable(self, variable):
+        for other in list(self.constraint_graph.neighbors[variable]):
+            self.remove_constraint(variable, other)
+
+        last = len(self.variables) - 1
+        global_constraints = []
+        for constraint in self.global_constraints:
+            if variable in constraint.variables or last in constraint.variables:
+                number = {other: other for other in constraint.variables if other != variable}
+                if last in number:
+                    number[last] = variable
+                constraint = constraint.renumbered(number)
+            if constraint is not None:
+                global_constraints.append(constraint)
+        self.global_constraints = global_constraints
+
+        if last != variable:
+            # Everything about the last variable moves to the removed one's number
+            for other in self.constraint_graph.neighbors[last]:
+                for arc, new_arc in (((last, other), (variable, other)), ((other, last), (other, variable))):
+                    self.residues.pop(arc, None)
+                    if isinstance(self.constraints, dict) and arc in self.constraints:
+                        self.constraints[new_arc] = self.constraints.pop(arc)
+                if last in self.constraint_weights[other]:
+                    self.constraint_weights[other][variable] = self.constraint_weights[other].pop(last)
+            self.constraint_weights[variable] = self.constraint_weights[last]
+            self.domains[variable] = self.domains[last]
+        if self.compiled is not None:
+            self.compiled.move_last_variable(variable)
+        self.constraint_graph.move_last_variable(variable)
+        self.variables.pop()
+        self.domains.pop()
+        self.constraint_weights.pop()
+
+        self.modified = True
+        self.changed_variables.discard(variable)
+        if last in self.changed_variables:
+            self.changed_variables.discard(last)
+            self.changed_variables.add(variable)
+        self.change_log.append(("remove", variable))
+        return last if last != variable else None
+
+    # Adds the constraint between the two variables in both directions, replacing any already between them
+    # allowed_pairs can be anything the constructor takes. The reverse arc gets its transpose, unless given
+    # Only the masks of the two arcs are compiled again
+    # Problems whose constraints are all one shared relation (like a map's "colors differ") can only gain
+    #   more of that relation, and problems with fully implicit constraints (like N-Queens) cannot change
+    def add_constraint(self, var_1, var_2, allowed_pairs, reverse=None):
+        if callable(allowed_pairs) and not isinstance(allowed_pairs, ConstraintRelation):
+            allowed_pairs = PredicateRelation(allowed_pairs)
+        if reverse is None:
+            if isinstance(allowed_pairs, ConstraintRelation):
+                reverse = allowed_pairs.transposed()
+            else:
+                reverse = set((value_2, value_1) for value_1, value_2 in allowed_pairs)
+        elif callable(reverse) and not isinstance(reverse, ConstraintRelation):
+            reverse = PredicateRelation(reverse)
+
+        if isinstance(self.constraints, dict):
+            self.constraints[(var_1, var_2)] = allowed_pairs
+            self.constraints[(var_2, var_1)] = reverse
+            self.constraint_graph.add_arc(var_1, var_2, allowed_pairs)
+            self.constraint_graph.add_arc(var_2, var_1, reverse)
+        elif isinstance(self.constraints, SharedRelationConstraints):
+            self.constraint_graph.add_arc(var_1, var_2, allowed_pairs)
+        else:
+            raise ValueError("the constraints of this problem are implicit and cannot be changed")
+
+        self.constraints_changed(var_1, var_2)
+        self.changed_variables.add(var_1)
+        self.changed_variables.add(var_2)
+
+    # Removes the constraints between the two variables, in both directions
+    def remove_constraint(self, var_1, var_2):
+        if isinstance(self.constraints, dict):
+            self.constraints.pop((var_1, var_2), None)
+            self.constraints.pop((var_2, var_1), None)
+            self.constraint_graph.remove_arc(var_1, var_2)
+            self.constraint_graph.remove_arc(var_2, var_1)
+        elif isinstance(self.constraints, SharedRelationConstraints):
+            self.constraint_graph.remove_arc(var_1, var_2)
+        else:
+            raise ValueError("the constraints of this problem are implicit and cannot be changed")
+
+        self.constraints_changed(var_1, var_2)
+        self.constraint_weights[var_1].pop(var_2, None)
+        self.constraint_weights[var_2].pop(var_1, None)
+
+    # Brings what was built from the constraints between the two variables up to date
+    def constraints_changed(self, var_1, var_2):
+        self.residues.pop((var_1, var_2), None)
+        self.residues.pop((var_2, var_1), None)
+        if self.compiled is not None:
+            self.compiled.update_arcs(self.constraints, var_1, var_2)
+        self.modified = True
+
+    # Lets every global constraint prune the domains (through the trail)
+    # Returns False as soon as one of them cannot be satisfied
+    def propagate_global_constraints(self, assignment, domains):
+        for constraint in self.global_constraints:
+            if not constraint.propagate(assignment, domains):
+                return False
+        return True
+
+    # Returns the number of arc revisions and pruned values in the statistics, and resets them to zero
+    def get_and_reset_propagation_counts(self):
+        counts = self.statistics.revisions, self.statistics.values_pruned
+        self.statistics.revisions = 0
+        self.statistics.values_pruned = 0
+        return counts
+
+    # Maintaining arc consistency with AC-2001 style residual supports
+    # Unlike MAC3, every revision that shrinks a domain re-enqueues the arcs pointing at that variable,
+    #   so the pruning propagates through the unassigned variables until it reaches a fixpoint
+    # Requires the bitmask domains the backtracking solver uses, and prunes them in place through the trail,
+    #   so it never has removed values to return (the solver undoes the trail if this fails)
+    def MAC2001(self, variable, value, assignment, domains):
+        compiled = domains.compiled
+
+        # The assigned variable is reduced to its value
+        domains.remove_mask(variable, ~(1 << compiled.value_index[variable][value]))
+
+        queue = deque()
+        for neighbor in compiled.neighbors[variable]:
+            if assignment[neighbor] is None:
+                queue.append((neighbor, variable))
+        queued = set(queue)
+
+        while len(queue) > 0:
+            arc = queue.popleft()
+            queued.discard(arc)
+            var_1, var_2 = arc
+
+            if self.AC2001_revise(var_1, var_2, domains, compiled):
+                # The domain was wiped out, so this assignment cannot be part of a solution
+                if domains.masks[var_1] == 0:
+                    self.increase_constraint_weight(var_1, var_2)
+                    return False, None
+
+                # var_1 lost values, so its unassigned neighbors may have lost their supports
+                for neighbor in compiled.neighbors[var_1]:
+                    if neighbor != var_2 and assignment[neighbor] is None and (neighbor, var_1) not in queued:
+                        queue.append((neighbor, var_1))
+                        queued.add((neighbor, var_1))
+
+        return True, None
+
+    # Removes the values of var_1 that have no support left in var_2's domain
+    # Returns True if any value was removed
+    def AC2001_revise(self, var_1, var_2, domains, compiled):
+        self.statistics.revisions += 1
+        rows = compiled.supports[(var_1, var_2)]
+        if (var_1, var_2) not in self.residues:
+            self.residues[(var_1, var_2)] = [-1 for i in range(len(rows))]
+        residues = self.residues[(var_1, var_2)]
+
+        mask_2 = domains.masks[var_2]
+        removed_mask = 0
+        for i in mask_indices(domains.masks[var_1]):
+            # The last support we found is still there, so there is nothing to search for
+            if residues[i] >= 0 and (mask_2 >> residues[i]) & 1:
+                continue
+
+            supported = rows[i] & mask_2
+            if supported:
+                residues[i] = (supported & -supported).bit_length() - 1
+            else:
+                removed_mask |= 1 << i
+
+        if removed_mask:
+            domains.remove_mask(var_1, removed_mask)
+            return True
+        return False
+
+    # Makes the constraint between the two variables heavier, after it wiped out a domain
+    def increase_constraint_weight(self, var_1, var_2):
+        weights = self.constraint_weights
+        weights[var_1][var_2] = weights[var_1].get(var_2, 0) + 1
+        weights[var_2][var_1] = weights[var_2].get(var_1, 0) + 1
+
+    # Forgets every constraint weight learned so far
+    def reset_constraint_weights(self):
+        self.constraint_weights = [dict() for i in range(len(self.variables))]
+
+    # Returns the weighted degree of the variable: its constraints with unassigned variables, each counted
+    #   as one plus the number of wipeouts it has caused
+    def weighted_degree_of(self, variable, assignment):
+        weights = self.constraint_weights[variable]
+        weighted_degree = 0
+        for other in self.constraint_graph.neighbors[variable]:
+            if assignment[other] is None:
+                weighted_degree += 1 + weights.get(other, 0)
+        return weighted_degree
+
+    # Variable selection (wdeg): the unassigned variable with the highest weighted degree, so the search
+    #   starts with the variables that keep being involved in failures. Ties are broken randomly
+    def weighted_degree(self, assignment, domains):
+        best_weight = -1
+        tied = []
+        for variable in range(len(assignment)):
+            if assignment[variable] is None:
+                weight = self.weighted_degree_of(variable, assignment)
+                if weight > best_weight:
+                    best_weight = weight
+                    tied = [variable]
+                elif weight == best_weight:
+                    tied.append(variable)
+
+        return self.random.choice(tied) if tied else None
+
+    # Variable selection: MRV with ties broken at random (see csp_helper_functions), drawing from this problem's
+    #   random numbers
+    def randomized_minimum_remaining_values(self, assignment, domains):
+        return randomized_minimum_remaining_values(assignment, domains, self.random)
+
+    # Variable selection (dom/wdeg): the unassigned variable with the smallest domain size over weighted degree,
+    #   which combines MRV with what has been learned from failures. Ties are broken randomly
+    def domain_over_weighted_degree(self, assignment, domains):
+        best_ratio = None
+        tied = []
+        for variable in range(len(assignment)):
+            if assignment[variable] is None:
+                # A variable with no unassigned neighbors constrains nothing, so it can wait until the end
+                weight = self.weighted_degree_of(variable, assignment)
+                ratio = len(domains[variable]) / weight if weight > 0 else inf
+                if best_ratio is None or ratio < best_ratio:
+                    best_ratio = ratio
+                    tied = [variable]
+                elif ratio == best_ratio:
+                    tied.append(variable)
+
+        return self.random.choice(tied) if tied else None
+
     # Returns a list of neighbors of the given variable
     def get_neighbors(self, variable):
-        variable_neighbors = []
-        for other_var in self.variables:
-            if (other_var, variable) in self.constraints.keys():
-                variable_neighbors.append(other_var)
-        return variable_neighbors
+        return [other_var for other_var, allowed_pairs in self.constraint_graph.incoming_arcs[variable]]
 
     # Sorts the possible values for the variable into a list from least-constraining to most-constraining
     def least_constraining_value(self, variable, assignment, domains):
+        # With bitmask domains, each unassigned neighbor's values that conflict with each value are counted by
+        #   the compiled problem, which keeps the counts up to date as the neighbor's domain changes (see
+        #   CompiledProblem.conflict_counts). A neighbor's values left alongside a value are its domain size
+        #   minus those, and the size is the same for every value, so fewer conflicts orders the same as more
+        #   values left
+        if isinstance(domains, BitsetDomains):
+            compiled = domains.compiled
+            masks = domains.masks
+            neighbor_masks = compiled.full_masks if self.lcv_full_domains else masks
+            conflicts = [0 for i in range(len(compiled.values[variable]))]
+            for other_var, allowed_pairs in self.constraint_graph.outgoing_arcs[variable]:
+                if assignment[other_var] is None:
+                    conflicts = list(map(add, conflicts, compiled.conflict_counts(variable, other_var,
+                                                                                  neighbor_masks[other_var])))
+
+            value_indices = list(mask_indices(masks[variable]))
+            num_available = [-conflicts[i] for i in value_indices]
+            variable_values = [compiled.values[variable][i] for i in value_indices]
+        else:
+            num_available = self.count_available_values(variable, assignment, domains)
+            variable_values = list(domains[variable])
+
+        # Get the sorted indices for the ordered domain
+        indexes = [i for i in range(len(variable_values))]
+        indexes.sort(key=num_available.__getitem__)
+
+        # Get the actual values in the right spots
+        ordered_domain = list(map(variable_values.__getitem__, indexes))
+
+        # We want it to be from high --> low
+        ordered_domain.reverse()
+        return ordered_domain
+
+    # Returns, for each value in the variable's (list) domain, how many values of its unassigned neighbors'
+    #   domains are still allowed alongside it
+    def count_available_values(self, variable, assignment, domains):
+        neighbor_domains = self.domains if self.lcv_full_domains else domains
         num_available = [0 for i in range(len(domains[variable]))]
-        for other_var in self.variables:
+        # Only the neighbors of the variable can have their options reduced by it
+        for other_var, allowed_pairs in self.constraint_graph.outgoing_arcs[variable]:
             index = 0
 
             # If we only want to consider constraints with non-assigned variables
             if assignment[other_var] is not None:
                 continue
 
-            # If these variables are not neighbors
-            if (variable, other_var) not in self.constraints.keys():
-                continue
-
             # Loop through all value combinations
             for value in domains[variable]:
-                for other_value in domains[other_var]:
+                for other_value in neighbor_domains[other_var]:
                     # If this pair is allowed
-                    if (value, other_value) in self.constraints[(variable, other_var)]:
+                    if (value, other_value) in allowed_pairs:
                         num_available[index] += 1
                 index += 1
 
-        # Get the sorted indices for the ordered domain
-        indexes = [i for i in range(len(domains[variable]))]
-        indexes.sort(key=num_available.__getitem__)
-
-        # Get the actual values in the right spots
-        ordered_domain = list(map(domains[variable].__getitem__, indexes))
-
-        # We want it to be from high --> low
-        ordered_domain.reverse()
-        return ordered_domain
+        return num_available
 
     # Calls a local search using min-conflicts and a random-walk
     # Returns a valid assignment (if found) and the number of iterations it took to find it
-    def local_search(self, max_iters, use_visited=False, print_iters=False):
+    # With use_visited, the search is a tabu search (see TabuMemory): a variable may not go back to a value it
+    #   left in the last tabu_tenure iterations, nor may a move lead back to a recently visited assignment, so
+    #   it always moves to the best allowed value even when that is worse. A tabu move is still taken if it
+    #   leaves the variable without conflicts
+    # A plateau is plateau_limit iterations (by default 10 per variable) without beating the fewest conflicts
+    #   seen since the last restart. On one, walk_steps (by default one per conflicted variable) conflicted
+    #   variables get random values; if max_walks walks in a row do not lead anywhere better, the search
+    #   restarts from a new random assignment. Restarts and walks are counted in the statistics
+    # With a budget, the assignment with the fewest violated arcs is kept in it, so running out of iterations
+    #   or budget still leaves an answer. It is only copied when the search is about to move away from it
+    def local_search(self, max_iters, use_visited=False, print_iters=False, tabu_tenure=10, plateau_limit=None,
+                     walk_steps=None, max_walks=3):
+        statistics = self.statistics = SearchStatistics()
+        start = time.perf_counter()
+        budget = self.budget
+        if plateau_limit is None:
+            plateau_limit = 10 * len(self.variables)
+
         # First we generate a random assignment from each variable's domain
-        assignment = [random.choice(self.domains[i]) for i in range(len(self.variables))]
-        conflicted_variables = self.get_conflicted_variables(assignment)
+        assignment = [self.random.choice(self.domains[i]) for i in range(len(self.variables))]
+        # Conflict counts that are updated incrementally as single variables change value
+        conflicts = ConflictTable(self, assignment)
 
         # If by some miracle our random assignment worked
-        if not conflicted_variables:
+        if conflicts.is_solved():
+            if budget is not None:
+                budget.offer_complete(assignment, 0)
+            statistics.solve_time = time.perf_counter() - start
             return assignment, 0
 
-        # Do not re-visit recently revisited states (tabu search)
-        recently_visited = [[] for i in range(2)]
+        # Do not re-visit recently moved away from values or recently visited states (tabu search)
+        tabu = None
+        if use_visited:
+            tabu = TabuMemory(assignment, tabu_tenure, max(100, tabu_tenure * len(self.variables)), self.random)
+
+        # The fewest conflicts since the last restart, when that was reached, and the walks since
+        best_conflicts = conflicts.total_conflicts
+        last_improvement = 0
+        walks = 0
+        # The fewest conflicts of the whole search, and whether the current assignment has that many without
+        #   having been offered to the budget yet
+        fewest_conflicts = best_conflicts
+        at_fewest = True
 
         # The total number of iterations
         curr_iters = 0
 
-        # While there is a conflicting variable
-        while len(conflicted_variables) > 0:
-            if curr_iters > max_iters:
-                if print_iters:
-                    print("Maximum number of iterations reached")
-                return None, curr_iters
-
-            curr_iters += 1
-            # Randomly select the variable
-            variable = random.choice(conflicted_variables)
-
-            # Assign the value that violates the fewest constraints
-            # We break ties randomly
-            least_constraining_values = self.violates_least_constraints(variable, assignment)
-            assignment[variable] = random.choice(least_constraining_values)
-
-            # Do not revisit recently seen states, and switch it up to avoid plateaus or local minima
-            if use_visited:
-                if assignment in recently_visited:
-                    switch_up = random.choice(self.variables)
-                    assignment[switch_up] = random.choice(self.domains[switch_up])
+        try:
+            # While there is a conflicting variable
+            while not conflicts.is_solved():
+                if curr_iters > max_iters:
+                    if print_iters:
+                        print("Maximum number of iterations reached")
+                    if budget is not None and at_fewest:
+                        budget.offer_complete(assignment, fewest_conflicts)
+                    statistics.solve_time = time.perf_counter() - start
+                    return None, curr_iters
+
+                curr_iters += 1
+                statistics.iterations = curr_iters
+                if budget is not None:
+                    budget.count_node(statistics)
+                # Randomly select the variable
+                variable = conflicts.random_conflicted_variable()
+                old_value = assignment[variable]
+
+                # Assign the value that violates the fewest constraints
+                # We break ties randomly
+                if tabu is None:
+                    value = self.random.choice(self.violates_least_constraints(variable, assignment))
+                else:
+                    value = self.best_non_tabu_value(variable, assignment, tabu, curr_iters)
+                    tabu.moved(variable, old_value, value, curr_iters)
+                conflicts.assign(variable, value)
+
+                if conflicts.total_conflicts < fewest_conflicts:
+                    fewest_conflicts = conflicts.total_conflicts
+                    at_fewest = True
+                elif conflicts.total_conflicts > fewest_conflicts and at_fewest:
+                    # Offer the assignment from before the move, which had the fewest conflicts
+                    if budget is not None:
+                        assignment[variable] = old_value
+                        budget.offer_complete(assignment, fewest_conflicts)
+                        assignment[variable] = value
+                    at_fewest = False
+
+                if conflicts.total_conflicts < best_conflicts:
+                    best_conflicts = conflicts.total_conflicts
+                    last_improvement = curr_iters
+                    walks = 0
+                    continue
+                if curr_iters - last_improvement < plateau_limit:
+                    continue
 
-                recently_visited.pop()
-                recently_visited.insert(0, assignment)
-            conflicted_variables = self.get_conflicted_variables(assignment)
+                # Stuck on a plateau or in a local minimum, so switch it up
+                last_improvement = curr_iters
+                if budget is not None and at_fewest:
+                    budget.offer_complete(assignment, fewest_conflicts)
+                at_fewest = False
+                if walks < max_walks:
+                    walks += 1
+                    statistics.random_walks += 1
+                    steps = len(conflicts.conflicted_variables) if walk_steps is None else walk_steps
+                    for i in range(steps):
+                        if conflicts.is_solved():
+                            break
+                        switch_up = conflicts.random_conflicted_variable()
+                        old_value = assignment[switch_up]
+                        conflicts.assign(switch_up, self.random.choice(self.domains[switch_up]))
+                        if tabu is not None:
+                            tabu.moved(switch_up, old_value, assignment[switch_up], curr_iters)
+                else:
+                    walks = 0
+                    statistics.restarts += 1
+                    assignment = [self.random.choice(self.domains[i]) for i in range(len(self.variables))]
+                    conflicts = ConflictTable(self, assignment)
+                    if tabu is not None:
+                        tabu.reset(assignment)
+                    best_conflicts = conflicts.total_conflicts
+
+                if conflicts.total_conflicts < fewest_conflicts:
+                    fewest_conflicts = conflicts.total_conflicts
+                    at_fewest = True
+        except SearchLimitReached:
+            if budget is not None and at_fewest:
+                budget.offer_complete(assignment, fewest_conflicts)
+            statistics.solve_time = time.perf_counter() - start
+            raise
 
         if print_iters:
             print("Total loops", curr_iters)
 
+        if budget is not None:
+            budget.offer_complete(assignment, 0)
+        statistics.solve_time = time.perf_counter() - start
         return assignment, curr_iters
 
-    # Returns a list of values that all conflict the least amount possible
-    def violates_least_constraints(self, variable, assignment):
+    # Returns the number of constraints (to the variable's neighbors) each value of the variable would violate
+    def value_conflicts(self, variable, assignment):
         num_conflicts = [0 for i in range(len(self.domains[variable]))]
         index = 0
         # Loop through all possible values
+        arcs = self.constraint_graph.outgoing_arcs[variable]
+        self.statistics.constraint_lookups += len(arcs) * len(self.domains[variable])
         for value in self.domains[variable]:
-            # Check other values in the (complete) assignment
-            for other_var in range(len(assignment)):
-                if other_var == variable:
-                    continue
-
-                if (variable, other_var) not in self.constraints.keys():
-                    continue
-
+            # Check the neighbors' values in the (complete) assignment
+            for other_var, allowed_pairs in arcs:
                 # If this value violates a constraint between these two variables
-                if (value, assignment[other_var]) not in self.constraints[(variable, other_var)]:
+                if (value, assignment[other_var]) not in allowed_pairs:
                     num_conflicts[index] += 1
 
             index += 1
 
+        return num_conflicts
+
+    # Returns a list of values that all conflict the least amount possible
+    def violates_least_constraints(self, variable, assignment):
+        num_conflicts = self.value_conflicts(variable, assignment)
         min_conflicts = min(num_conflicts)
 
         # How long can I make it?
@@ -288,23 +1413,42 @@ class ConstraintSatisfactionProblem:
 
         return best_values
 
+    # Returns a random one of the other values of the variable that conflict the least among those that are
+    #   not tabu, or that leave the variable without conflicts. Keeps the current value if every move is tabu
+    def best_non_tabu_value(self, variable, assignment, tabu, iteration):
+        num_conflicts = self.value_conflicts(variable, assignment)
+        current_value = assignment[variable]
+
+        best_values = []
+        min_conflicts = None
+        for i, value in enumerate(self.domains[variable]):
+            if value == current_value:
+                continue
+            if num_conflicts[i] > 0 and tabu.is_tabu(variable, current_value, value, iteration):
+                continue
+            if min_conflicts is None or num_conflicts[i] < min_conflicts:
+                min_conflicts = num_conflicts[i]
+                best_values = [value]
+            elif num_conflicts[i] == min_conflicts:
+                best_values.append(value)
+
+        if not best_values:
+            return current_value
+        return self.random.choice(best_values)
+
     # Returns a list of all the conflicted variables in the assignment
     def get_conflicted_variables(self, assignment):
         conflicted_variables = set()
 
-        # Check all pairs
+        # Check every constrained pair once through the neighbor index
         for var_1 in range(len(assignment)):
-            for var_2 in range(len(assignment)):
+            for var_2, allowed_pairs in self.constraint_graph.outgoing_arcs[var_1]:
                 # To speed this up a bit
-                if var_1 in conflicted_variables or var_2 in conflicted_variables:
-                    continue
-
-                # If these variables are not neighbors
-                if (var_1, var_2) not in self.constraints.keys():
+                if var_1 in conflicted_variables and var_2 in conflicted_variables:
                     continue
 
                 # If the variables conflict
-                if (assignment[var_1], assignment[var_2]) not in self.constraints[(var_1, var_2)]:
+                if (assignment[var_1], assignment[var_2]) not in allowed_pairs:
                     conflicted_variables.add(var_1)
                     conflicted_variables.add(var_2)
 
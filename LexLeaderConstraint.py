@@ -0,0 +1,90 @@
+# A symmetry breaking constraint for one symmetry of the problem, like a rotation of the N-Queens board
+# The symmetry maps each (variable, value) assignment to the (variable, value) it becomes, so it also maps a
+#   whole assignment to its symmetric copy. Reading the variables in order, the assignment has to be no
+#   greater than its copy (values are compared with <). Adding one of these for every symmetry of a group
+#   leaves only the least assignment of each set of equivalent solutions
+class LexLeaderConstraint:
+    # Symmetry breaking constraints remove equivalent solutions rather than wrong ones, so is_valid_assignment
+    #   does not hold an assignment to them
+    breaks_symmetry = True
+
+    def __init__(self, variables, symmetry):
+        self.variables = list(variables)
+        self.symmetry = symmetry
+
+    # Returns the constraint over the variables numbered as in number (old variable --> new variable), or None
+    #   if some of its variables are not there, since the symmetry then does not hold within the subproblem
+    def renumbered(self, number):
+        if any(variable not in number for variable in self.variables):
+            return None
+        return LexLeaderConstraint([number[variable] for variable in self.variables],
+                                   RenumberedSymmetry(self.symmetry, number))
+
+    # Returns the symmetric copy of the assigned part of the assignment, as variable --> value
+    def symmetric_values(self, assignment):
+        image = dict()
+        for variable in self.variables:
+            if assignment[variable] is not None:
+                image_variable, image_value = self.symmetry(variable, assignment[variable])
+                image[image_variable] = image_value
+        return image
+
+    # Returns False if the assignment is already certain to be greater than its symmetric copy
+    def is_satisfied(self, assignment):
+        image = self.symmetric_values(assignment)
+        for variable in self.variables:
+            value, image_value = assignment[variable], image.get(variable)
+            if value is None or image_value is None or value < image_value:
+                return True
+            if value > image_value:
+                return False
+        return True
+
+    # Compares the assignment with its copy up to the first variable that is not decided yet, and prunes that
+    #   variable's values that would make the assignment greater
+    # Returns False if the assignment is already greater, or the pruning leaves nothing
+    def propagate(self, assignment, domains):
+        compiled = domains.compiled
+        image = self.symmetric_values(assignment)
+
+        for variable in self.variables:
+            image_value = image.get(variable)
+            if image_value is None:
+                return True
+
+            value = assignment[variable]
+            if value is None:
+                values = compiled.values[variable]
+                greater_mask = 0
+                for i in range(len(values)):
+                    if values[i] > image_value:
+                        greater_mask |= 1 << i
+                domains.remove_mask(variable, greater_mask)
+
+                # With only the copy's value left, the two are equal here and the comparison goes on
+                mask = domains.masks[variable]
+                if mask == 0:
+                    return False
+                if mask & (mask - 1) or values[mask.bit_length() - 1] != image_value:
+                    return True
+                continue
+
+            if value < image_value:
+                return True
+            if value > image_value:
+                return False
+
+        return True
+
+
+# A symmetry of the original variables applied to renumbered ones, as used by a renumbered LexLeaderConstraint
+# A class rather than a closure, so subproblems can be pickled and sent to worker processes
+class RenumberedSymmetry:
+    def __init__(self, symmetry, number):
+        self.symmetry = symmetry
+        self.number = number
+        self.old_variable = {new: old for old, new in number.items()}
+
+    def __call__(self, variable, value):
+        image_variable, image_value = self.symmetry(self.old_variable[variable], value)
+        return self.number[image_variable], image_value
@@ -1,4 +1,6 @@
 from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
+from ConstraintGraph import ConstraintGraph, SharedRelationConstraints
+from ConstraintRelation import NotEqualRelation
 from map_coloring_helper_functions import *
 # Author: Ben Williams '25
 # Date: October 8th, 2023
@@ -6,22 +8,68 @@ from map_coloring_helper_functions import *
 
 # An implementation of the k-coloring map problem as an inheritance of a
 #   constraint satisfaction problem
+# The map can be a map file or a DIMACS .col graph file (see load_graph)
 class MapColoringProblem(ConstraintSatisfactionProblem):
-    def __init__(self, map_file, num_colors):
-        # Get the variables, their neighbors, and the references for the names
-        variables, neighbors = parse_map_file(map_file)
+    # With use_all_different, every clique of three or more neighboring regions also gets an
+    #   AllDifferent global constraint, so running out of colors is noticed as soon as it is certain
+    # With symmetry_breaking, colors are used for the first time in order (see ValuePrecedenceConstraint),
+    #   so only one of the num_colors! renamings of each coloring is searched
+    def __init__(self, map_file, num_colors, use_all_different=False, symmetry_breaking=False):
+        self.map_file = map_file
+        self.num_colors = num_colors
+        # The borders, kept as flat arrays rather than a list of neighbors per region
+        self.graph = load_graph(map_file)
+        variables = [i for i in range(len(self.graph))]
 
         # All places on the map have the same domain
-        domain = [[i for i in range(num_colors)] for j in range(len(variables))]
+        # Each domain is a range rather than a list, so building them takes O(n) time and memory
+        domain = [range(num_colors) for j in range(len(variables))]
 
-        # Build the constraints
-        constraints = dict()
-        for variable in variables:
-            for neighbor in neighbors[variable]:
-                constraints[(variable, neighbor)] = set()
-                all_pair_tuples(constraints[variable, neighbor], domain[variable])
+        # Every border shares the same "colors differ" check, so no color pairs are enumerated
+        self.color_relation = NotEqualRelation()
+        neighbors = self.graph.neighbor_lists()
+        constraints = SharedRelationConstraints(neighbors, self.color_relation)
+        constraint_graph = ConstraintGraph.shared_relation(neighbors, self.color_relation)
 
-        super().__init__(variables, domain, constraints)
+        super().__init__(variables, domain, constraints, constraint_graph)
 
+        if use_all_different:
+            for clique in find_cliques(self.graph):
+                self.add_all_different(clique)
 
+        if symmetry_breaking:
+            self.add_value_precedence(variables, range(num_colors))
 
+    # Adds a region with no borders yet and returns its variable
+    def add_region(self, name=None):
+        variable = self.add_variable(range(self.num_colors))
+        if self.graph.names is not None:
+            self.graph.names.append(str(variable + 1) if name is None else name)
+        return variable
+
+    # Removes the region and its borders. The last region takes its variable (see remove_variable), and the
+    #   old variable of that region is returned, or None if the removed one was the last
+    def remove_region(self, variable):
+        # Regions that are only numbered are named after their number, which is about to change
+        if self.graph.names is None:
+            self.graph.names = [self.graph.name_of(region) for region in range(len(self.variables))]
+        moved = self.remove_variable(variable)
+        if moved is not None:
+            self.graph.names[variable] = self.graph.names[moved]
+        self.graph.names.pop()
+        return moved
+
+    # The borders only change the constraint graph; self.graph stays the map as it was loaded
+    def add_border(self, region_1, region_2):
+        self.add_constraint(region_1, region_2, self.color_relation)
+
+    def remove_border(self, region_1, region_2):
+        self.remove_constraint(region_1, region_2)
+
+    # The compiled problem depends on the contents of the map file (wherever it is) and the number of colors
+    def cache_key(self):
+        return "MapColoringProblem", file_digest(self.map_file), self.num_colors
+
+    # Returns the assignment with every region's name, for printing
+    def named_assignment(self, assignment):
+        return {self.graph.name_of(variable): assignment[variable] for variable in range(len(assignment))}
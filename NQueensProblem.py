@@ -1,97 +1,83 @@
 from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
+from ConstraintGraph import ConstraintGraph, OtherVariables
+from ConstraintRelation import ConstraintRelation
 
 # Author: Ben Williams '25
 # Date: October 15th, 2023
 
 
 class NQueensProblem(ConstraintSatisfactionProblem):
-    def __init__(self, num_queens):
+    # With use_all_different, the rows and both diagonals are also added as AllDifferent global constraints,
+    #   which prune far more than the pairwise checks do on their own
+    # With symmetry_breaking, every solution has to be lexicographically least among its rotations and
+    #   reflections (see LexLeaderConstraint), so only one of up to 8 equivalent boards is searched
+    def __init__(self, num_queens, use_all_different=False, symmetry_breaking=False):
         self.variables = [i for i in range(num_queens)]
         # Define the domains by giving each queen a column
         # This makes constraints simpler, as we only need to worry about the horizontal and diagonal
-        self.domains = [[j * num_queens + i for j in range(num_queens)] for i in range(num_queens)]
+        # Each domain is a range rather than a list, so building them takes O(n) time and memory
+        self.domains = [range(i, num_queens * num_queens, num_queens) for i in range(num_queens)]
 
         # Not necessary since we can use len(self.variables), but makes for more readable code
         self.board_width = num_queens
         self.board_height = num_queens
 
-        self.constraints = dict()
-        # Really just looping through all the queens
-        for var in range(len(self.variables)):
-            self.add_queen_constraints(var)
-
-        super().__init__(self.variables, self.domains, self.constraints)
-
-    # Add all the constraints for one queen
-    def add_queen_constraints(self, var):
-        column = self.domains[var][0]
-        for location in self.domains[var]:
-            defending_locations = set()
-
-            # Add all horizontal spaces that the queen defends
-            for horizontal in range(self.board_width):
-                defending_locations.add(location + horizontal - column)
+        # Every pair of queens shares the same arithmetic "does not attack" check,
+        #   so nothing is enumerated: no pair sets and no per-arc entries
+        self.queen_relation = QueenRelation(num_queens)
+        self.constraints = QueenConstraints(num_queens, self.queen_relation)
 
-            # Add all the diagonals
-            defending_locations = defending_locations.union(self.get_diagonals_threatened(location))
+        # Every queen is a neighbor of every other queen
+        neighbors = [OtherVariables(num_queens, var) for var in range(num_queens)]
+        constraint_graph = ConstraintGraph.shared_relation(neighbors, self.queen_relation)
 
-            # Loop through all locations on the board, and add relevant constraints
-            for other_loc in range(self.board_width * self.board_height):
-                relevant_queen = other_loc % self.board_width
-                if relevant_queen == var:
-                    continue
-
-                if other_loc not in defending_locations:
-                    if (var, relevant_queen) not in self.constraints.keys():
-                        self.constraints[(var, relevant_queen)] = set()
-                    self.constraints[(var, relevant_queen)].add((location, other_loc))
-
-    # Given a location, return a set of all the diagonal spaces that would be threatened by a queen
-    def get_diagonals_threatened(self, location):
-        column = location % self.board_width
-        diagonals = set()
+        super().__init__(self.variables, self.domains, self.constraints, constraint_graph)
 
-        col_pos = self.board_height - column
-        col_neg = column
-        # How many rows are below us, or positive as far as the index goes
-        for row_pos in range(self.board_height - location // self.board_width):
-            if row_pos == 0:
-                continue
+        if use_all_different:
+            self.add_all_different(self.variables, self.row_of)
+            self.add_all_different(self.variables, self.diagonal_of)
+            self.add_all_different(self.variables, self.anti_diagonal_of)
 
-            # We are looking farther down than necessary
-            if row_pos > col_pos and row_pos > col_neg:
-                break
+        if symmetry_breaking:
+            for symmetry in self.board_symmetries():
+                self.add_lex_leader(self.variables, symmetry)
 
-            # Add bottom-right
-            if row_pos <= col_pos:
-                diagonal = location + row_pos + (row_pos * self.board_width)
-                diagonals.add(diagonal)
+    # The seven rotations and reflections of the board besides leaving it alone, as symmetries of queen
+    #   assignments
+    def board_symmetries(self):
+        return [QueenSymmetry(self.board_width, transform) for transform in range(QueenSymmetry.num_transforms)]
 
-            # Add bottom-left
-            if row_pos <= col_neg:
-                diagonal = location - row_pos + (row_pos * self.board_width)
-                diagonals.add(diagonal)
+    # The compiled problem only depends on the size of the board
+    def cache_key(self):
+        return "NQueensProblem", self.board_width
 
-        # How many rows are above us, or negative as the index goes
-        for row_neg in range(location // self.board_width + 1):
-            if row_neg == 0:
-                continue
+    # The row of a location
+    def row_of(self, location):
+        return location // self.board_width
 
-            # We are looking farther up than necessary
-            if row_neg > col_pos and row_neg > col_neg:
-                break
+    # Which down-right diagonal a location is on
+    def diagonal_of(self, location):
+        return location // self.board_width - location % self.board_width
 
-            # Add top-right
-            if row_neg <= col_pos:
-                diagonal = location + row_neg - (row_neg * self.board_width)
-                diagonals.add(diagonal)
+    # Which down-left diagonal a location is on
+    def anti_diagonal_of(self, location):
+        return location // self.board_width + location % self.board_width
 
-            # Add top-left
-            if row_neg <= col_neg:
-                diagonal = location - row_neg - (row_neg * self.board_width)
-                diagonals.add(diagonal)
-
-        return diagonals
+    # Checks a complete assignment by counting queens per row and diagonal, in O(n) instead of checking all pairs
+    def is_valid_assignment(self, assignment):
+        rows = set()
+        diagonals = set()
+        anti_diagonals = set()
+        for location in assignment:
+            if location is None:
+                return False
+            row, column = divmod(location, self.board_width)
+            if row in rows or row - column in diagonals or row + column in anti_diagonals:
+                return False
+            rows.add(row)
+            diagonals.add(row - column)
+            anti_diagonals.add(row + column)
+        return True
 
     # Illustrate an assignment with the queens on the board
     def illustrate_solution(self, assignment):
@@ -112,9 +98,112 @@ class NQueensProblem(ConstraintSatisfactionProblem):
             print(row_str)
 
 
+# The constraint between any two queens: they may not share a row or a diagonal
+# Locations are row * n + column, so the check is a little arithmetic instead of a set lookup
+class QueenRelation(ConstraintRelation):
+    # Not attacking each other does not depend on which queen is first
+    symmetric = True
+
+    def __init__(self, num_queens):
+        self.num_queens = num_queens
+
+    def allows(self, location_1, location_2):
+        row_1, column_1 = divmod(location_1, self.num_queens)
+        row_2, column_2 = divmod(location_2, self.num_queens)
+        return row_1 != row_2 and abs(row_1 - row_2) != abs(column_1 - column_2)
+
+    # Builds the support masks used by the compiled problem directly, in O(n) per queen pair
+    # A queen only attacks three squares of another column, so each mask is the full mask minus those bits
+    def support_rows(self, values_1, index_2):
+        full_mask = (1 << len(index_2)) - 1
+        column_2 = next(iter(index_2)) % self.num_queens if index_2 else 0
+        rows = []
+        for location in values_1:
+            row, column = divmod(location, self.num_queens)
+            distance = abs(column - column_2)
+            mask = full_mask
+            for attacked_row in (row, row - distance, row + distance):
+                j = index_2.get(attacked_row * self.num_queens + column_2)
+                if 0 <= attacked_row < self.num_queens and j is not None:
+                    mask &= ~(1 << j)
+            rows.append(mask)
+        return rows
+
+    def __repr__(self):
+        return f"QueenRelation({self.num_queens})"
+
+
+# One rotation or reflection of the board as a symmetry of queen assignments (see LexLeaderConstraint): the
+#   queen of a column moves to the transformed location, which makes it the queen of the transformed column
+# The transform is stored by number rather than as a function, so problems that break symmetry can still be
+#   pickled and sent to worker processes
+class QueenSymmetry:
+    num_transforms = 7
+
+    def __init__(self, num_queens, transform):
+        self.num_queens = num_queens
+        self.transform = transform
+        self.last = num_queens - 1
+
+    def __call__(self, queen, location):
+        row, column = self.transform_square(*divmod(location, self.num_queens))
+        return column, row * self.num_queens + column
+
+    # Where the transform moves a (row, column) square
+    def transform_square(self, row, column):
+        last = self.last
+        if self.transform == 0:
+            return column, last - row
+        if self.transform == 1:
+            return last - row, last - column
+        if self.transform == 2:
+            return last - column, row
+        if self.transform == 3:
+            return row, last - column
+        if self.transform == 4:
+            return last - row, column
+        if self.transform == 5:
+            return column, row
+        return last - column, last - row
+
+    def __repr__(self):
+        return f"QueenSymmetry({self.num_queens}, {self.transform})"
+
+
+# The constraints of the problem as a read-only mapping of (queen, other_queen) --> QueenRelation
+# It answers the same questions as the old dict of pair sets, but stores nothing per arc
+class QueenConstraints:
+    def __init__(self, num_queens, relation):
+        self.num_queens = num_queens
+        self.relation = relation
+
+    def __contains__(self, arc):
+        return arc[0] != arc[1] and 0 <= arc[0] < self.num_queens and 0 <= arc[1] < self.num_queens
+
+    def __getitem__(self, arc):
+        if arc not in self:
+            raise KeyError(arc)
+        return self.relation
+
+    def __len__(self):
+        return self.num_queens * (self.num_queens - 1)
+
+    def __iter__(self):
+        for var_1 in range(self.num_queens):
+            for var_2 in range(self.num_queens):
+                if var_1 != var_2:
+                    yield var_1, var_2
+
+    def keys(self):
+        return self
+
+    def items(self):
+        return ((arc, self.relation) for arc in self)
+
+
 if __name__ == "__main__":
     four_qp = NQueensProblem(4)
-    print(four_qp.domains[0])
+    print(list(four_qp.domains[0]))
     print(four_qp.constraints[(0, 1)])
     solution = four_qp.backtracking_solver()
     print(solution)
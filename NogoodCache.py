@@ -0,0 +1,52 @@
+from collections import OrderedDict
+
+
+# A bounded store of learned nogoods: sets of (variable, value) assignments that cannot all hold in a solution
+# When it is full, the nogood that has gone unused the longest is evicted
+# Each nogood is watched under a single one of its assignments, normally the one made last, and is only
+#   checked when that assignment is about to be made again. A nogood completed in a different order is
+#   missed, which costs some pruning but never correctness, and keeps each check short
+class NogoodCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        # Nogood (a frozenset of (variable, value) pairs) --> None, least recently used first
+        self.nogoods = OrderedDict()
+        # Nogood --> the (variable, value) it is watched under, and (variable, value) --> the nogoods watched there
+        self.watched_literal = dict()
+        self.watches = dict()
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    # Stores a nogood watched under the given (variable, value) of it, evicting the least recently used
+    #   nogood if the cache is full
+    def add(self, nogood, watched_literal):
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+
+        if len(self.nogoods) >= self.max_size:
+            self.evict()
+
+        self.nogoods[nogood] = None
+        self.watched_literal[nogood] = watched_literal
+        self.watches.setdefault(watched_literal, set()).add(nogood)
+
+    def evict(self):
+        nogood, unused = self.nogoods.popitem(last=False)
+        watched_literal = self.watched_literal.pop(nogood)
+        watching = self.watches[watched_literal]
+        watching.discard(nogood)
+        if not watching:
+            del self.watches[watched_literal]
+        self.evictions += 1
+
+    # Returns a stored nogood that assigning the value to the variable would complete, or None
+    # Every other assignment of the nogood has to already hold in the (partial) assignment
+    def violated(self, variable, value, assignment):
+        for nogood in self.watches.get((variable, value), ()):
+            if all(assignment[other] == other_value for other, other_value in nogood if other != variable):
+                self.nogoods.move_to_end(nogood)
+                return nogood
+        return None
@@ -0,0 +1,101 @@
+import threading
+import time
+from ConstraintSatisfactionProblem import SearchLimitReached
+
+
+# How long a solve may run, and a way to stop it from another thread
+# Set as ConstraintSatisfactionProblem.budget, every solver calls count_node once per search node (or local
+#   search step), which raises SearchLimitReached once the time or node limit is used up or cancel() was
+#   called. Nothing is interrupted mid-step, so the problem is always left in a usable state
+# Every progress_interval seconds, progress(report) is called from the solving thread with the elapsed time,
+#   the nodes so far, the best result so far, and the statistics
+# The solvers also keep the best assignment they have seen here, so a solve that runs out of budget still
+#   has an answer (see best_result): local search keeps the complete assignment with the fewest violated
+#   arcs, and backtracking the deepest partial assignment it reached
+class SearchBudget:
+    def __init__(self, time_limit=None, node_limit=None, progress=None, progress_interval=1.0):
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.cancelled = threading.Event()
+
+        self.start_time = None
+        self.next_progress = None
+        # Nodes counted over every solve run under this budget, like all the runs of a restarting search
+        self.nodes = 0
+        # Why the budget stopped the search ("time", "nodes" or "cancelled"), or None while it has not
+        self.stop_reason = None
+
+        # The best assignment seen, how many arcs it violates (None for a partial one), and how many
+        #   variables it assigns
+        self.best_assignment = None
+        self.best_conflicts = None
+        self.best_depth = -1
+
+    # Starts the clock. Called by the first count_node if nobody started it before
+    def start(self):
+        self.start_time = time.perf_counter()
+        if self.progress is not None:
+            self.next_progress = self.start_time + self.progress_interval
+
+    # Asks the search to stop at its next node. Safe to call from any thread
+    def cancel(self):
+        self.cancelled.set()
+
+    def elapsed(self):
+        if self.start_time is None:
+            return 0.0
+        return time.perf_counter() - self.start_time
+
+    # Counts one search node, and stops the search if the budget is used up
+    def count_node(self, statistics):
+        if self.start_time is None:
+            self.start()
+        self.nodes += 1
+
+        if self.cancelled.is_set():
+            self.stop("cancelled")
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            self.stop("nodes")
+        if self.time_limit is not None or self.next_progress is not None:
+            now = time.perf_counter()
+            if self.time_limit is not None and now - self.start_time > self.time_limit:
+                self.stop("time")
+            if self.next_progress is not None and now >= self.next_progress:
+                self.next_progress = now + self.progress_interval
+                self.progress(self.report(statistics))
+
+    def stop(self, reason):
+        self.stop_reason = reason
+        raise SearchLimitReached(f"search budget used up ({reason})")
+
+    # Keeps a copy of a partial assignment with the given number of variables assigned, if that is more than
+    #   any before it
+    def offer_partial(self, assignment, depth):
+        if self.best_conflicts is None and depth > self.best_depth:
+            self.best_assignment = list(assignment)
+            self.best_depth = depth
+
+    # Keeps a copy of a complete assignment that violates the given number of arcs, if that is fewer than any
+    #   before it. Complete assignments always beat partial ones
+    def offer_complete(self, assignment, conflicts):
+        if self.best_conflicts is None or conflicts < self.best_conflicts:
+            self.best_assignment = list(assignment)
+            self.best_conflicts = conflicts
+            self.best_depth = len(assignment)
+
+    # Returns the best assignment seen as a complete assignment and the number of arcs it violates
+    # A partial assignment is completed by giving each unassigned variable its least conflicting value
+    # Returns (None, None) if the search never got anywhere
+    def best_result(self, problem):
+        if self.best_assignment is None:
+            return None, None
+        if self.best_conflicts is None:
+            self.best_assignment, self.best_conflicts = problem.complete_assignment(self.best_assignment)
+        return self.best_assignment, self.best_conflicts
+
+    # What the progress callback gets
+    def report(self, statistics):
+        return {"elapsed": self.elapsed(), "nodes": self.nodes, "best_depth": self.best_depth,
+                "best_conflicts": self.best_conflicts, "statistics": statistics.as_dict()}
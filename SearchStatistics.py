@@ -0,0 +1,61 @@
+# What a single solve did, filled in by the solvers as they go
+# Every solver call starts a fresh one in ConstraintSatisfactionProblem.statistics, so it can be read
+#   (or kept) once the solve returns. Times are in seconds
+class SearchStatistics:
+    def __init__(self):
+        # Search nodes (the same thing total_search_calls counts) and dead ends backed out of
+        self.nodes = 0
+        self.backtracks = 0
+        # Values checked against the assignment by the backtracking solvers, and the arcs local search looked up
+        self.consistency_checks = 0
+        self.constraint_lookups = 0
+        # Arc revisions done by the inference, and the values that propagation removed from other variables
+        self.revisions = 0
+        self.values_pruned = 0
+        # The most variables assigned at once
+        self.max_depth = 0
+        # Conflict-directed backjumping: jumps over at least one variable, and learned nogoods stored and used
+        self.backjumps = 0
+        self.nogoods_learned = 0
+        self.nogood_hits = 0
+        # Time spent choosing variables and ordering values, and time spent in inference and global constraints
+        # Only measured when the problem's time_phases is set
+        self.heuristic_time = 0.0
+        self.propagation_time = 0.0
+        # Local search steps, restarts, and random walks off a plateau
+        self.iterations = 0
+        self.restarts = 0
+        self.random_walks = 0
+        self.solve_time = 0.0
+
+    # Sets the counts that a search keeps in local variables while it runs (see backtracking_search)
+    def set_search_counts(self, nodes, backtracks, consistency_checks, max_depth):
+        self.nodes = nodes
+        self.backtracks = backtracks
+        self.consistency_checks = consistency_checks
+        self.max_depth = max_depth
+
+    # Adds the counts and times of another solve (like one run of a restarting search) into these
+    def add(self, other):
+        for name, value in vars(other).items():
+            if name == "max_depth":
+                self.max_depth = max(self.max_depth, value)
+            else:
+                setattr(self, name, getattr(self, name) + value)
+
+    # Builds the statistics back from as_dict(), like the statistics a worker process reported
+    @classmethod
+    def from_dict(cls, values):
+        statistics = cls()
+        for name, value in values.items():
+            setattr(statistics, name, value)
+        return statistics
+
+    # Returns the statistics as a plain dict, for printing or writing out as JSON
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value:.4g}" if isinstance(value, float) else f"{name}={value}"
+                           for name, value in vars(self).items())
+        return f"SearchStatistics({fields})"
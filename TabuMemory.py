@@ -0,0 +1,69 @@
+from collections import deque
+
+
+# The short term memory of a tabu local search
+# Every complete assignment has a Zobrist hash: the xor of a random 64-bit key per (variable, value). Changing
+#   one variable only swaps one key for another, so the hash of the current assignment (and of the assignment
+#   any single move would lead to) is kept in O(1) per move instead of hashing the whole assignment
+# Two things are tabu for a while:
+#   - moves back: once a variable leaves a value, giving it that value again is tabu for tenure iterations
+#   - states: the hashes of the last max_states assignments are kept in a set, so returning to one is caught
+#     in O(1). Two different assignments sharing a hash is possible but very unlikely, and only costs a move
+class TabuMemory:
+    # The keys are drawn from rng, a random.Random
+    def __init__(self, assignment, tenure, max_states, rng):
+        self.tenure = tenure
+        self.rng = rng
+        self.max_states = max_states
+        # (variable, value) --> its random key, made the first time it is needed
+        self.keys = dict()
+        # (variable, value) --> the iteration until which giving the variable that value is tabu
+        self.tabu_until = dict()
+        # The hashes of the most recent assignments, oldest first, and hash --> times it is in that window
+        self.recent_states = deque()
+        self.state_counts = dict()
+        self.reset(assignment)
+
+    # Starts over from a new assignment (like after a restart), forgetting which moves are tabu
+    # The recently visited states are kept, since going back to one is still a waste
+    def reset(self, assignment):
+        self.hash = 0
+        for variable, value in enumerate(assignment):
+            self.hash ^= self.key(variable, value)
+        self.tabu_until.clear()
+        self.remember()
+
+    def key(self, variable, value):
+        key = self.keys.get((variable, value))
+        if key is None:
+            key = self.keys[(variable, value)] = self.rng.getrandbits(64)
+        return key
+
+    # The hash the assignment would have after changing the variable from old_value to value
+    def hash_after(self, variable, old_value, value):
+        return self.hash ^ self.key(variable, old_value) ^ self.key(variable, value)
+
+    # Returns True if giving the variable the value (from old_value) is tabu at this iteration: either the
+    #   variable left that value too recently, or the move goes back to a recently visited assignment
+    def is_tabu(self, variable, old_value, value, iteration):
+        if self.tabu_until.get((variable, value), -1) >= iteration:
+            return True
+        return self.hash_after(variable, old_value, value) in self.state_counts
+
+    # Records that the variable changed from old_value to value at this iteration
+    def moved(self, variable, old_value, value, iteration):
+        if old_value == value:
+            return
+        self.hash = self.hash_after(variable, old_value, value)
+        self.tabu_until[(variable, old_value)] = iteration + self.tenure
+        self.remember()
+
+    # Adds the current assignment to the recently visited ones, forgetting the oldest if there are too many
+    def remember(self):
+        self.recent_states.append(self.hash)
+        self.state_counts[self.hash] = self.state_counts.get(self.hash, 0) + 1
+        if len(self.recent_states) > self.max_states:
+            oldest = self.recent_states.popleft()
+            self.state_counts[oldest] -= 1
+            if self.state_counts[oldest] == 0:
+                del self.state_counts[oldest]
@@ -0,0 +1,95 @@
+# A symmetry breaking constraint for interchangeable values, like the colors of a map
+# Going through the variables in order, each of the values can only be used once the value before it has
+#   been used by an earlier variable: the first variable gets values[0], the first variable that is not
+#   values[0] gets values[1], and so on. Of every solution that only differs by renaming the values, exactly
+#   one passes, so the search never explores the other k! - 1 copies of a subtree
+# Values that are not in the list are left alone
+class ValuePrecedenceConstraint:
+    # Symmetry breaking constraints remove equivalent solutions rather than wrong ones, so is_valid_assignment
+    #   does not hold an assignment to them
+    breaks_symmetry = True
+
+    def __init__(self, variables, values):
+        self.variables = list(variables)
+        self.values = list(values)
+        self.position = {value: i for i, value in enumerate(self.values)}
+        # The compiled problem the masks were built for, and at_least[variable][j], the mask of the variable's
+        #   value indices whose position in the values list is j or later
+        self.compiled = None
+        self.at_least = dict()
+
+    # Returns the constraint over the variables numbered as in number (old variable --> new variable), keeping
+    #   only the ones that are there. Variables that share no constraints can rename their values separately,
+    #   so this still breaks symmetry correctly within a part of the problem
+    def renumbered(self, number):
+        return ValuePrecedenceConstraint([number[variable] for variable in self.variables if variable in number],
+                                         self.values)
+
+    # Returns False if an assigned value comes before any variable could have used the value preceding it
+    # Unassigned variables count as using whichever value would help, so partial assignments can pass
+    def is_satisfied(self, assignment):
+        highest = -1
+        for variable in self.variables:
+            if highest + 1 >= len(self.values):
+                return True
+            if assignment[variable] is None:
+                highest += 1
+                continue
+            position = self.position.get(assignment[variable])
+            if position is None:
+                continue
+            if position > highest + 1:
+                return False
+            highest = max(highest, position)
+        return True
+
+    # Prunes every value that comes more than one past the highest value the earlier variables could have
+    #   used. Assigned variables count as having only their assigned value
+    # Returns False if some variable is left with nothing, or its assigned value comes too early
+    def propagate(self, assignment, domains):
+        compiled = domains.compiled
+        if compiled is not self.compiled:
+            self.compile(compiled)
+
+        # The highest position of a value that some variable so far could have taken
+        highest = -1
+        for variable in self.variables:
+            # Once every value is within reach, nothing later can be pruned
+            if highest + 1 >= len(self.values):
+                return True
+            masks = self.at_least[variable]
+
+            if assignment[variable] is not None:
+                position = self.position.get(assignment[variable])
+                if position is None:
+                    continue
+                if position > highest + 1:
+                    return False
+                highest = max(highest, position)
+                continue
+
+            domains.remove_mask(variable, masks[highest + 2])
+            mask = domains.masks[variable]
+            if mask == 0:
+                return False
+            # Only the one value past the highest so far can raise it
+            if mask & masks[highest + 1] & ~masks[highest + 2]:
+                highest += 1
+
+        return True
+
+    # Builds the masks of every variable against the compiled value indices
+    def compile(self, compiled):
+        self.at_least = dict()
+        for variable in self.variables:
+            bits = [0 for i in range(len(self.values) + 1)]
+            for value, position in self.position.items():
+                i = compiled.value_index[variable].get(value)
+                if i is not None:
+                    bits[position] = 1 << i
+            # at_least[j] is the union of bits[j:], so one mask removes every value past a position
+            masks = [0 for i in range(len(self.values) + 2)]
+            for position in range(len(self.values) - 1, -1, -1):
+                masks[position] = masks[position + 1] | bits[position]
+            self.at_least[variable] = masks
+        self.compiled = compiled
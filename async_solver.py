@@ -0,0 +1,48 @@
+import asyncio
+from SearchBudget import SearchBudget
+from portfolio_solver import solve_configuration
+
+
+# Solving from asyncio code, like a service that answers many requests at once: each solve runs in a thread
+#   of an executor, so the event loop keeps serving other requests while it searches, and cancelling the
+#   awaiting task stops the solve at its next search node (see SearchBudget)
+# The solvers keep their state on the problem (statistics, compiled domains, weights), so solves that run at
+#   the same time need their own problem objects
+# Threads share the interpreter, so this multiplexes solves rather than running them in parallel. For that,
+#   see portfolio_solver and decomposition_solver, which use processes
+
+
+# Solves the problem with one configuration (see portfolio_solver) in the executor, or in the event loop's
+#   default executor if none is given, and returns the result of solve_configuration
+# The solve stops after time_limit seconds or node_limit nodes, counted from when it starts running rather
+#   than from when it was queued; its result then holds the best assignment seen instead of a solution
+# progress(report) is called on the event loop every progress_interval seconds while the solve runs
+async def solve_async(problem, configuration, seed=0, time_limit=None, node_limit=None, progress=None,
+                      progress_interval=1.0, executor=None):
+    loop = asyncio.get_running_loop()
+
+    # The solve reports from its own thread, so hand the progress over to the event loop
+    def forward_progress(report):
+        loop.call_soon_threadsafe(progress, report)
+
+    report_progress = None
+    if progress is not None:
+        report_progress = forward_progress
+
+    budget = SearchBudget(time_limit, node_limit, report_progress, progress_interval)
+    solve = loop.run_in_executor(executor, solve_configuration, problem, configuration, seed, budget)
+    try:
+        # Shielded, so cancelling the task does not abandon a thread that is still using the problem
+        return await asyncio.shield(solve)
+    except asyncio.CancelledError:
+        budget.cancel()
+        # The solve stops at its next node, after which the problem can be used again
+        await asyncio.wait([solve])
+        raise
+
+
+# Solves every problem with its configuration at the same time, and returns their results in order
+# Each entry of requests is a (problem, configuration) pair; the keyword arguments go to every solve_async
+async def solve_all_async(requests, **options):
+    return await asyncio.gather(*(solve_async(problem, configuration, **options)
+                                  for problem, configuration in requests))
@@ -0,0 +1,286 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime
+from CircuitBoardProblem import CircuitBoardProblem
+from NQueensProblem import NQueensProblem
+from MapColoringProblem import MapColoringProblem
+from CompiledCache import CompiledCache
+from portfolio_solver import DEFAULT_CONFIGURATIONS, next_result, solve_configuration
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# Runs every benchmark instance against every solver configuration, several seeded times each, and records
+#   the wall time, construction time, search calls and peak memory of every run as JSON
+# Every run happens in a freshly spawned process, so a hopeless run can be cut off and a run's peak memory is
+#   its own: a forked process would start out holding everything the parent had loaded, which would change
+#   from run to run
+# Construction time is the problem's constructor; compiling to bitsets happens on the first solve, so it
+#   is part of the wall time
+# Given a saved baseline, the medians are compared against it and regressions are flagged
+#   python benchmark_suite.py --output results.json
+#   python benchmark_suite.py --instances queens --repeats 5 --baseline results.json
+# With --cache, compiled problems are kept in that directory between runs (see CompiledCache), so every
+#   run after the first measures a warm start
+
+MAPS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maps")
+
+CIRCUIT_COMPONENTS_SMALL = [(3, 2), (5, 2), (2, 3), (7, 1)]
+CIRCUIT_COMPONENTS_MEDIUM = [(5, 5), (3, 3), (2, 2), (1, 4), (4, 1), (2, 2), (1, 4), (4, 1), (6, 1), (4, 2)]
+# 4x the small test with an additional 2x2 component
+CIRCUIT_COMPONENTS_BIG = CIRCUIT_COMPONENTS_SMALL * 4 + [(2, 2)]
+
+
+# Returns the benchmark instances by name, with how to build each one
+# Every configuration runs on every instance. One that cannot finish an instance is cut off by the timeout,
+#   and recorded as timed out, so a baseline shows when it starts (or stops) finishing
+def benchmark_instances():
+    instances = {
+        "circuit_small": {"build": (CircuitBoardProblem, (10, 3, CIRCUIT_COMPONENTS_SMALL))},
+        "circuit_medium": {"build": (CircuitBoardProblem, (15, 5, CIRCUIT_COMPONENTS_MEDIUM))},
+        "circuit_big": {"build": (CircuitBoardProblem, (20, 6, CIRCUIT_COMPONENTS_BIG))},
+        "queens_8": {"build": (NQueensProblem, (8,))},
+        # Enumeration and proof workloads are where symmetry breaking pays off, so the same boards run with it
+        "queens_8_symmetry": {"build": (NQueensProblem, (8, False, True))},
+        "queens_16": {"build": (NQueensProblem, (16,))},
+        "queens_32": {"build": (NQueensProblem, (32,))},
+        "queens_64": {"build": (NQueensProblem, (64,))},
+    }
+
+    # Every map file, with three colors and (to benchmark proving there is no solution) two
+    if os.path.isdir(MAPS_DIRECTORY):
+        for map_name in sorted(os.listdir(MAPS_DIRECTORY)):
+            if map_name.startswith("."):
+                continue
+            map_file = os.path.join(MAPS_DIRECTORY, map_name)
+            for num_colors in (3, 2):
+                instances[f"map_{map_name}_{num_colors}"] = {"build": (MapColoringProblem, (map_file, num_colors))}
+                instances[f"map_{map_name}_{num_colors}_symmetry"] = {
+                    "build": (MapColoringProblem, (map_file, num_colors, False, True))}
+
+    return instances
+
+
+# Builds and solves one instance with one configuration, inside its own process
+# Always reports back through the queue, even if the run raised
+def run_benchmark(instance, configuration, seed, results, cache_directory=None):
+    try:
+        problem_class, arguments = instance["build"]
+        start = time.perf_counter()
+        problem = problem_class(*arguments)
+        construction_time = time.perf_counter() - start
+        if cache_directory is not None:
+            problem.compiled_cache = CompiledCache(cache_directory)
+
+        result = solve_configuration(problem, configuration, seed)
+        assignment = result.pop("assignment")
+        result["construction_time"] = construction_time
+        result["wall_time"] = result.pop("solve_time")
+        result["solved"] = assignment is not None
+        result["valid"] = assignment is None or problem.is_valid_assignment(assignment)
+    except Exception as error:
+        result = {"error": repr(error)}
+
+    result["peak_memory"] = peak_memory()
+    results.put(result)
+
+
+# The peak resident memory of this process in bytes, or None where the platform does not report it
+# On Linux this is the high water mark of the process's own memory (VmHWM), which starts over when a spawned
+#   process runs the new interpreter. ru_maxrss does not: it keeps the peak of the process it was forked from
+def peak_memory():
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Runs one benchmark in a freshly spawned process and waits for it, for at most timeout seconds
+# Spawning takes longer than forking, but that happens before the run starts measuring
+def run_isolated(instance, configuration, seed, timeout, cache_directory=None):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    worker = context.Process(target=run_benchmark, args=(instance, configuration, seed, results, cache_directory),
+                             daemon=True)
+    worker.start()
+    result = next_result(results, {"worker": worker}, time.perf_counter() + timeout)
+    if result is None:
+        if worker.exitcode is None:
+            result = {"timed_out": True}
+            worker.terminate()
+        else:
+            result = {"error": f"the benchmark process exited with code {worker.exitcode} without reporting"}
+    worker.join()
+    result["seed"] = seed
+    return result
+
+
+# Runs the selected instances and configurations, repeats times each, and returns the results by
+#   instance and configuration, with every run and the medians of its measurements
+# Instances and configurations are selected by name prefix; None selects all of them
+def run_suite(instance_names=None, configuration_names=None, repeats=3, seed=0, timeout=60, verbose=True,
+              cache_directory=None):
+    instances = benchmark_instances()
+    results = dict()
+
+    for instance_name, instance in instances.items():
+        if not matches(instance_name, instance_names):
+            continue
+        results[instance_name] = dict()
+
+        for configuration in DEFAULT_CONFIGURATIONS:
+            if not matches(configuration["name"], configuration_names):
+                continue
+
+            runs = []
+            for repeat in range(repeats):
+                runs.append(run_isolated(instance, configuration, seed + repeat, timeout, cache_directory))
+                # Once one run times out, the rest would too
+                if runs[-1].get("timed_out"):
+                    break
+
+            summary = {"runs": runs, "median": median_measurements(runs)}
+            results[instance_name][configuration["name"]] = summary
+            if verbose:
+                print(format_summary(instance_name, configuration["name"], summary))
+
+    return results
+
+
+def matches(name, prefixes):
+    return prefixes is None or any(name.startswith(prefix) for prefix in prefixes)
+
+
+# Returns the median of each measurement over the runs, or None for all of them if any run failed
+def median_measurements(runs):
+    measurements = ["wall_time", "construction_time", "search_calls", "iterations", "peak_memory"]
+    if any("error" in run or run.get("timed_out") for run in runs):
+        return None
+
+    median = dict()
+    for measurement in measurements:
+        values = [run[measurement] for run in runs if run.get(measurement) is not None]
+        median[measurement] = statistics.median(values) if values else None
+    median["solved"] = sum(run["solved"] for run in runs)
+    median["valid"] = all(run["valid"] for run in runs)
+    return median
+
+
+def format_summary(instance_name, configuration_name, summary):
+    label = f"{instance_name:<24} {configuration_name:<18}"
+    median = summary["median"]
+    if median is None:
+        last_run = summary["runs"][-1]
+        return f"{label} {'timed out' if last_run.get('timed_out') else last_run.get('error')}"
+
+    line = (f"{label} wall {median['wall_time']:9.4f}s  construct {median['construction_time']:8.4f}s  "
+            f"solved {median['solved']}/{len(summary['runs'])}")
+    if median["search_calls"]:
+        line += f"  calls {median['search_calls']:g}"
+    if median["iterations"] is not None:
+        line += f"  iterations {median['iterations']:g}"
+    if median["peak_memory"] is not None:
+        line += f"  memory {median['peak_memory'] / 2 ** 20:.1f}MB"
+    if not median["valid"]:
+        line += "  INVALID ASSIGNMENT"
+    return line
+
+
+# Compares the medians against a baseline of earlier results
+# A measurement regresses when it grew by more than the threshold fraction; wall times also have to grow by
+#   at least min_time seconds, so tiny runs do not flag on timer noise
+# Returns a list of descriptions of every regression
+def compare_to_baseline(results, baseline, threshold=0.25, min_time=0.01):
+    regressions = []
+    for instance_name, configurations in results.items():
+        for configuration_name, summary in configurations.items():
+            old_summary = baseline.get(instance_name, {}).get(configuration_name)
+            if old_summary is None:
+                continue
+
+            label = f"{instance_name} {configuration_name}"
+            old, new = old_summary["median"], summary["median"]
+            if new is None:
+                if old is not None:
+                    regressions.append(f"{label}: no longer finishes")
+                continue
+            if old is None:
+                continue
+
+            if not new["valid"]:
+                regressions.append(f"{label}: returned an invalid assignment")
+            # Compared as fractions, since the two may have been run a different number of times
+            new_runs, old_runs = len(summary["runs"]), len(old_summary["runs"])
+            if new["solved"] * old_runs < old["solved"] * new_runs:
+                regressions.append(f"{label}: solved {new['solved']}/{new_runs} runs, "
+                                   f"baseline {old['solved']}/{old_runs}")
+
+            for measurement in ["wall_time", "construction_time", "search_calls", "iterations", "peak_memory"]:
+                if old.get(measurement) is None or new.get(measurement) is None:
+                    continue
+                if new[measurement] <= old[measurement] * (1 + threshold):
+                    continue
+                if measurement.endswith("_time") and new[measurement] - old[measurement] < min_time:
+                    continue
+                regressions.append(f"{label}: {measurement} {old[measurement]:g} --> {new[measurement]:g}")
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSP solvers and check for regressions")
+    parser.add_argument("--instances", nargs="*", help="instance name prefixes to run (default: all)")
+    parser.add_argument("--configurations", nargs="*", help="configuration name prefixes to run (default: all)")
+    parser.add_argument("--repeats", type=int, default=3, help="seeded runs per instance and configuration")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first run")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a run is cut off")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--cache", help="directory to keep compiled problems in between runs")
+    parser.add_argument("--threshold", type=float, default=0.25, help="fractional growth counted as a regression")
+    arguments = parser.parse_args()
+
+    results = run_suite(arguments.instances, arguments.configurations, arguments.repeats, arguments.seed,
+                        arguments.timeout, cache_directory=arguments.cache)
+
+    if arguments.output:
+        document = {"metadata": {"date": datetime.now().isoformat(), "python": platform.python_version(),
+                                 "platform": platform.platform(), "repeats": arguments.repeats,
+                                 "seed": arguments.seed},
+                    "results": results}
+        with open(arguments.output, "w") as output_file:
+            json.dump(document, output_file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare_to_baseline(results, baseline, arguments.threshold)
+        print("----------------")
+        if regressions:
+            print(f"{len(regressions)} regressions against {arguments.baseline}:")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+        print(f"No regressions against {arguments.baseline}")
+
+
+if __name__ == "__main__":
+    main()
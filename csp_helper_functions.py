@@ -1,11 +1,13 @@
 from math import inf
+import random
 # Author: Ben Williams
 # Date: October 12th, 2023
 
 
 # Returns the index of a currently unassigned variable, or None if they are all filled
-def first_unassigned_variable(assignment):
-    for i in range(len(assignment)):
+# The search can start later in the assignment if every variable before start is known to be assigned
+def first_unassigned_variable(assignment, start=0):
+    for i in range(start, len(assignment)):
         if assignment[i] is None:
             return i
     return None
@@ -39,3 +41,45 @@ def add_to_domains(add_lists, domains):
     for i in range(len(add_lists)):
         for addition in add_lists[i]:
             domains[i].append(addition)
+
+
+# Yields the index of every set bit in the mask, from lowest to highest
+# Used to walk the values of a bitmask domain without converting it to a list first
+def mask_indices(mask):
+    while mask:
+        lowest_bit = mask & -mask
+        yield lowest_bit.bit_length() - 1
+        mask ^= lowest_bit
+
+
+# Same as minimum_remaining_values, but ties are broken uniformly at random instead of by lowest index
+# Gives every restart of a randomized search a different path through the same problem
+# Draws from the given random.Random, or from the random module's shared one if none is given
+def randomized_minimum_remaining_values(assignment, domains, rng=random):
+    min_available_size = inf
+    tied = []
+    for i in range(len(assignment)):
+        if assignment[i] is None:
+            size = len(domains[i])
+            if size < min_available_size:
+                min_available_size = size
+                tied = [i]
+            elif size == min_available_size:
+                tied.append(i)
+
+    return rng.choice(tied) if tied else None
+
+
+# The i-th term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8, ...
+# Used as restart cutoffs, it is within a log factor of the best fixed cutoff without knowing what that is
+def luby(i):
+    # The smallest 2^k - 1 that is at least i: the term is 2^(k-1) if i is exactly that, and otherwise
+    #   the sequence repeats itself, so i is moved back into the shorter block that repeats
+    size = 1
+    while size < i:
+        size = 2 * size + 1
+    while size > 1 and i != size:
+        size //= 2
+        if i > size:
+            i -= size
+    return (size + 1) // 2
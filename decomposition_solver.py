@@ -0,0 +1,153 @@
+import time
+from SearchStatistics import SearchStatistics
+from portfolio_solver import next_result, solve_configuration, worker_context
+
+
+# Variables that share no constraints (like an island on a map) can be solved on their own, so a failure in
+#   one part never makes the search redo another. The problem is split into the connected components of its
+#   constraint graph, each one is solved as its own subproblem, and the answers are put back together
+# Components whose constraints form a tree are solved by the linear-time tree solver
+
+# The configuration (see portfolio_solver) used for components that are not trees
+DEFAULT_COMPONENT_CONFIGURATION = {"name": "MAC2001+MRV", "solver": "backtracking", "inference": "MAC2001",
+                                   "select_variable": "minimum_remaining_values"}
+TREE_CONFIGURATION = {"name": "tree", "solver": "tree"}
+
+
+# Returns the connected components of the problem as lists of variables, smallest first
+# Variables in the same global constraint count as connected, except for symmetry breaking constraints,
+#   which are split up along with the problem (see subproblem)
+def split_components(problem):
+    groups = [constraint.variables for constraint in problem.global_constraints
+              if not getattr(constraint, "breaks_symmetry", False)]
+    components = problem.constraint_graph.connected_components(groups)
+    components.sort(key=len)
+    return components
+
+
+# Returns True if the subproblem can go to the tree solver: its constraints form a tree and there are no
+#   global constraints that it would have to leave out
+def is_tree(subproblem):
+    if any(not getattr(constraint, "breaks_symmetry", False) for constraint in subproblem.global_constraints):
+        return False
+    num_edges = sum(subproblem.constraint_graph.degree(variable) for variable in subproblem.variables) // 2
+    return num_edges == len(subproblem.variables) - 1
+
+
+# Solves every component of the problem with the configuration and merges the answers into one assignment
+# Components are solved smallest first, and the first one without a solution ends the solve, since then the
+#   whole problem has none. With processes greater than 1, that many components are solved at once, each in
+#   its own process
+# Returns the assignment (or None) and a report of the components and what solving them cost. The combined
+#   statistics of every component are also left in problem.statistics
+def solve_components(problem, configuration=None, processes=1, use_tree_solver=True, seed=0):
+    if configuration is None:
+        configuration = DEFAULT_COMPONENT_CONFIGURATION
+
+    start = time.perf_counter()
+    components = split_components(problem)
+    report = {"components": len(components), "largest_component": max(map(len, components), default=0),
+              "tree_components": 0, "search_calls": 0}
+
+    # Every component as (variables, subproblem, configuration)
+    work = []
+    for variables in components:
+        subproblem = problem.subproblem(variables)
+        component_configuration = configuration
+        if use_tree_solver and is_tree(subproblem):
+            component_configuration = TREE_CONFIGURATION
+            report["tree_components"] += 1
+        work.append((variables, subproblem, component_configuration))
+
+    if processes > 1:
+        results = solve_in_parallel(work, processes, seed)
+    else:
+        results = solve_in_order(work, seed)
+
+    assignment = [None for i in range(len(problem.variables))]
+    statistics = SearchStatistics()
+    solved = True
+    for (variables, subproblem, component_configuration), result in zip(work, results):
+        # Components left unsolved because another had no solution
+        if result is None:
+            solved = False
+            continue
+        statistics.add(SearchStatistics.from_dict(result["statistics"]))
+        report["search_calls"] += result["search_calls"]
+        if result["assignment"] is None:
+            solved = False
+            continue
+        for i, variable in enumerate(variables):
+            assignment[variable] = result["assignment"][i]
+
+    # The wall time of the whole solve, which is less than the sum of the components' when they ran in parallel
+    statistics.solve_time = time.perf_counter() - start
+    problem.statistics = statistics
+    report["solve_time"] = statistics.solve_time
+    report["statistics"] = statistics.as_dict()
+    return (assignment if solved else None), report
+
+
+# Solves the components one after another, stopping at the first one without a solution
+# Returns the result of every component, with None for the ones that were never solved
+def solve_in_order(work, seed):
+    results = [None for i in range(len(work))]
+    for position, (variables, subproblem, configuration) in enumerate(work):
+        results[position] = solve_configuration(subproblem, configuration, seed)
+        if results[position]["assignment"] is None:
+            break
+    return results
+
+
+# Splits the components between that many processes, which each solve theirs smallest first, and stops
+#   them all as soon as one component has no solution
+# Components are handed out in batches rather than one process each, since most are usually tiny
+# Returns the result of every component, with None for the ones that were cancelled or never started
+# Raises RuntimeError if a process died before reporting all of its components, since the answer would
+#   otherwise look like a component without a solution
+def solve_in_parallel(work, processes, seed):
+    context = worker_context()
+    results = context.Queue()
+    finished = [None for i in range(len(work))]
+    # First component of the batch --> the process solving it
+    running = dict()
+
+    try:
+        for first in range(min(processes, len(work))):
+            # Every processes-th component, so each batch gets a share of the large ones
+            batch = [(position, work[position][1], work[position][2])
+                     for position in range(first, len(work), processes)]
+            worker = context.Process(target=run_components, args=(batch, seed, results), daemon=True)
+            worker.start()
+            running[first] = worker
+
+        for unused in range(len(work)):
+            reported = next_result(results, running)
+            if reported is None:
+                raise RuntimeError("a component worker process died without reporting its results")
+            position, result = reported
+            finished[position] = result
+            if result["assignment"] is None:
+                break
+    finally:
+        for worker in running.values():
+            worker.terminate()
+        for worker in running.values():
+            worker.join()
+
+    return finished
+
+
+# The work done inside one process: solves its batch of (position, subproblem, configuration) in order and
+#   reports each result, stopping after one without a solution
+# A worker always reports back, even if its solver raised, so the caller never waits on a dead worker
+def run_components(batch, seed, results):
+    for position, subproblem, configuration in batch:
+        try:
+            result = solve_configuration(subproblem, configuration, seed)
+        except Exception as error:
+            result = {"configuration": configuration["name"], "seed": seed, "assignment": None,
+                      "error": repr(error), "search_calls": 0, "statistics": SearchStatistics().as_dict()}
+        results.put((position, result))
+        if result["assignment"] is None:
+            return
@@ -0,0 +1,141 @@
+import time
+from SearchStatistics import SearchStatistics
+from decomposition_solver import DEFAULT_COMPONENT_CONFIGURATION
+from portfolio_solver import solve_configuration
+
+
+# Solving a problem again after a small change (see ConstraintSatisfactionProblem.add_constraint and
+#   add_variable, or CircuitBoardProblem.add_component and MapColoringProblem.add_border), starting from the
+#   solution it had before instead of from nothing
+# The problem records which variables the changes touched. Only those can be in conflict now, so only they
+#   and the variables around them are searched again, as a subproblem whose domains only hold the values
+#   that fit the rest of the old solution. If that region cannot be solved, it is made bigger and tried again,
+#   so the work done grows with the size of the change rather than the size of the problem
+
+
+# Solves the problem again after the changes made to it since the last resolve (or since it was built),
+#   where previous is its complete solution from before those changes
+# The region searched first is every changed variable whose value no longer fits, and everything within
+#   radius constraints of one. Each retry doubles the radius, and once the region stops growing the last
+#   try frees every variable, so a None result means the changed problem has no solution
+# The configuration (see portfolio_solver) solves each region. With local search, None only means that it
+#   gave up
+# Returns the assignment (or None) and a report of the change and what repairing it cost. The combined
+#   statistics of every try are also left in problem.statistics
+def resolve(problem, previous, configuration=None, radius=1, seed=0):
+    if configuration is None:
+        configuration = DEFAULT_COMPONENT_CONFIGURATION
+
+    start = time.perf_counter()
+    assignment = carry_over(problem, previous)
+    broken = broken_variables(problem, assignment, sorted(problem.changed_variables))
+    report = {"changed_variables": len(problem.changed_variables), "broken_variables": len(broken), "tries": 0,
+              "region": 0, "search_calls": 0}
+    problem.changed_variables.clear()
+    problem.change_log.clear()
+
+    statistics = SearchStatistics()
+    previous_size = None
+    while broken:
+        region = region_around(problem, broken, radius)
+        # Nothing more around the broken variables to free, so free everything
+        if len(region) == previous_size:
+            region = list(range(len(problem.variables)))
+        previous_size = len(region)
+
+        report["tries"] += 1
+        report["region"] = len(region)
+        result = solve_region(problem, assignment, region, configuration, seed)
+        statistics.add(SearchStatistics.from_dict(result["statistics"]))
+        report["search_calls"] += result["search_calls"]
+
+        if result["assignment"] is not None:
+            for i, variable in enumerate(region):
+                assignment[variable] = result["assignment"][i]
+            if satisfies_global_constraints(problem, assignment):
+                break
+        if len(region) == len(problem.variables):
+            assignment = None
+            break
+        radius *= 2
+
+    statistics.solve_time = time.perf_counter() - start
+    problem.statistics = statistics
+    report["solve_time"] = statistics.solve_time
+    report["statistics"] = statistics.as_dict()
+    return assignment, report
+
+
+# Returns a copy of the old assignment with the variables added and removed since then (see change_log)
+#   added and removed the same way, so every value is back with its variable. Added variables are None
+def carry_over(problem, previous):
+    assignment = list(previous)
+    for change, variable in problem.change_log:
+        if change == "add":
+            assignment.append(None)
+        else:
+            # The last variable took the removed one's number
+            last_value = assignment.pop()
+            if variable < len(assignment):
+                assignment[variable] = last_value
+    return assignment
+
+
+# Returns the variables, out of the given ones, that have no value, a value no longer in their domain, or a
+#   value that conflicts with an assigned neighbor
+def broken_variables(problem, assignment, variables):
+    value_index = problem.compile().value_index
+    broken = []
+    for variable in variables:
+        value = assignment[variable]
+        if value is None or value not in value_index[variable] or \
+                not problem.is_consistent_value(variable, value, assignment):
+            broken.append(variable)
+    return broken
+
+
+# Returns the variables at most radius constraints away from one of the seeds, in increasing order
+def region_around(problem, seeds, radius):
+    neighbors = problem.constraint_graph.neighbors
+    distance = {variable: 0 for variable in seeds}
+    frontier = list(seeds)
+    for step in range(radius):
+        next_frontier = []
+        for variable in frontier:
+            for other in neighbors[variable]:
+                if other not in distance:
+                    distance[other] = step + 1
+                    next_frontier.append(other)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    return sorted(distance)
+
+
+# Searches the region again with every variable outside it keeping its value in the assignment
+# Each region variable only keeps the values its assigned neighbors outside the region allow, so the
+#   subproblem needs nothing but the constraints inside the region. Symmetry breaking constraints are left
+#   out, since they would rule out repairs that only differ from the old solution by a renaming
+# Returns the result of solve_configuration on the region
+def solve_region(problem, assignment, region, configuration, seed):
+    compiled = problem.compile()
+    in_region = set(region)
+    domains = []
+    for variable in region:
+        mask = compiled.full_masks[variable]
+        for other in compiled.neighbors[variable]:
+            if other not in in_region and assignment[other] is not None:
+                mask &= compiled.supports[(other, variable)][compiled.value_index[other][assignment[other]]]
+        domains.append(compiled.mask_to_values(variable, mask))
+
+    subproblem = problem.subproblem(region, domains)
+    subproblem.global_constraints = [constraint for constraint in subproblem.global_constraints
+                                     if not getattr(constraint, "breaks_symmetry", False)]
+    return solve_configuration(subproblem, configuration, seed)
+
+
+# Returns True if the assignment satisfies every global constraint that is not symmetry breaking, including
+#   the parts of them that a region left out
+def satisfies_global_constraints(problem, assignment):
+    return all(constraint.is_satisfied(assignment) for constraint in problem.global_constraints
+               if not getattr(constraint, "breaks_symmetry", False))
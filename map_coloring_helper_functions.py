@@ -1,55 +1,128 @@
+import hashlib
+import mmap
+import os
+import re
+from array import array
+from AdjacencyArrays import AdjacencyArrays
+
 # Author: Ben Williams '25
 # Date: October 8th, 2023
 
+# How much of a file is parsed at once by the streaming loaders
+CHUNK_SIZE = 1 << 24
+
+# Any line of a DIMACS graph file other than an edge line "e <vertex> <vertex>"
+DIMACS_OTHER_LINE = re.compile(rb"^(?!e\s).*(?:\n|$)", re.MULTILINE)
+# The problem line of a DIMACS graph file: "p edge <vertices> <edges>" (some files say "col")
+DIMACS_PROBLEM = re.compile(rb"^p\s+\w+\s+(\d+)\s+(\d+)", re.MULTILINE)
+
+
 # Goes through a map file and returns a list of states and neighbors
 #   in the format of a CSP
 # Parameter: file_name - String of the location of the map file
 def parse_map_file(file_name):
-    f = open(file_name, "r")
-    variables = []
-    neighbors = []
+    graph = load_graph(file_name)
+    variables = [i for i in range(len(graph))]
+    neighbors = [list(graph.neighbors(variable)) for variable in variables]
+    return variables, neighbors
+
+
+# Returns the SHA-256 hex digest of the file's contents, read in chunks
+def file_digest(file_name):
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        chunk = f.read(CHUNK_SIZE)
+        while chunk:
+            digest.update(chunk)
+            chunk = f.read(CHUNK_SIZE)
+    return digest.hexdigest()
+
+
+# Loads a map file or a DIMACS .col graph file into compact AdjacencyArrays
+# DIMACS files are recognized by their extension or by starting with a "c" or "p" line
+def load_graph(file_name):
+    if os.path.splitext(file_name)[1].lower() in (".col", ".dimacs"):
+        return load_dimacs_file(file_name)
+
+    with open(file_name, "rb") as f:
+        first_line = f.readline().lstrip()
+    if first_line.startswith(b"p ") or first_line.startswith(b"c ") or first_line == b"c\n":
+        return load_dimacs_file(file_name)
+    return load_adjacency_file(file_name)
+
+
+# Yields the file's contents in pieces of about CHUNK_SIZE bytes that end on a line break, read through a
+#   memory map so the whole file is never held in memory at once
+def read_line_chunks(file_name):
+    with open(file_name, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < len(mapped):
+                end = mapped.find(b"\n", min(start + CHUNK_SIZE, len(mapped)) - 1)
+                end = len(mapped) if end == -1 else end + 1
+                yield mapped[start:end]
+                start = end
+
+
+# Loads a DIMACS graph file: an optional "p edge <vertices> <edges>" line and one "e <u> <v>" line per edge,
+#   with vertices numbered from 1. Comment lines ("c ...") and anything else are ignored
+def load_dimacs_file(file_name):
+    num_vertices = 0
+    sources = array("q")
+    targets = array("q")
+    for chunk in read_line_chunks(file_name):
+        problem = DIMACS_PROBLEM.search(chunk)
+        if problem:
+            num_vertices = max(num_vertices, int(problem.group(1)))
+
+        # Edge lines are "e <u> <v>", so once every other line is cut out, the chunk splits into a flat list
+        #   whose every third word is a source and the one after it a target
+        words = DIMACS_OTHER_LINE.sub(b"", chunk).split()
+        sources.extend(map(int, words[1::3]))
+        targets.extend(map(int, words[2::3]))
+
+    # Vertices are numbered from 1 in the file
+    if sources:
+        num_vertices = max(num_vertices, max(sources), max(targets))
+    sources = array("q", map((-1).__add__, sources))
+    targets = array("q", map((-1).__add__, targets))
+    return AdjacencyArrays.from_edge_arrays(num_vertices, sources, targets)
+
+
+# Loads a map file with one "Region; Neighbor, Neighbor" line per region (just "Region;" if it has none)
+# Regions are numbered in the order they first appear, and every border counts in both directions
+def load_adjacency_file(file_name):
+    names = []
     name_index_map = dict()
+    sources = array("q")
+    targets = array("q")
+    for chunk in read_line_chunks(file_name):
+        for line in chunk.decode().splitlines():
+            node_and_neighbors = line.strip().split("; ")
+            if not node_and_neighbors[0]:
+                continue
 
-    # Read file line by line and parse the map info until we reach the end
-    line = f.readline()
-    while line:
-        line = line.strip()
-        node_and_neighbors = line.split("; ")
-
-        # Isolated node - Need to adjust string to remove ";"
-        if len(node_and_neighbors) == 1:
-            node_and_neighbors[0] = node_and_neighbors[0].strip(";")
-
-        # Check if we have seen this node as a neighbor of another node
-        if node_and_neighbors[0] not in name_index_map.keys():
-            # We will refer to this province as an integer
-            variables.append(len(variables))
-            # Need to subtract 1 to adjust for the longer list after appending
-            name_index_map[node_and_neighbors[0]] = len(variables) - 1
-            neighbors.append([])
-
-        # Isolated node - we are finished here
-        if len(node_and_neighbors) == 1:
-            line = f.readline()
-            continue
-
-        # Loop through and handle all the neighbors
-        neighbor_variables = node_and_neighbors[1].split(", ")
-        for neighbor in neighbor_variables:
-            # If we haven't seen this variable before
-            if neighbor not in name_index_map.keys():
-                variables.append(len(variables))
-                name_index_map[neighbor] = len(variables) - 1
-                neighbors.append([])
-
-            # Add this neighbor to the list of neighbors for the variable's index
-            neighbors[name_index_map[node_and_neighbors[0]]].append(name_index_map[neighbor])
-
-        # Continue onto the next line
-        line = f.readline()
-
-    f.close()
-    return variables, neighbors
+            # Isolated node - Need to adjust string to remove ";"
+            node_and_neighbors[0] = node_and_neighbors[0].rstrip(";")
+            region = name_index_map.get(node_and_neighbors[0])
+            if region is None:
+                region = name_index_map[node_and_neighbors[0]] = len(names)
+                names.append(node_and_neighbors[0])
+
+            if len(node_and_neighbors) == 1:
+                continue
+
+            for neighbor_name in node_and_neighbors[1].split(", "):
+                neighbor = name_index_map.get(neighbor_name)
+                if neighbor is None:
+                    neighbor = name_index_map[neighbor_name] = len(names)
+                    names.append(neighbor_name)
+                sources.append(region)
+                targets.append(neighbor)
+
+    return AdjacencyArrays.from_edge_arrays(len(names), sources, targets, names)
 
 
 # Takes the domain and adds all possible non-overlapping pairs into the list
@@ -62,4 +135,26 @@ def all_pair_tuples(given_set, domain):
                 given_set.add((i, j))
 
 
+# Returns a list of cliques (as sorted lists) of at least min_size regions of the graph that all border each other
+# Each clique is grown greedily from one bordering pair, so not every clique is found, but every
+#   pair that is part of a triangle ends up in at least one clique
+# Only the neighbors of the region being grown from are held as a set; the other borders are checked by
+#   binary search in the graph's arrays
+def find_cliques(graph, min_size=3):
+    cliques = set()
+    for variable in range(len(graph)):
+        variable_neighbors = set(graph.neighbors(variable))
+        for neighbor in variable_neighbors:
+            if neighbor < variable:
+                continue
+
+            clique = [variable, neighbor]
+            candidates = variable_neighbors.intersection(graph.neighbors(neighbor))
+            for candidate in sorted(candidates):
+                if all(graph.has_edge(member, candidate) for member in clique[2:]):
+                    clique.append(candidate)
+
+            if len(clique) >= min_size:
+                cliques.add(tuple(sorted(clique)))
 
+    return [list(clique) for clique in sorted(cliques)]
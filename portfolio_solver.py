@@ -0,0 +1,245 @@
+import multiprocessing
+import queue
+import random
+import time
+import csp_helper_functions
+from ConstraintSatisfactionProblem import SearchLimitReached
+
+
+# The solver configurations tried by default
+# Hooks are given by name so that a configuration can be sent to another process: inference and
+#   order_domain are looked up on the problem, and select_variable on the problem or in csp_helper_functions
+# Randomized configurations are run once for each seed
+DEFAULT_CONFIGURATIONS = [
+    {"name": "backtracking", "solver": "backtracking"},
+    {"name": "MAC3+MRV", "solver": "backtracking", "inference": "MAC3",
+     "select_variable": "minimum_remaining_values"},
+    {"name": "MAC3+MRV+LCV", "solver": "backtracking", "inference": "MAC3",
+     "select_variable": "minimum_remaining_values", "order_domain": "least_constraining_value"},
+    {"name": "MAC2001+MRV", "solver": "backtracking", "inference": "MAC2001",
+     "select_variable": "minimum_remaining_values"},
+    {"name": "MAC2001+MRV+LCV", "solver": "backtracking", "inference": "MAC2001",
+     "select_variable": "minimum_remaining_values", "order_domain": "least_constraining_value"},
+    {"name": "MAC3+MRV+CBJ", "solver": "backjumping", "inference": "MAC3",
+     "select_variable": "minimum_remaining_values", "nogood_cache_size": 1000},
+    {"name": "MAC2001+dom/wdeg+restarts", "solver": "restarts", "inference": "MAC2001",
+     "select_variable": "domain_over_weighted_degree", "restart_policy": "luby", "randomized": True},
+    {"name": "local_search", "solver": "local_search", "max_iters": 100000, "use_visited": True,
+     "randomized": True},
+]
+
+# How often a wait for worker results stops to check that the workers are still alive, in seconds
+LIVENESS_INTERVAL = 0.1
+
+
+# Runs several solver configurations on the problem at the same time, one process each, and returns
+#   the first valid assignment found. The remaining workers are terminated as soon as one succeeds, or as
+#   soon as a complete configuration (any but local search) finishes without a solution, since then there is
+#   none to find
+# Randomized configurations (like local search) are started once for each of the given seeds
+# By default every run gets its own process right away, so a hopeless configuration never holds up the rest
+# Returns the assignment (or None) and a report of which configuration won and what it cost
+def portfolio_solve(problem, configurations=None, seeds=(0, 1, 2, 3), max_workers=None, timeout=None):
+    if configurations is None:
+        configurations = DEFAULT_CONFIGURATIONS
+
+    # Every (configuration, seed) pair that should be run
+    pending = []
+    for configuration in configurations:
+        if configuration.get("randomized", configuration["solver"] == "local_search"):
+            for seed in seeds:
+                pending.append((configuration, seed))
+        else:
+            pending.append((configuration, seeds[0] if seeds else 0))
+    pending.reverse()
+
+    if max_workers is None:
+        max_workers = len(pending)
+
+    # Compile once here so that forked workers inherit it instead of each building their own
+    if any(configuration["solver"] != "local_search" for configuration, seed in pending):
+        problem.compile()
+
+    context = worker_context()
+    results = context.Queue()
+    running = dict()
+    start = time.perf_counter()
+    deadline = None if timeout is None else start + timeout
+    report = {"configuration": None, "seed": None, "workers_started": 0, "workers_finished": 0,
+              "workers_lost": 0, "unsatisfiable": False}
+
+    try:
+        while pending or running:
+            # Keep every worker slot busy
+            while pending and len(running) < max_workers:
+                configuration, seed = pending.pop()
+                worker = context.Process(target=run_configuration, args=(problem, configuration, seed, results),
+                                         daemon=True)
+                worker.start()
+                running[(configuration["name"], seed)] = worker
+                report["workers_started"] += 1
+
+            result = next_result(results, running, deadline, report)
+            if result is None:
+                # Out of time, or the workers died
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                continue
+
+            worker = running.pop((result["configuration"], result["seed"]), None)
+            if worker is not None:
+                worker.join()
+            report["workers_finished"] += 1
+
+            # The first worker to find a valid assignment wins
+            assignment = result["assignment"]
+            if assignment is not None and problem.is_valid_assignment(assignment):
+                report.update(result)
+                report["wall_time"] = time.perf_counter() - start
+                return assignment, report
+
+            # A complete search that ran to the end without one proves there is no solution
+            if assignment is None and "error" not in result and is_complete(result["configuration"],
+                                                                              configurations):
+                report.update(result)
+                report["unsatisfiable"] = True
+                break
+    finally:
+        # Cancel everyone still working
+        for worker in running.values():
+            worker.terminate()
+        for worker in running.values():
+            worker.join()
+
+    report["wall_time"] = time.perf_counter() - start
+    return None, report
+
+
+# Returns True if the configuration with the given name searches exhaustively, so finishing without a
+#   solution means there is none. Only local search can give up early
+def is_complete(name, configurations):
+    return any(configuration["name"] == name and configuration["solver"] != "local_search"
+               for configuration in configurations)
+
+
+# The multiprocessing context workers are started from
+# Workers are forked where the platform can, so they inherit the problem (and its compiled form) instead of
+#   having it pickled over and compiled again. Elsewhere they are spawned, and the problem is pickled, which
+#   every problem class supports
+def worker_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+
+# Waits for the next result the workers put on the queue, until the deadline (a time.perf_counter() time, or
+#   None to wait for as long as any worker runs)
+# A worker that dies without reporting (killed by the system, or crashed inside C code) would otherwise be
+#   waited on forever, so the workers in running (key --> process) are checked every LIVENESS_INTERVAL.
+#   Whatever a worker puts on the queue is sent before it exits, so one that has exited while the queue is
+#   empty has nothing more to say: it is removed from running, and counted as lost in the report
+# Returns the result, or None once the deadline passes or no worker is left running
+def next_result(results, running, deadline=None, report=None):
+    while running:
+        wait = LIVENESS_INTERVAL
+        if deadline is not None:
+            wait = min(wait, deadline - time.perf_counter())
+            if wait <= 0:
+                return None
+        try:
+            return results.get(timeout=wait)
+        except queue.Empty:
+            pass
+
+        exited = [key for key, worker in running.items() if worker.exitcode is not None]
+        if exited and results.empty():
+            for key in exited:
+                running.pop(key).join()
+                if report is not None:
+                    report["workers_lost"] += 1
+    return None
+
+
+# The work done inside one process: resolve the hooks by name, solve, and report back through the queue
+# A worker always reports back, even if its solver raised, so the portfolio never waits on a dead worker
+def run_configuration(problem, configuration, seed, results):
+    try:
+        result = solve_configuration(problem, configuration, seed)
+    except Exception as error:
+        result = {"configuration": configuration["name"], "seed": seed, "assignment": None, "error": repr(error)}
+    results.put(result)
+
+
+# Solves the problem with a single configuration and returns what it found and what it cost
+# With a SearchBudget, the solve stops once the budget is used up (or cancelled) instead of running to the
+#   end. The result then also says why it stopped, and holds the best assignment seen and the number of arcs
+#   it violates (see SearchBudget.best_result), which is the solution itself when one was found
+def solve_configuration(problem, configuration, seed, budget=None):
+    start = time.perf_counter()
+    problem.get_and_reset_search_calls()
+
+    # The solve draws from its own generator, so it is repeatable for the seed even while other solves run in
+    #   the same process (see async_solver), and never moves the random module's state
+    previous_budget, previous_random = problem.budget, problem.random
+    problem.random = random.Random(seed)
+    if budget is not None:
+        problem.budget = budget
+        if budget.start_time is None:
+            budget.start()
+    try:
+        assignment, iterations = run_solver(problem, configuration)
+    except SearchLimitReached:
+        if budget is None or budget.stop_reason is None:
+            raise
+        assignment, iterations = None, problem.statistics.iterations or None
+        problem.statistics.solve_time = time.perf_counter() - start
+    finally:
+        problem.budget = previous_budget
+        problem.random = previous_random
+
+    result = {"configuration": configuration["name"], "seed": seed, "assignment": assignment,
+              "search_calls": problem.get_and_reset_search_calls(), "iterations": iterations,
+              "solve_time": time.perf_counter() - start, "statistics": problem.statistics.as_dict()}
+    if budget is not None:
+        if assignment is not None:
+            budget.offer_complete(assignment, 0)
+        result["stopped"] = budget.stop_reason
+        result["best_assignment"], result["best_conflicts"] = budget.best_result(problem)
+    return result
+
+
+# Runs the solver the configuration names, and returns the assignment (or None) and the local search
+#   iterations (None for the other solvers)
+def run_solver(problem, configuration):
+    if configuration["solver"] == "local_search":
+        return problem.local_search(configuration.get("max_iters", 100000), configuration.get("use_visited", False),
+                                    tabu_tenure=configuration.get("tabu_tenure", 10),
+                                    plateau_limit=configuration.get("plateau_limit"))
+
+    inference = None
+    select_variable = None
+    order_domain = None
+    if configuration.get("inference"):
+        inference = getattr(problem, configuration["inference"])
+    if configuration.get("select_variable"):
+        select_variable = getattr(problem, configuration["select_variable"], None)
+        if select_variable is None:
+            select_variable = getattr(csp_helper_functions, configuration["select_variable"])
+    if configuration.get("order_domain"):
+        order_domain = getattr(problem, configuration["order_domain"])
+
+    if configuration["solver"] == "tree":
+        assignment = problem.tree_solver()
+    elif configuration["solver"] == "cycle_cutset":
+        assignment = problem.cycle_cutset_solver()
+    elif configuration["solver"] == "backjumping":
+        assignment = problem.backjumping_solver(inference, select_variable, order_domain,
+                                                configuration.get("nogood_cache_size", 0))
+    elif configuration["solver"] == "restarts":
+        assignment = problem.restarting_solver(inference, select_variable, order_domain,
+                                               configuration.get("restart_policy", "luby"),
+                                               configuration.get("restart_base", 100))
+    else:
+        # The iterative engine, so deep problems do not hit the recursion limit in the worker
+        assignment = problem.iterative_backtracking_solver(inference, select_variable, order_domain)
+    return assignment, None
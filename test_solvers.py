@@ -0,0 +1,165 @@
+import itertools
+import os
+import random
+from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
+from CircuitBoardProblem import CircuitBoardProblem
+from MapColoringProblem import MapColoringProblem
+from NQueensProblem import NQueensProblem
+from csp_helper_functions import minimum_remaining_values
+from portfolio_solver import DEFAULT_CONFIGURATIONS, portfolio_solve, solve_configuration
+
+# Checks that every solver gets the right answers: known solution counts, and a brute force cross-check of
+#   every solver and heuristic on small random problems
+#   python -m pytest -q test_solvers.py   (or python test_solvers.py)
+
+AUSTRALIA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maps", "Australia")
+
+
+# A random binary CSP over num_variables variables with domain_size values each: every pair of variables is
+#   constrained with the given probability, and allows each pair of values with probability tightness
+def random_problem(seed, num_variables=7, domain_size=3, density=0.4, tightness=0.65):
+    rng = random.Random(seed)
+    constraints = dict()
+    for var_1 in range(num_variables):
+        for var_2 in range(var_1 + 1, num_variables):
+            if rng.random() < density:
+                allowed_pairs = {(value_1, value_2) for value_1 in range(domain_size)
+                                 for value_2 in range(domain_size) if rng.random() < tightness}
+                constraints[(var_1, var_2)] = allowed_pairs
+                constraints[(var_2, var_1)] = {(value_2, value_1) for value_1, value_2 in allowed_pairs}
+    return ConstraintSatisfactionProblem(list(range(num_variables)),
+                                         [list(range(domain_size)) for i in range(num_variables)], constraints)
+
+
+# Every solution of the problem, found by trying every assignment
+def brute_force_solutions(problem):
+    return {assignment for assignment in itertools.product(*problem.domains)
+            if problem.is_valid_assignment(list(assignment))}
+
+
+# Every combination of inference, variable selection and value ordering, by name
+def complete_solvers():
+    solvers = []
+    for inference in (None, "MAC3", "MAC2001"):
+        for select_variable in (None, "MRV"):
+            for order_domain in (None, "least_constraining_value"):
+                solvers.append((inference, select_variable, order_domain))
+    return solvers
+
+
+# The solver hooks of the problem that the names stand for
+def hooks(problem, inference, select_variable, order_domain):
+    return (None if inference is None else getattr(problem, inference),
+            None if select_variable is None else minimum_remaining_values,
+            None if order_domain is None else getattr(problem, order_domain))
+
+
+def test_random_problems_match_brute_force():
+    for seed in range(40):
+        # Looser and tighter problems, so that some have no solution
+        problem = random_problem(seed, tightness=0.65 if seed % 2 else 0.5)
+        solutions = brute_force_solutions(problem)
+
+        for names in complete_solvers():
+            inference, select_variable, order_domain = hooks(problem, *names)
+            label = (seed,) + names
+
+            found = {tuple(assignment) for assignment in problem.iterate_solutions(inference, select_variable,
+                                                                                  order_domain)}
+            assert found == solutions, label
+            assert problem.count_solutions(inference, select_variable, order_domain) == len(solutions), label
+
+            results = [problem.backtracking_solver(inference=inference, select_variable=select_variable,
+                                                   order_domain=order_domain),
+                       problem.iterative_backtracking_solver(inference, select_variable, order_domain),
+                       problem.restarting_solver(inference, select_variable, order_domain, restart_base=2),
+                       problem.backjumping_solver(inference, select_variable, order_domain),
+                       problem.backjumping_solver(inference, select_variable, order_domain, nogood_cache_size=5)]
+            for result in results:
+                if solutions:
+                    assert result is not None and tuple(result) in solutions, label
+                else:
+                    assert result is None, label
+
+        result = problem.cycle_cutset_solver()
+        if solutions:
+            assert result is not None and tuple(result) in solutions, seed
+        else:
+            assert result is None, seed
+
+
+def test_local_search_only_returns_solutions():
+    for seed in range(20):
+        problem = random_problem(seed, tightness=0.8)
+        problem.random = random.Random(seed)
+        solutions = brute_force_solutions(problem)
+        assignment, iterations = problem.local_search(2000, use_visited=seed % 2 == 0)
+        if assignment is not None:
+            assert tuple(assignment) in solutions, seed
+
+
+def test_queens_solution_counts():
+    for num_queens, num_solutions in ((4, 2), (6, 4), (8, 92)):
+        problem = NQueensProblem(num_queens)
+        assert problem.count_solutions(problem.MAC2001, minimum_remaining_values) == num_solutions
+        assert problem.count_solutions() == num_solutions
+
+    # Symmetry breaking keeps one solution out of every class of symmetric ones
+    problem = NQueensProblem(8, False, True)
+    assert problem.count_solutions(problem.MAC2001) == 12
+
+
+def test_solution_limit():
+    problem = NQueensProblem(8)
+    assert problem.count_solutions(limit=0) == 0
+    assert list(problem.iterate_solutions(limit=0)) == []
+    assert problem.count_solutions(limit=5) == 5
+
+    solutions = list(problem.iterate_solutions(limit=1))
+    first_nodes = problem.statistics.nodes
+    problem.iterative_backtracking_solver()
+    assert len(solutions) == 1 and first_nodes == problem.statistics.nodes
+
+
+def test_australia_coloring():
+    problem = MapColoringProblem(AUSTRALIA, 3)
+    assert problem.count_solutions() == 18
+    assert problem.count_solutions(problem.MAC2001, minimum_remaining_values) == 18
+    assert problem.is_valid_assignment(problem.backtracking_solver(inference=problem.MAC3))
+
+    assert MapColoringProblem(AUSTRALIA, 2).count_solutions() == 0
+    # The all-different constraints see that a triangle of regions needs three colors before anything is assigned
+    problem = MapColoringProblem(AUSTRALIA, 2, True)
+    assert problem.backtracking_solver(inference=problem.MAC2001) is None
+    assert problem.statistics.nodes == 0
+
+
+def test_circuit_boards():
+    small = CircuitBoardProblem(10, 3, [(3, 2), (5, 2), (2, 3), (7, 1)])
+    for names in complete_solvers():
+        inference, select_variable, order_domain = hooks(small, *names)
+        assignment = small.backtracking_solver(inference=inference, select_variable=select_variable,
+                                               order_domain=order_domain)
+        assert small.is_valid_assignment(assignment), names
+
+    # The big board takes least-constraining-value ordering
+    big = CircuitBoardProblem(20, 6, [(3, 2), (5, 2), (2, 3), (7, 1)] * 4 + [(2, 2)])
+    for configuration in DEFAULT_CONFIGURATIONS:
+        if configuration["name"] in ("MAC3+MRV+LCV", "MAC2001+MRV+LCV"):
+            assignment = solve_configuration(big, configuration, 0)["assignment"]
+            assert big.is_valid_assignment(assignment), configuration["name"]
+
+
+def test_portfolio():
+    assignment, report = portfolio_solve(MapColoringProblem(AUSTRALIA, 3), timeout=60)
+    assert assignment is not None and report["configuration"] is not None
+
+    assignment, report = portfolio_solve(MapColoringProblem(AUSTRALIA, 2), timeout=60)
+    assert assignment is None and report["unsatisfiable"]
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(name, "passed")